@@ -1,5 +1,9 @@
+from collections import Counter, defaultdict
+
 from django.contrib import admin
-from .models import Post, Category, Tag
+from django.db import transaction
+from .cache import invalidate_post_listings
+from .models import AuthorStats, Post, Category, Tag
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
@@ -7,9 +11,26 @@ class PostAdmin(admin.ModelAdmin):
     list_filter = ['status', 'category', 'created_at']
     search_fields = ['title', 'text']
     actions = ['publish_selected', 'unpublish_selected']
+
+    def set_status(self, queryset, status):
+        # Фильтры списка (например, ?status__exact=draft) после update() уже не
+        # найдут изменённые посты, поэтому запоминаем их id заранее
+        posts = Post.objects.filter(pk__in=list(queryset.values_list('pk', flat=True)))
+        # update() не отправляет сигналы: статистику авторов меняем сами, на вклад
+        # постов, у которых статус действительно меняется
+        sign = 1 if status == 'published' else -1
+        changes = defaultdict(Counter)
+        with transaction.atomic():
+            for values in posts.exclude(status=status).select_for_update().values(
+                    'author_id', *AuthorStats.POST_COUNTERS):
+                changes[values.pop('author_id')].update(AuthorStats.post_totals(values, sign))
+            updated = posts.update(status=status)
+            AuthorStats.objects.add(changes)
+        invalidate_post_listings(posts)
+        return updated
     
     def publish_selected(self, request, queryset):
-        updated = queryset.update(status='published')
+        updated = self.set_status(queryset, 'published')
         self.message_user(
             request, 
             f'{updated} пост(ов) успешно опубликовано!',
@@ -19,7 +40,7 @@ class PostAdmin(admin.ModelAdmin):
     publish_selected.short_description = "Опубликовать выбранные посты"
     
     def unpublish_selected(self, request, queryset):
-        updated = queryset.update(status='draft')
+        updated = self.set_status(queryset, 'draft')
         self.message_user(
             request, 
             f'{updated} пост(ов) снято с публикации!',
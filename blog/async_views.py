@@ -0,0 +1,208 @@
+"""
+Асинхронные версии JSON-эндпоинтов для запуска под ASGI (config/asgi.py).
+
+Чтения идут через асинхронный ORM, изменения - через функции interactions.py
+в sync_to_async, потому что транзакции в Django пока только синхронные.
+Ответы совпадают с синхронными представлениями из views.py.
+"""
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse, StreamingHttpResponse
+from django.shortcuts import aget_object_or_404
+from django.views import View
+
+from . import events
+from .comments import LATEST_ROOT_COMMENTS, build_comment_tree, comment_data, serialize_comment_tree, thread_replies
+from .interactions import (
+    apply_reactions, create_comment, delete_comment, parse_reaction_operations, reaction_state, toggle_favorite,
+    toggle_reaction,
+)
+from .models import Comment, Post, COMMENT_MAX_LEVEL
+
+
+class AsyncLoginRequiredMixin:
+    """Пользователь загружается через request.auser(); анонимам - JSON 401 вместо редиректа"""
+
+    async def dispatch(self, request, *args, **kwargs):
+        user = await request.auser()
+        if not user.is_authenticated:
+            return JsonResponse({'status': 'error', 'message': 'Требуется авторизация'}, status=401)
+        # Дальше request.user читается без обращения к БД
+        request.user = user
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class AsyncLikeDislikePostView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, post_id):
+        post = await aget_object_or_404(Post, id=post_id)
+        action = request.POST.get('action')
+        if action not in ('like', 'dislike'):
+            return JsonResponse({'status': 'error', 'message': 'Invalid action'}, status=400)
+        action_taken = await sync_to_async(toggle_reaction)(post, request.user, action)
+        return JsonResponse({
+            'status': 'success',
+            'action': action_taken,
+            'like_count': post.like_count,
+            'dislike_count': post.dislike_count,
+        })
+
+
+class AsyncPostFavoriteToggleView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, post_id):
+        post = await aget_object_or_404(Post, id=post_id)
+        action_taken = await sync_to_async(toggle_favorite)(post, request.user)
+        return JsonResponse({
+            'status': 'success',
+            'action': action_taken,
+            'favorites_count': post.favorites_count,
+        })
+
+
+class AsyncReactionBatchView(AsyncLoginRequiredMixin, View):
+    max_operations = 100
+
+    async def post(self, request):
+        try:
+            operations = parse_reaction_operations(json.loads(request.body), self.max_operations)
+            results = await sync_to_async(apply_reactions)(request.user, operations)
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+        return JsonResponse({
+            'status': 'success',
+            'posts': {post_id: reaction_state(kinds, counters) for post_id, (kinds, counters) in results.items()},
+        })
+
+
+class AsyncCommentCreateView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, post_id):
+        post = await aget_object_or_404(Post, id=post_id)
+        text = request.POST.get('text')
+        parent_id = request.POST.get('parent_id')
+
+        if not text:
+            return JsonResponse({'status': 'error', 'message': 'Комментарий не может быть пустым'}, status=400)
+
+        parent_comment = None
+        if parent_id:
+            try:
+                parent_comment = await Comment.objects.aget(id=parent_id, post=post)
+            except (Comment.DoesNotExist, ValueError):
+                return JsonResponse({'status': 'error', 'message': 'Родительский комментарий не найден'}, status=400)
+            if parent_comment.level >= COMMENT_MAX_LEVEL:  # новый комментарий будет level + 1
+                return JsonResponse({
+                    'status': 'error',
+                    'message': 'Достигнут максимальный уровень вложенности комментариев (7)'
+                }, status=400)
+
+        try:
+            comment = await sync_to_async(create_comment)(post, request.user, text, parent_comment)
+        except ValueError as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+        return JsonResponse({
+            'status': 'success',
+            'comment': {
+                **comment_data(comment, request.user),
+                'parent_id': parent_comment.id if parent_comment else None,
+                'replies': [],
+            }
+        })
+
+
+class AsyncCommentUpdateView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, comment_id):
+        comment = await aget_object_or_404(Comment, id=comment_id)
+        if comment.author_id != request.user.pk:
+            return JsonResponse({'status': 'error', 'message': 'Вы не можете редактировать этот комментарий'}, status=403)
+        text = request.POST.get('text')
+        if not text or not text.strip():
+            return JsonResponse({'status': 'error', 'message': 'Комментарий не может быть пустым'}, status=400)
+        comment.text = text.strip()
+        comment.is_edited = True
+        await comment.asave()
+        return JsonResponse({
+            'status': 'success',
+            'comment': {
+                'id': comment.id,
+                'text': comment.text,
+                'author': request.user.username,
+                'created_at': comment.created_at.strftime('%Y-%m-%d %H:%M:%S'),
+                'is_edited': comment.is_edited
+            }
+        })
+
+
+class AsyncCommentDeleteView(AsyncLoginRequiredMixin, View):
+    async def post(self, request, comment_id):
+        comment = await aget_object_or_404(Comment.objects.select_related('post'), id=comment_id)
+        if comment.author_id != request.user.pk:
+            return JsonResponse({'status': 'error', 'message': 'Вы не можете удалить этот комментарий'}, status=403)
+        await sync_to_async(delete_comment)(comment)
+        return JsonResponse({'status': 'success', 'comment_id': comment_id})
+
+
+class AsyncMoreCommentsView(View):
+    async def get(self, request, post_slug):
+        post = await aget_object_or_404(Post, slug=post_slug)
+        try:
+            offset = int(request.GET.get('offset', 0))
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Некорректный offset'}, status=400)
+        limit = 5
+        user = await request.auser()
+
+        all_root_comments = post.comments.roots().select_related('author').order_by('created_at', 'id')
+        roots = [comment async for comment in all_root_comments[offset:offset + limit]]
+        replies = [comment async for comment in thread_replies(post, roots)]
+        comments_data = serialize_comment_tree(build_comment_tree(roots, replies), user)
+
+        total_older_comments = await all_root_comments.acount() - LATEST_ROOT_COMMENTS
+        return JsonResponse({
+            'status': 'success',
+            'comments': comments_data,
+            'has_more': (offset + limit) < total_older_comments,
+            'next_offset': offset + limit,
+            'older_comments_count': total_older_comments - (offset + limit)
+        })
+
+
+class PostEventsView(View):
+    """
+    Поток Server-Sent Events страницы поста: comment_created, comment_updated,
+    comment_deleted и counters. Держит соединение до MAX_DURATION секунд,
+    после чего браузер переподключается с Last-Event-ID.
+    """
+    async def get(self, request, post_slug):
+        post = await aget_object_or_404(Post.objects.only('pk'), slug=post_slug)
+        backend = events.get_backend()
+        try:
+            last_id = int(request.headers.get('Last-Event-ID', ''))
+        except ValueError:
+            # Новое подключение: только события, случившиеся после загрузки страницы
+            last_id = await sync_to_async(backend.last_id, thread_sensitive=False)(post.pk)
+        response = StreamingHttpResponse(self.stream(backend, post.pk, last_id), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'  # nginx не должен буферизовать поток
+        return response
+
+    async def stream(self, backend, post_id, last_id):
+        loop = asyncio.get_running_loop()
+        heartbeat = events.get_setting('HEARTBEAT')
+        deadline = loop.time() + events.get_setting('MAX_DURATION')
+        last_sent = loop.time()
+        yield 'retry: 3000\n\n'
+        while loop.time() < deadline:
+            new_events = await backend.aevents_since(post_id, last_id)
+            for event_id, event, data in new_events:
+                last_id = event_id
+                yield events.format_event(event_id, event, data)
+            if new_events:
+                last_sent = loop.time()
+            elif loop.time() - last_sent >= heartbeat:
+                yield ': ping\n\n'
+                last_sent = loop.time()
+            # Ждём публикации, но не дольше следующего пинга и конца соединения
+            timeout = min(deadline, last_sent + heartbeat) - loop.time()
+            if timeout > 0:
+                await backend.wait(post_id, last_id, timeout)
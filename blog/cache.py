@@ -0,0 +1,85 @@
+"""
+Версионные ключи кэша.
+
+Вместо поиска и удаления устаревших записей меняется версия: ключи
+закэшированных фрагментов и страниц включают её, поэтому после bump_version
+старые записи просто перестают читаться и вытесняются по таймауту.
+"""
+import hashlib
+import time
+
+from django.core.cache import cache
+
+
+def _version_key(name):
+    return f'blog:version:{name}'
+
+
+def get_version(name):
+    version = cache.get(_version_key(name))
+    if version is None:
+        # Начальное значение от времени: если ключ версии был вытеснен,
+        # новые ключи не совпадут со старыми закэшированными записями
+        cache.add(_version_key(name), time.time_ns(), None)
+        version = cache.get(_version_key(name), time.time_ns())
+    return version
+
+
+def bump_version(name):
+    try:
+        return cache.incr(_version_key(name))
+    except ValueError:
+        version = time.time_ns()
+        cache.set(_version_key(name), version, None)
+        return version
+
+
+def comments_version_name(post_id):
+    return f'comments:{post_id}'
+
+
+# Страницы списков: главная, категории и теги
+MAIN_LISTING = 'listing:main'
+
+
+def category_listing_name(slug):
+    return f'listing:category:{slug}'
+
+
+def tag_listing_name(slug):
+    return f'listing:tag:{slug}'
+
+
+def listing_etag(request, scopes):
+    """
+    ETag страницы списка: версии областей, пользователь и путь с параметрами.
+    Личные отметки в HTML не попадают (их подставляет скрипт из PostStateView),
+    от пользователя зависит только шапка страницы.
+    """
+    parts = [str(get_version(scope)) for scope in scopes]
+    if request.user.is_authenticated:
+        parts.append(f'u{request.user.pk}')
+    parts.append(request.get_full_path())
+    return '"%s"' % hashlib.md5('|'.join(parts).encode()).hexdigest()
+
+
+def page_cache_key(request, scopes):
+    """Ключ страницы: версии всех её областей и полный путь с параметрами запроса"""
+    versions = ':'.join(str(get_version(scope)) for scope in scopes)
+    path = hashlib.md5(request.get_full_path().encode()).hexdigest()
+    return f'blog:page:{versions}:{path}'
+
+
+def bump_listing_versions(category_slugs=(), tag_slugs=()):
+    bump_version(MAIN_LISTING)
+    for slug in set(category_slugs) - {None}:
+        bump_version(category_listing_name(slug))
+    for slug in set(tag_slugs) - {None}:
+        bump_version(tag_listing_name(slug))
+
+
+def invalidate_post_listings(posts):
+    """Сбрасывает кэш всех списков, где показаны посты из queryset"""
+    category_slugs = posts.values_list('category__slug', flat=True).distinct()
+    tag_slugs = posts.values_list('tags__slug', flat=True).distinct()
+    bump_listing_versions(category_slugs, tag_slugs)
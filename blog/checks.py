@@ -0,0 +1,20 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Версии кэша сбрасываются только в общем кэше: локальный виден одному процессу"""
+    if settings.CACHES['default']['BACKEND'] in LOCAL_CACHES:
+        return [Warning(
+            'Кэш по умолчанию локален для процесса: при нескольких воркерах списки и карточки '
+            'останутся устаревшими после изменений.',
+            hint='Задайте BLOG_REDIS_URL или другой общий бэкенд в CACHES.',
+            id='blog.W001',
+        )]
+    return []
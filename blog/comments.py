@@ -0,0 +1,113 @@
+"""Сборка дерева комментариев в памяти и кэш блока комментариев"""
+import logging
+
+from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.safestring import mark_safe
+
+from .cache import comments_version_name, get_version
+from .metrics import cache_access
+from .models import Comment
+
+logger = logging.getLogger(__name__)
+
+# Сколько последних корневых комментариев показывается на странице поста
+LATEST_ROOT_COMMENTS = 5
+
+
+class CommentNode:
+    __slots__ = ('comment', 'replies')
+
+    def __init__(self, comment):
+        self.comment = comment
+        self.replies = []
+
+
+def build_comment_tree(roots, descendants):
+    """
+    Связывает корневые комментарии и их потомков в дерево CommentNode по parent_id.
+    Узлы создаются до связывания, поэтому ответ может идти раньше родителя (например,
+    импортированный с более ранней датой); порядок ответов - порядок descendants.
+    """
+    nodes = {}
+    tree = []
+    for root in roots:
+        nodes[root.pk] = CommentNode(root)
+        tree.append(nodes[root.pk])
+    descendants = list(descendants)
+    for comment in descendants:
+        nodes[comment.pk] = CommentNode(comment)
+    orphans = []
+    for comment in descendants:
+        parent = nodes.get(comment.parent_id)
+        if parent is None:
+            orphans.append(comment.pk)
+        else:
+            parent.replies.append(nodes[comment.pk])
+    if orphans:
+        logger.warning('Комментарии без родителя в загруженных ветках: %s', orphans)
+    return tree
+
+
+def thread_replies(post, roots):
+    """Ответы всех веток перечисленных корневых комментариев в порядке создания"""
+    return (
+        Comment.objects.filter(post=post).threads(roots)
+        .select_related('author').order_by('created_at', 'id')
+    )
+
+
+def load_comment_tree(post, roots):
+    """Дерево для страницы корневых комментариев: ответы всех веток - одним запросом"""
+    roots = list(roots)
+    return build_comment_tree(roots, thread_replies(post, roots))
+
+
+def comment_data(comment, user, date_format='%d.%m.%Y %H:%M'):
+    return {
+        'id': comment.id,
+        'text': comment.text,
+        'author': comment.author.username,
+        'created_at': comment.created_at.strftime(date_format),
+        'is_edited': comment.is_edited,
+        'is_author': user.is_authenticated and comment.author_id == user.pk,
+        'can_quote': user.is_authenticated,
+        'level': comment.level,
+    }
+
+
+def serialize_comment_tree(nodes, user):
+    """Данные для JSON-ответов; все комментарии уже загружены, запросов к БД нет"""
+    return [
+        {**comment_data(node.comment, user), 'replies': serialize_comment_tree(node.replies, user)}
+        for node in nodes
+    ]
+
+
+def comment_section(post):
+    """
+    Блок комментариев страницы поста. HTML не зависит от читателя (кнопки автора
+    включает скрипт), поэтому кэшируется один на пост до следующего изменения комментариев.
+    """
+    key = f'blog:comment-section:{post.pk}:{get_version(comments_version_name(post.pk))}'
+    section = cache.get(key)
+    cache_access('comment_section', section is not None)
+    if section is None:
+        # Корневые комментарии отсортированные от старых к новым
+        all_root_comments = post.comments.roots().select_related('author').order_by('created_at', 'id')
+        root_count = all_root_comments.count()
+        # Показываем последние 5 комментариев (пропускаем старые)
+        latest_comments = list(all_root_comments[max(root_count - LATEST_ROOT_COMMENTS, 0):])
+        context = {
+            'comments': load_comment_tree(post, latest_comments),
+            'has_older_comments': root_count > LATEST_ROOT_COMMENTS,
+            'older_comments_count': root_count - len(latest_comments),
+        }
+        section = {
+            'html': render_to_string('blog/includes/comment_section_include.html', context),
+            'loaded_comments_count': len(latest_comments),
+            'older_comments_count': context['older_comments_count'],
+        }
+        cache.set(key, section, settings.BLOG_COMMENTS_CACHE_TIMEOUT)
+    return {**section, 'html': mark_safe(section['html'])}
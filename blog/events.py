@@ -0,0 +1,159 @@
+"""
+События страницы поста для Server-Sent Events: новые, изменённые и удалённые
+комментарии и счётчики реакций.
+
+Публикация - publish() после коммита транзакции. Бэкенд хранит короткую
+историю событий каждого поста с возрастающими id; поток SSE (PostEventsView)
+забирает из неё всё, что новее последнего отправленного id, поэтому после
+переподключения браузер получает пропущенное по Last-Event-ID.
+Бэкенд выбирается настройкой BLOG_EVENTS['BACKEND']: InProcessBackend живёт в
+памяти процесса и будит ждущие потоки сразу при публикации, CacheBackend хранит
+историю в кэше Django и при общем кэше (Redis, memcached) работает между
+воркерами, но новые события находит опросом раз в POLL_INTERVAL.
+Поток SSE включается только вместе с BLOG_ASYNC_VIEWS (под ASGI).
+"""
+import asyncio
+import itertools
+import json
+import threading
+from collections import defaultdict, deque
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+DEFAULTS = {
+    'BACKEND': 'blog.events.InProcessBackend',
+    # Как часто поток проверяет новые события в CacheBackend, секунды
+    'POLL_INTERVAL': 0.5,
+    # Комментарий-пинг, чтобы прокси не закрывали тихое соединение
+    'HEARTBEAT': 15,
+    # Через сколько секунд поток закрывается; браузер сам переподключится
+    'MAX_DURATION': 300,
+    # Сколько последних событий поста хранить для переподключившихся
+    'HISTORY': 100,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'BLOG_EVENTS', {}).get(name, DEFAULTS[name])
+
+
+class BaseEventBackend:
+    def publish(self, post_id, event, data):
+        raise NotImplementedError
+
+    def events_since(self, post_id, last_id):
+        """Список (id, event, data) с id больше last_id, по возрастанию"""
+        raise NotImplementedError
+
+    def last_id(self, post_id):
+        raise NotImplementedError
+
+    async def aevents_since(self, post_id, last_id):
+        return await sync_to_async(self.events_since, thread_sensitive=False)(post_id, last_id)
+
+    async def wait(self, post_id, last_id, timeout):
+        """Ждёт событий новее last_id не дольше timeout секунд; по умолчанию - опрос"""
+        await asyncio.sleep(min(timeout, get_setting('POLL_INTERVAL')))
+
+
+class InProcessBackend(BaseEventBackend):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ids = itertools.count(1)
+        self.history = defaultdict(lambda: deque(maxlen=get_setting('HISTORY')))
+        # post_id -> {(цикл событий, asyncio.Event)} потоков, ждущих новых событий
+        self.waiters = defaultdict(set)
+
+    def publish(self, post_id, event, data):
+        with self.lock:
+            self.history[post_id].append((next(self.ids), event, data))
+            waiters = self.waiters.pop(post_id, ())
+        # publish вызывается из потоков воркеров: Event будим через его цикл событий
+        for loop, waiter in waiters:
+            try:
+                loop.call_soon_threadsafe(waiter.set)
+            except RuntimeError:
+                pass  # Цикл уже закрыт
+
+    async def aevents_since(self, post_id, last_id):
+        # Чтение из памяти под коротким блокировочным участком - без пула потоков
+        return self.events_since(post_id, last_id)
+
+    async def wait(self, post_id, last_id, timeout):
+        item = (asyncio.get_running_loop(), asyncio.Event())
+        with self.lock:
+            history = self.history.get(post_id)
+            if history and history[-1][0] > last_id:
+                return
+            self.waiters[post_id].add(item)
+        try:
+            await asyncio.wait_for(item[1].wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.lock:
+                waiters = self.waiters.get(post_id)
+                if waiters is not None:
+                    waiters.discard(item)
+                    if not waiters:
+                        del self.waiters[post_id]
+
+    def events_since(self, post_id, last_id):
+        with self.lock:
+            return [item for item in self.history.get(post_id, ()) if item[0] > last_id]
+
+    def last_id(self, post_id):
+        with self.lock:
+            history = self.history.get(post_id)
+            return history[-1][0] if history else 0
+
+
+class CacheBackend(BaseEventBackend):
+    timeout = 60 * 60
+
+    def counter_key(self, post_id):
+        return f'blog:events:{post_id}:last'
+
+    def event_key(self, post_id, event_id):
+        return f'blog:events:{post_id}:{event_id}'
+
+    def publish(self, post_id, event, data):
+        cache.add(self.counter_key(post_id), 0, None)
+        event_id = cache.incr(self.counter_key(post_id))
+        cache.set(self.event_key(post_id, event_id), (event, data), self.timeout)
+
+    def events_since(self, post_id, last_id):
+        current = self.last_id(post_id)
+        if current <= last_id:
+            return []
+        first = max(last_id + 1, current - get_setting('HISTORY') + 1)
+        keys = {self.event_key(post_id, event_id): event_id for event_id in range(first, current + 1)}
+        found = cache.get_many(list(keys))
+        return [(keys[key], *found[key]) for key in keys if key in found]
+
+    def last_id(self, post_id):
+        return cache.get(self.counter_key(post_id), 0)
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        _backend = import_string(get_setting('BACKEND'))()
+    return _backend
+
+
+def publish(post_id, event, data):
+    """Публикует событие после коммита текущей транзакции (или сразу, вне транзакции)"""
+    transaction.on_commit(lambda: get_backend().publish(post_id, event, data))
+
+
+def format_event(event_id, event, data):
+    payload = json.dumps(data, ensure_ascii=False, separators=(',', ':'))
+    return f'id: {event_id}\nevent: {event}\ndata: {payload}\n\n'
@@ -1,6 +1,8 @@
 from django import forms
 from django.core.exceptions import ValidationError
-from .models import Post, Tag
+from django.db import transaction
+from .models import Post
+from .tags import normalize_tag_name, set_post_tags
 
 class PostForm(forms.ModelForm):
     tags_input = forms.CharField(
@@ -56,7 +58,7 @@ class PostForm(forms.ModelForm):
             return []
         
         # Разделяем теги по запятой, очищаем от пробелов и приводим к нижнему регистру
-        tag_names = [name.strip().lower() for name in tags_input.split(',') if name.strip()]
+        tag_names = [normalize_tag_name(name) for name in tags_input.split(',') if name.strip()]
         
         # Удаляем дубликаты
         tag_names = list(dict.fromkeys(tag_names))
@@ -72,21 +74,11 @@ class PostForm(forms.ModelForm):
         instance = super().save(commit=False)
         
         if commit:
-            instance.save()
-            
-            # Очищаем текущие теги
-            instance.tags.clear()
-            
-            # Добавляем новые теги
-            tag_names = self.cleaned_data.get('tags_input', [])
-            for tag_name in tag_names:
-                tag, created = Tag.objects.get_or_create(
-                    name=tag_name,
-                    defaults={'name': tag_name}
-                )
-                instance.tags.add(tag)
-            
-            self.save_m2m()
+            with transaction.atomic():
+                instance.save()
+                # Меняем только разницу между текущими и новыми тегами
+                set_post_tags(instance, self.cleaned_data.get('tags_input', []))
+                self.save_m2m()
         
         return instance
     
@@ -0,0 +1,141 @@
+"""
+Уменьшенные копии изображений постов.
+
+После загрузки изображения (сигнал post_save, после коммита транзакции) пост
+ставится в очередь пула потоков. Обработчик нарезает варианты нужной ширины
+в WebP и JPEG и записывает их описание в Post.image_variants; шаблонный тег
+responsive_image (templatetags/post_images.py) строит по нему srcset.
+Описание привязано к имени исходного файла, поэтому после замены картинки
+старые варианты не показываются, пока не будут готовы новые.
+"""
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'WIDTHS': (160, 480, 960),
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    'WORKERS': 2,
+    # True - обрабатывать сразу в текущем потоке (тесты, команды)
+    'SYNC': False,
+}
+
+CONTENT_TYPES = {'webp': 'image/webp', 'jpeg': 'image/jpeg'}
+EXTENSIONS = {'webp': 'webp', 'jpeg': 'jpg'}
+
+
+def get_setting(name):
+    return getattr(settings, 'BLOG_IMAGE_VARIANTS', {}).get(name, DEFAULTS[name])
+
+
+def variants_are_current(post):
+    return bool(post.image) and post.image_variants.get('source') == post.image.name
+
+
+def variant_name(source, width, image_format):
+    stem = os.path.splitext(os.path.basename(source))[0]
+    return f'posts/variants/{stem}-{width}w.{EXTENSIONS[image_format]}'
+
+
+def render_variant(image, width, image_format):
+    height = round(image.height * width / image.width)
+    resized = image.resize((width, height), Image.Resampling.LANCZOS) if width < image.width else image
+    if image_format == 'jpeg' and resized.mode != 'RGB':
+        resized = resized.convert('RGB')
+    buffer = BytesIO()
+    resized.save(buffer, format=image_format.upper(), quality=get_setting('QUALITY'), optimize=True)
+    return height, buffer.getvalue()
+
+
+def delete_variants(metadata, storage=default_storage):
+    from .models import Post
+
+    # Одинаковые загрузки хранятся одним файлом (storage.py), варианты у них тоже общие
+    if not metadata.get('source') or Post.objects.filter(image=metadata['source']).exists():
+        return
+    for variant in metadata.get('variants', ()):
+        storage.delete(variant['name'])
+
+
+def generate_variants(post_id):
+    """Нарезает варианты изображения поста; возвращает их описание или None"""
+    from .cache import invalidate_post_listings
+    from .models import Post
+
+    post = Post.objects.filter(pk=post_id).only('id', 'image', 'image_variants', 'status').first()
+    if post is None or not post.image or variants_are_current(post):
+        return None
+    source = post.image.name
+    shared = (Post.objects.filter(image=source, image_variants__source=source)
+              .values_list('image_variants', flat=True).first())
+    if shared:
+        # Тот же файл уже обработан для другого поста
+        Post.objects.filter(pk=post_id, image=source).update(image_variants=shared)
+        return shared
+    with post.image.open('rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+
+    # Ширины больше исходной не нужны; совсем маленькая картинка даёт один вариант
+    widths = sorted({min(width, image.width) for width in get_setting('WIDTHS')})
+    variants = []
+    for image_format in get_setting('FORMATS'):
+        for width in widths:
+            height, content = render_variant(image, width, image_format)
+            name = variant_name(source, width, image_format)
+            default_storage.delete(name)
+            variants.append({
+                'format': image_format,
+                'width': width,
+                'height': height,
+                'name': default_storage.save(name, ContentFile(content)),
+            })
+
+    metadata = {'source': source, 'width': image.width, 'height': image.height, 'variants': variants}
+    # Картинку могли заменить, пока шла обработка: тогда результат не нужен
+    updated = Post.objects.filter(pk=post_id, image=source).update(image_variants=metadata)
+    if not updated:
+        delete_variants(metadata)
+        return None
+    if post.image_variants.get('source') != source:
+        delete_variants(post.image_variants)
+    if post.status == 'published':
+        invalidate_post_listings(Post.objects.filter(pk=post_id))
+    return metadata
+
+
+def _run(post_id):
+    try:
+        generate_variants(post_id)
+    except Exception:
+        logger.exception('Не удалось обработать изображение поста %s', post_id)
+    finally:
+        # Соединения рабочего потока не закрываются обработчиком запросов
+        connections.close_all()
+
+
+_executor = None
+
+
+def get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=get_setting('WORKERS'), thread_name_prefix='blog-images')
+    return _executor
+
+
+def schedule_variants(post_id):
+    if get_setting('SYNC'):
+        generate_variants(post_id)
+    else:
+        get_executor().submit(_run, post_id)
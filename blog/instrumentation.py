@@ -0,0 +1,178 @@
+"""
+Замеры запросов: число и время SQL, повторяющиеся запросы и общее время ответа.
+
+RequestInstrumentationMiddleware для выбранной доли запросов (SAMPLE_RATE)
+собирает статистику через execute_wrapper соединений БД. Текущий запрос
+хранится в ContextVar, поэтому запросы из sync_to_async-потоков асинхронных
+представлений тоже учитываются. Итог уходит в заголовок Server-Timing, а если
+запрос медленный, делает слишком много SQL или повторяет один и тот же запрос
+(похоже на N+1), - ещё и JSON-строкой в лог 'blog.instrumentation'.
+Время и число SQL всех запросов, не только выбранных, идут в метрики (blog/metrics.py).
+"""
+import json
+import logging
+import random
+import re
+import time
+from collections import Counter
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+from . import metrics
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    # Доля замеряемых запросов: 1.0 - все, 0 - выключено
+    'SAMPLE_RATE': 0.1,
+    # Пороги, после которых запрос пишется в лог
+    'SLOW_REQUEST_MS': 500,
+    'QUERY_COUNT_THRESHOLD': 50,
+    # Сколько одинаковых запросов считать признаком N+1
+    'DUPLICATE_THRESHOLD': 3,
+    'SERVER_TIMING': True,
+}
+
+_current = ContextVar('blog_request_stats', default=None)
+
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+_SELECT_LIST_RE = re.compile(r'^SELECT (?:DISTINCT )?.*? FROM ', re.DOTALL)
+
+
+def get_setting(name):
+    return getattr(settings, 'BLOG_INSTRUMENTATION', {}).get(name, DEFAULTS[name])
+
+
+def fingerprint(sql):
+    """SQL без значений и списка колонок: запросы, отличающиеся только параметрами, совпадают"""
+    sql = _SELECT_LIST_RE.sub('SELECT ... FROM ', sql, count=1)
+    return _NUMBER_RE.sub('?', _IN_LIST_RE.sub('IN (...)', sql))
+
+
+class RequestStats:
+    __slots__ = ('started', 'queries', 'sql_time', 'fingerprints')
+
+    def __init__(self, sampled):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.sql_time = 0.0
+        # Отпечатки SQL нужны только для подробного замера выбранных запросов
+        self.fingerprints = Counter() if sampled else None
+
+    def duplicates(self):
+        threshold = get_setting('DUPLICATE_THRESHOLD')
+        return [(sql, count) for sql, count in self.fingerprints.most_common() if count >= threshold]
+
+
+def query_wrapper(execute, sql, params, many, context):
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.sql_time += time.perf_counter() - start
+        stats.queries += 1
+        if stats.fingerprints is not None:
+            stats.fingerprints[fingerprint(sql)] += 1
+
+
+def install_query_wrapper(connection, **kwargs):
+    if query_wrapper not in connection.execute_wrappers:
+        # В начало списка: connection.execute_wrapper() снимает свою обёртку через pop()
+        # и при добавлении в конец во время запроса снял бы нашу вместо своей
+        connection.execute_wrappers.insert(0, query_wrapper)
+
+
+def install():
+    """Подключает обёртку ко всем соединениям: уже открытым и будущим (в любом потоке)"""
+    connection_created.connect(install_query_wrapper, dispatch_uid='blog_instrumentation')
+    for connection in connections.all(initialized_only=True):
+        install_query_wrapper(connection)
+
+
+class RequestInstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+        install()
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        stats = self.start()
+        if stats is None:
+            return self.get_response(request)
+        token = _current.set(stats)
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    async def __acall__(self, request):
+        stats = self.start()
+        if stats is None:
+            return await self.get_response(request)
+        token = _current.set(stats)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, stats)
+
+    def start(self):
+        # Без метрик незамеряемые запросы не платят ничего, кроме одного random()
+        sampled = random.random() < get_setting('SAMPLE_RATE')
+        if not sampled and not metrics.enabled():
+            return None
+        # Обёртка ставится и на соединения этого потока, открытые до подключения сигнала
+        install()
+        return RequestStats(sampled)
+
+    def finish(self, request, response, stats):
+        total_ms = (time.perf_counter() - stats.started) * 1000
+        match = request.resolver_match
+        if metrics.enabled():
+            view = match.view_name if match else '<unmatched>'
+            metrics.observe_request(view, request.method, response.status_code, total_ms / 1000, stats.queries)
+        if stats.fingerprints is None:
+            return response
+
+        sql_ms = stats.sql_time * 1000
+        duplicates = stats.duplicates()
+        if get_setting('SERVER_TIMING'):
+            timing = [
+                f'sql;dur={sql_ms:.1f};desc="{stats.queries} queries"',
+                f'app;dur={total_ms - sql_ms:.1f}',
+                f'total;dur={total_ms:.1f}',
+            ]
+            if duplicates:
+                timing.append(f'dup;desc="{sum(count for _, count in duplicates)} repeated"')
+            existing = response.get('Server-Timing')
+            response['Server-Timing'] = ', '.join(([existing] if existing else []) + timing)
+
+        if (total_ms >= get_setting('SLOW_REQUEST_MS') or stats.queries >= get_setting('QUERY_COUNT_THRESHOLD')
+                or duplicates):
+            logger.warning(json.dumps({
+                'method': request.method,
+                'path': request.path,
+                'view': match.view_name if match else None,
+                'status': response.status_code,
+                'total_ms': round(total_ms, 1),
+                'sql_ms': round(sql_ms, 1),
+                'queries': stats.queries,
+                'duplicates': [{'sql': sql[:300], 'count': count} for sql, count in duplicates],
+            }, ensure_ascii=False))
+        return response
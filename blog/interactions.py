@@ -0,0 +1,175 @@
+"""
+Изменения, которые вызывают JSON-эндпоинты: реакции, избранное, комментарии.
+Функции синхронные и выполняются в одной транзакции; асинхронные представления
+(async_views.py) вызывают их через sync_to_async.
+"""
+from collections import Counter, defaultdict
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from .events import publish
+from .models import AuthorStats, Comment, Post, Reaction
+
+
+def _toggle(post, user, kind, exclusive=()):
+    """
+    Снимает реакцию, если она есть, иначе ставит, предварительно снимая взаимоисключающие.
+    Счётчики меняются ровно на число реально удалённых и вставленных строк, поэтому
+    двойной клик из двух параллельных запросов не сдвигает их: уникальное ограничение
+    пропускает только одну вставку. Стоимость не зависит от числа реакций на посте.
+    """
+    deltas = {}
+    with transaction.atomic():
+        removed, _ = Reaction.objects.filter(post=post, user=user, kind=kind).delete()
+        if removed:
+            deltas[kind] = -removed
+        else:
+            for other in exclusive:
+                removed_other, _ = Reaction.objects.filter(post=post, user=user, kind=other).delete()
+                deltas[other] = -removed_other
+            try:
+                with transaction.atomic():
+                    Reaction.objects.create(post=post, user=user, kind=kind)
+                deltas[kind] = 1
+            except IntegrityError:
+                pass  # Параллельный запрос уже поставил эту реакцию
+        post.adjust_counters(**{Reaction.COUNTER_FIELDS[name]: delta for name, delta in deltas.items()})
+    return not removed
+
+
+def toggle_reaction(post, user, action):
+    """Ставит или снимает лайк/дизлайк ('like' / 'dislike'); возвращает выполненное действие"""
+    opposite = Reaction.DISLIKE if action == Reaction.LIKE else Reaction.LIKE
+    added = _toggle(post, user, action, exclusive=[opposite])
+    return f'{action}d' if added else f'un{action}d'
+
+
+def toggle_favorite(post, user):
+    """Добавляет пост в избранное или убирает из него; возвращает 'added' / 'removed'"""
+    added = _toggle(post, user, Reaction.FAVORITE)
+    return 'added' if added else 'removed'
+
+
+def parse_reaction_operations(data, limit):
+    """
+    Операции пакетного запроса [{'post_id', 'kind', 'active'}] -> [(post_id, kind, active)].
+    ValueError с сообщением для ответа 400, если формат неверный.
+    """
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list) or not operations:
+        raise ValueError('Ожидается непустой список operations')
+    if len(operations) > limit:
+        raise ValueError(f'Не больше {limit} операций за запрос')
+    parsed = []
+    for operation in operations:
+        try:
+            post_id, kind, active = operation['post_id'], operation['kind'], operation['active']
+        except (TypeError, KeyError):
+            raise ValueError('Операция должна содержать post_id, kind и active')
+        if type(post_id) is not int or kind not in Reaction.COUNTER_FIELDS or not isinstance(active, bool):
+            raise ValueError(f'Некорректная операция: {operation}')
+        parsed.append((post_id, kind, active))
+    return parsed
+
+
+def apply_reactions(user, operations):
+    """
+    Применяет пакет операций (post_id, kind, active) в порядке нажатий. Операции
+    сворачиваются в итоговый набор реакций каждого поста, и в одной транзакции
+    записывается только разница с текущими строками: одно DELETE, одна вставка и
+    UPDATE счётчиков на группу постов с одинаковыми изменениями. Как и в _toggle,
+    счётчики меняются на число реально удалённых и вставленных строк.
+    Возвращает {post_id: (виды реакций, {счётчик: значение})}.
+    """
+    post_ids = {post_id for post_id, _, _ in operations}
+    missing = post_ids - set(Post.objects.filter(pk__in=post_ids).values_list('pk', flat=True))
+    if missing:
+        raise ValueError(f'Посты не найдены: {sorted(missing)}')
+    with transaction.atomic():
+        current = defaultdict(dict)
+        # Строки блокируются до конца транзакции: удаление ниже затронет ровно их
+        for pk, post_id, kind in (
+            Reaction.objects.select_for_update().filter(user=user, post_id__in=post_ids)
+            .values_list('pk', 'post_id', 'kind')
+        ):
+            current[post_id][kind] = pk
+        final = {post_id: set(current[post_id]) for post_id in post_ids}
+        for post_id, kind, active in operations:
+            if not active:
+                final[post_id].discard(kind)
+                continue
+            if kind in Reaction.VOTES:
+                final[post_id] -= set(Reaction.VOTES)
+            final[post_id].add(kind)
+
+        deltas = defaultdict(Counter)
+        removed = [(post_id, kind, pk) for post_id, kinds in current.items()
+                   for kind, pk in kinds.items() if kind not in final[post_id]]
+        if removed:
+            Reaction.objects.filter(pk__in=[pk for _, _, pk in removed]).delete()
+        for post_id, kind, _ in removed:
+            deltas[post_id][Reaction.COUNTER_FIELDS[kind]] -= 1
+        added = [Reaction(user=user, post_id=post_id, kind=kind)
+                 for post_id, kinds in final.items() for kind in kinds - set(current[post_id])]
+        for reaction in _insert_reactions(added):
+            deltas[reaction.post_id][Reaction.COUNTER_FIELDS[reaction.kind]] += 1
+
+        by_delta = defaultdict(list)
+        for post_id, changes in deltas.items():
+            by_delta[frozenset(changes.items())].append(post_id)
+        for changes, changed_ids in by_delta.items():
+            Post.objects.filter(pk__in=changed_ids).update(
+                **{field: F(field) + delta for field, delta in changes}
+            )
+        AuthorStats.objects.add_post_deltas(deltas)
+        counters = {
+            values.pop('pk'): values
+            for values in Post.objects.filter(pk__in=post_ids).values('pk', *Reaction.COUNTER_FIELDS.values())
+        }
+        for post_id, changes in deltas.items():
+            publish(post_id, 'counters', {field: counters[post_id][field] for field in changes})
+    return {post_id: (final[post_id], counters[post_id]) for post_id in post_ids}
+
+
+def reaction_state(kinds, counters):
+    """Данные поста для JSON-ответа пакетного запроса реакций"""
+    return {
+        'liked': Reaction.LIKE in kinds,
+        'disliked': Reaction.DISLIKE in kinds,
+        'favorited': Reaction.FAVORITE in kinds,
+        **counters,
+    }
+
+
+def _insert_reactions(reactions):
+    """Вставляет реакции и возвращает реально вставленные; занятые параллельным запросом пропускаются"""
+    try:
+        with transaction.atomic():
+            Reaction.objects.bulk_create(reactions)
+        return reactions
+    except IntegrityError:
+        inserted = []
+        for reaction in reactions:
+            try:
+                with transaction.atomic():
+                    inserted.append(Reaction.objects.create(
+                        user_id=reaction.user_id, post_id=reaction.post_id, kind=reaction.kind,
+                    ))
+            except IntegrityError:
+                pass  # Параллельный запрос уже поставил эту реакцию
+        return inserted
+
+
+def create_comment(post, user, text, parent=None):
+    with transaction.atomic():
+        comment = Comment.objects.create(post=post, author=user, text=text, parent=parent)
+        post.adjust_counters(comments_count=1)
+    return comment
+
+
+def delete_comment(comment):
+    """Удаляет комментарий вместе с ответами и уменьшает счётчик поста"""
+    with transaction.atomic():
+        _, deleted = comment.delete()
+        comment.post.adjust_counters(comments_count=-deleted.get(Comment._meta.label, 0))
@@ -0,0 +1,170 @@
+"""
+Сравнение синхронных и асинхронных JSON-эндпоинтов в одном процессе.
+
+sync  - синхронные представления через WSGI-обработчик Django, как в воркере
+        с пулом из --threads потоков (лишние клиенты ждут свободный поток);
+async - асинхронные представления через ASGI-обработчик в одном event loop.
+
+--concurrency клиентов в каждом режиме шлют запросы по очереди (закрытый цикл),
+задержка считается от момента, когда клиент готов отправить запрос.
+Команда создаёт временные данные в текущей БД и удаляет их в конце.
+На SQLite пишущие эндпоинты упираются в блокировку файла БД ("database is
+locked" попадает в столбец ошибок) - их стоит сравнивать на PostgreSQL.
+"""
+import asyncio
+import logging
+import sys
+import threading
+import time
+import types
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.cookies import SimpleCookie
+
+from asgiref.sync import ThreadSensitiveContext
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test import AsyncClient, Client, override_settings
+from django.urls import clear_url_caches, path
+
+from blog import async_views, views
+from blog.models import Category, Comment, Post
+
+# Эндпоинт: (метод, маршрут, синхронное представление, асинхронное представление)
+ENDPOINTS = {
+    'more_comments': ('get', 'posts/<slug:post_slug>/more_comments/', views.MoreCommentsView, async_views.AsyncMoreCommentsView),
+    'favorite': ('post', 'posts/<int:post_id>/favorite/', views.PostFavoriteToggleView, async_views.AsyncPostFavoriteToggleView),
+    'like': ('post', 'posts/<int:post_id>/like-dislike/', views.LikeDislikePostView, async_views.AsyncLikeDislikePostView),
+    'comment': ('post', 'posts/<int:post_id>/comment/', views.CommentCreateView, async_views.AsyncCommentCreateView),
+}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def build_urlconf(mode):
+    """Модуль с маршрутами всех эндпоинтов одного режима"""
+    module = types.ModuleType(f'blog_bench_urls_{mode}')
+    module.urlpatterns = [
+        path(route, (sync_view if mode == 'sync' else async_view).as_view(), name=name)
+        for name, (_, route, sync_view, async_view) in ENDPOINTS.items()
+    ]
+    sys.modules[module.__name__] = module
+    return module.__name__
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает запросы в секунду и p99 синхронных и асинхронных JSON-эндпоинтов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--endpoints', nargs='+', choices=list(ENDPOINTS), default=['more_comments', 'favorite'])
+        parser.add_argument('--requests', type=int, default=1000, help='Запросов на эндпоинт в каждом режиме')
+        parser.add_argument('--concurrency', type=int, default=100, help='Одновременных клиентов')
+        parser.add_argument('--threads', type=int, default=8, help='Потоков синхронного воркера')
+        parser.add_argument('--comments', type=int, default=30, help='Комментариев у тестового поста')
+
+    def handle(self, *args, **options):
+        if options['requests'] < options['concurrency']:
+            raise CommandError('--requests должно быть не меньше --concurrency')
+        user, category, post = self.create_fixtures(options['comments'])
+        # Ошибки считаются в таблице, трассировки каждого запроса не нужны
+        request_logger = logging.getLogger('django.request')
+        level, request_logger.level = request_logger.level, logging.CRITICAL
+        try:
+            sessions = Client()
+            sessions.force_login(user)
+            cookies = SimpleCookie(sessions.cookies)
+            self.stdout.write(f"{'эндпоинт':<15}{'режим':<7}{'rps':>9}{'p50, мс':>10}{'p99, мс':>10}{'ошибки':>8}")
+            for endpoint in options['endpoints']:
+                for mode in ('sync', 'async'):
+                    with override_settings(ROOT_URLCONF=build_urlconf(mode), ALLOWED_HOSTS=['testserver']):
+                        clear_url_caches()
+                        run = self.run_sync if mode == 'sync' else self.run_async
+                        elapsed, latencies, errors = run(endpoint, post, cookies, options)
+                    clear_url_caches()
+                    self.stdout.write(
+                        f'{endpoint:<15}{mode:<7}{len(latencies) / elapsed:>9.0f}'
+                        f'{percentile(latencies, 0.5) * 1000:>10.1f}{percentile(latencies, 0.99) * 1000:>10.1f}{errors:>8}'
+                    )
+        finally:
+            request_logger.setLevel(level)
+            user.delete()
+            category.delete()
+
+    def create_fixtures(self, comments):
+        suffix = uuid.uuid4().hex[:8]
+        user = get_user_model().objects.create_user(f'bench-{suffix}', password=uuid.uuid4().hex)
+        category = Category.objects.create(name=f'bench-{suffix}')
+        post = Post.objects.create(
+            title=f'bench-{suffix}', text='Текст', category=category, author=user, status='published',
+        )
+        for number in range(comments):
+            Comment.objects.create(post=post, author=user, text=f'Комментарий {number}')
+        post.adjust_counters(comments_count=comments)
+        return user, category, post
+
+    @staticmethod
+    def request_args(endpoint, post):
+        method, route, _, _ = ENDPOINTS[endpoint]
+        url = '/' + route.replace('<slug:post_slug>', post.slug).replace('<int:post_id>', str(post.pk))
+        data = {'offset': 0} if endpoint == 'more_comments' else {'action': 'like', 'text': 'Нагрузка'}
+        return method, url, data
+
+    def run_sync(self, endpoint, post, cookies, options):
+        method, url, data = self.request_args(endpoint, post)
+        workers = threading.Semaphore(options['threads'])
+        per_client = options['requests'] // options['concurrency']
+
+        def client_loop(_):
+            client = Client(raise_request_exception=False)
+            client.cookies = SimpleCookie(cookies)
+            results = []
+            try:
+                for _ in range(per_client):
+                    start = time.perf_counter()
+                    with workers:
+                        status = getattr(client, method)(url, data).status_code
+                    results.append((time.perf_counter() - start, status))
+            finally:
+                connections.close_all()
+            return results
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            results = [result for chunk in pool.map(client_loop, range(options['concurrency'])) for result in chunk]
+        return self.summarize(time.perf_counter() - start, results)
+
+    def run_async(self, endpoint, post, cookies, options):
+        method, url, data = self.request_args(endpoint, post)
+        per_client = options['requests'] // options['concurrency']
+
+        async def client_loop():
+            client = AsyncClient(raise_request_exception=False)
+            client.cookies = SimpleCookie(cookies)
+            results = []
+            for _ in range(per_client):
+                start = time.perf_counter()
+                # Как ASGIHandler: синхронный код каждого запроса - в своём потоке
+                async with ThreadSensitiveContext():
+                    response = await getattr(client, method)(url, data)
+                results.append((time.perf_counter() - start, response.status_code))
+            return results
+
+        async def main():
+            chunks = await asyncio.gather(*(client_loop() for _ in range(options['concurrency'])))
+            return [result for chunk in chunks for result in chunk]
+
+        start = time.perf_counter()
+        results = asyncio.run(main())
+        elapsed = time.perf_counter() - start
+        connections.close_all()
+        return self.summarize(elapsed, results)
+
+    @staticmethod
+    def summarize(elapsed, results):
+        latencies = [latency for latency, _ in results]
+        errors = sum(1 for _, status in results if status >= 400)
+        return elapsed, latencies, errors
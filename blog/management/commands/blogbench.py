@@ -0,0 +1,347 @@
+"""
+Нагрузочный прогон всех основных страниц блога на синтетических данных.
+
+Команда создаёт отдельную тестовую БД (как manage.py test), заполняет её
+воспроизводимым набором данных по --seed и для каждого представления меряет
+перцентили задержки, число SQL-запросов и пиковую память Python (tracemalloc).
+Результат пишется в JSON; с --baseline новые цифры сравниваются с прошлым
+прогоном, и ухудшения выводятся как регрессии.
+"""
+import json
+import platform
+import random
+import statistics
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from io import StringIO
+
+import django
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.text import slugify
+from unidecode import unidecode
+
+from blog.models import COMMENT_MAX_LEVEL, Category, Comment, Post, Reaction, Tag
+from blog.views import MainPageView
+
+WORDS = (
+    'город новости погода спорт музыка кино книги наука техника python django база данных '
+    'путешествие кухня рецепт история искусство театр фото природа море горы лес река '
+    'программирование сервер кэш индекс запрос страница пост комментарий лайк'
+).split()
+
+SCALES = {
+    'tiny': {'users': 20, 'posts': 30, 'categories': 3, 'tags': 10, 'comments': 90},
+    'small': {'users': 200, 'posts': 500, 'categories': 10, 'tags': 100, 'comments': 3000},
+    'medium': {'users': 2000, 'posts': 5000, 'categories': 20, 'tags': 400, 'comments': 40000},
+    'large': {'users': 10000, 'posts': 30000, 'categories': 40, 'tags': 1500, 'comments': 300000},
+}
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Dataset:
+    """Синтетические данные: всё создаётся bulk_create, затем досчитываются индекс и счётчики"""
+
+    def __init__(self, rng, sizes, batch_size=1000):
+        self.rng = rng
+        self.sizes = sizes
+        self.batch_size = batch_size
+
+    def sentence(self, words):
+        return ' '.join(self.rng.choice(WORDS) for _ in range(words))
+
+    def seed(self):
+        User = get_user_model()
+        password = make_password('bench-password')
+        User.objects.bulk_create(
+            [User(username=f'bench{number}', email=f'bench{number}@example.com', password=password)
+             for number in range(self.sizes['users'])],
+            batch_size=self.batch_size,
+        )
+        self.user_ids = list(User.objects.filter(username__startswith='bench').values_list('pk', flat=True))
+
+        Category.objects.bulk_create([
+            Category(name=f'Категория {number}', slug=slugify(unidecode(f'Категория {number}')))
+            for number in range(self.sizes['categories'])
+        ])
+        tag_names = [f'{self.rng.choice(WORDS)}{number}' for number in range(self.sizes['tags'])]
+        Tag.objects.bulk_create([Tag(name=name, slug=slugify(unidecode(name))) for name in tag_names])
+        category_ids = list(Category.objects.values_list('pk', flat=True))
+        tag_ids = list(Tag.objects.values_list('pk', flat=True))
+
+        posts = []
+        for number in range(self.sizes['posts']):
+            title = f'{self.sentence(3).capitalize()} {number}'
+            posts.append(Post(
+                title=title,
+                slug=slugify(unidecode(title)),
+                text=' '.join(self.sentence(12) + '.' for _ in range(self.rng.randint(2, 12))),
+                category_id=self.rng.choice(category_ids),
+                author_id=self.rng.choice(self.user_ids),
+                status='published' if self.rng.random() < 0.9 else 'draft',
+            ))
+        Post.objects.bulk_create(posts, batch_size=self.batch_size)
+        self.post_ids = list(Post.objects.values_list('pk', flat=True))
+
+        self.seed_m2m(Post.tags.through, 'tag_id', tag_ids, (1, 5))
+        # Популярные посты собирают больше реакций: плотные таблицы для запросов карточек
+        self.seed_reactions({Reaction.LIKE: (0, 60), Reaction.DISLIKE: (0, 10), Reaction.FAVORITE: (0, 25)})
+        self.seed_m2m(Post.viewed_users.through, 'user_id', self.user_ids, (0, 80))
+        self.seed_comments()
+
+        call_command('reconcile_counters', verbosity=0, stdout=StringIO())
+        call_command('rebuild_search_index', stdout=StringIO())
+
+    def seed_m2m(self, through, field, choices, count_range):
+        rows = []
+        for post_id in self.post_ids:
+            count = min(len(choices), int(self.rng.triangular(*count_range, count_range[0])))
+            for value in self.rng.sample(choices, count):
+                rows.append(through(post_id=post_id, **{field: value}))
+            if len(rows) >= self.batch_size * 10:
+                through.objects.bulk_create(rows, batch_size=self.batch_size, ignore_conflicts=True)
+                rows = []
+        through.objects.bulk_create(rows, batch_size=self.batch_size, ignore_conflicts=True)
+
+    def seed_reactions(self, count_ranges):
+        rows = []
+        for post_id in self.post_ids:
+            counts = {kind: int(self.rng.triangular(*bounds, bounds[0])) for kind, bounds in count_ranges.items()}
+            # Лайк и дизлайк одного пользователя исключают друг друга - берём их из одной выборки
+            voters = self.rng.sample(self.user_ids, min(len(self.user_ids), counts[Reaction.LIKE] + counts[Reaction.DISLIKE]))
+            kinds = [Reaction.LIKE] * counts[Reaction.LIKE] + [Reaction.DISLIKE] * counts[Reaction.DISLIKE]
+            rows += [Reaction(post_id=post_id, user_id=user_id, kind=kind) for user_id, kind in zip(voters, kinds)]
+            favorites = self.rng.sample(self.user_ids, min(len(self.user_ids), counts[Reaction.FAVORITE]))
+            rows += [Reaction(post_id=post_id, user_id=user_id, kind=Reaction.FAVORITE) for user_id in favorites]
+            if len(rows) >= self.batch_size * 10:
+                Reaction.objects.bulk_create(rows, batch_size=self.batch_size)
+                rows = []
+        Reaction.objects.bulk_create(rows, batch_size=self.batch_size)
+
+    def seed_comments(self):
+        """Комментарии уровнями: сначала корни, затем ответы на уже созданные - с готовыми path и level"""
+        total = self.sizes['comments']
+        roots_total = max(1, total // 3)
+        created = Comment.objects.bulk_create([
+            Comment(post_id=self.rng.choice(self.post_ids), author_id=self.rng.choice(self.user_ids),
+                    text=self.sentence(10), level=0, path='')
+            for _ in range(roots_total)
+        ], batch_size=self.batch_size)
+        remaining = total - roots_total
+        level = 0
+        while remaining > 0 and level < COMMENT_MAX_LEVEL:
+            # Глубокие ветки: каждый следующий уровень отвечает на часть предыдущего
+            parents = self.rng.sample(created, max(1, len(created) // 2))
+            replies = [
+                Comment(post_id=parent.post_id, author_id=self.rng.choice(self.user_ids), text=self.sentence(8),
+                        parent_id=parent.pk, level=parent.level + 1, path=parent.subtree_prefix)
+                for parent in parents
+                for _ in range(self.rng.randint(1, 2))
+            ][:remaining]
+            created = Comment.objects.bulk_create(replies, batch_size=self.batch_size)
+            remaining -= len(created)
+            level += 1
+
+
+class Command(BaseCommand):
+    help = 'Заполняет отдельную БД синтетическими данными и меряет задержку, запросы и память всех страниц блога'
+    memory_iterations = 10  # Запросов в проходе с tracemalloc для пикового потребления памяти
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scale', choices=list(SCALES), default='medium')
+        parser.add_argument('--seed', type=int, default=42)
+        parser.add_argument('--iterations', type=int, default=50, help='Запросов на каждое представление')
+        parser.add_argument('--views', nargs='+', help='Только эти представления')
+        parser.add_argument('--output', help='Файл для JSON с результатами (по умолчанию - stdout)')
+        parser.add_argument('--baseline', help='JSON прошлого прогона для сравнения')
+        parser.add_argument('--tolerance', type=float, default=0.2, help='Допустимое ухудшение p95 (доля)')
+        parser.add_argument('--fail-on-regression', action='store_true')
+        parser.add_argument('--in-place', action='store_true',
+                            help='Не создавать отдельную БД, писать данные в текущую (для тестов)')
+
+    def handle(self, *args, **options):
+        old_name = None
+        if not options['in_place']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Быстрый хешер: задержка входа показывает поиск пользователя, а не стоимость PBKDF2
+            with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS],
+                                   PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher']):
+                report = self.run(options)
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        payload = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output']:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(payload)
+        else:
+            self.stdout.write(payload)
+        self.print_table(report)
+        if options['baseline']:
+            regressions = self.compare(report, options['baseline'], options['tolerance'])
+            if regressions and options['fail_on_regression']:
+                raise CommandError(f'Найдено регрессий: {len(regressions)}')
+
+    def run(self, options):
+        rng = random.Random(options['seed'])
+        sizes = SCALES[options['scale']]
+        started = time.perf_counter()
+        dataset = Dataset(rng, sizes)
+        dataset.seed()
+        seed_seconds = time.perf_counter() - started
+
+        scenarios = self.scenarios(rng)
+        names = options['views'] or list(scenarios)
+        unknown = set(names) - set(scenarios)
+        if unknown:
+            raise CommandError(f'Неизвестные представления: {", ".join(sorted(unknown))}')
+
+        reader = get_user_model().objects.filter(username__startswith='bench').order_by('pk').first()
+        anonymous, authenticated = Client(raise_request_exception=False), Client(raise_request_exception=False)
+        authenticated.force_login(reader)
+
+        views = {}
+        for name in names:
+            method, make_url, data, login = scenarios[name]
+            client = authenticated if login else anonymous
+            views[name] = self.measure(client, method, make_url, data, options['iterations'])
+        return {
+            'meta': {
+                'commit': git_commit(),
+                'created_at': datetime.now(timezone.utc).isoformat(),
+                'seed': options['seed'],
+                'scale': options['scale'],
+                'sizes': sizes,
+                'iterations': options['iterations'],
+                'seed_seconds': round(seed_seconds, 2),
+                'python': platform.python_version(),
+                'django': django.get_version(),
+                'database': connection.vendor,
+            },
+            'views': views,
+        }
+
+    def scenarios(self, rng):
+        """Имя: (метод, функция URL, данные POST или функция для них, нужен ли вход)"""
+        posts = list(Post.objects.published().values_list('pk', 'slug'))
+        busy_posts = list(
+            Post.objects.published().filter(comments_count__gt=5).values_list('slug', flat=True)[:200]
+        ) or [slug for _, slug in posts]
+        category_urls = [category.get_absolute_url() for category in Category.objects.all()]
+        tag_urls = [tag.get_absolute_url() for tag in Tag.objects.filter(posts__isnull=False).distinct()[:500]]
+        main = reverse('blog:main_page')
+        users = get_user_model().objects.filter(username__startswith='bench').count()
+
+        def login_attempt():
+            number = rng.randrange(users)
+            login = rng.choice([f'BENCH{number}', f'Bench{number}@Example.com', f'nobody{number}'])
+            return {'username': login, 'password': 'wrong-password'}
+
+        # Листаем только существующие страницы главной, чтобы не мерить 404
+        pages = max(1, min(5, len(posts) // MainPageView.paginate_by))
+        return {
+            'main_anonymous': ('get', lambda: f'{main}?page={rng.randint(1, pages)}', None, False),
+            'main': ('get', lambda: f'{main}?page={rng.randint(1, pages)}', None, True),
+            'main_cursor_feed': ('get', lambda: reverse('blog:main_feed'), None, True),
+            'search': ('get', lambda: f'{main}?q={rng.choice(WORDS)}+{rng.choice(WORDS)}', None, True),
+            'category': ('get', lambda: rng.choice(category_urls), None, True),
+            'tag': ('get', lambda: rng.choice(tag_urls), None, True),
+            'detail': ('get', lambda: reverse('blog:post_detail', args=[rng.choice(busy_posts)]), None, True),
+            'more_comments': ('get', lambda: reverse('blog:more_comments', args=[rng.choice(busy_posts)]) + '?offset=0',
+                              None, True),
+            'like_toggle': ('post', lambda: reverse('blog:post_like', args=[rng.choice(posts)[0]]),
+                            {'action': 'like'}, True),
+            'favorite_toggle': ('post', lambda: reverse('blog:post_favorite', args=[rng.choice(posts)[0]]), {}, True),
+            # Неудачные входы по логину или email в другом регистре и по несуществующему логину
+            'login_failed': ('post', lambda: reverse('users:login'), login_attempt, False),
+        }
+
+    def measure(self, client, method, make_url, data, iterations):
+        latencies, queries, errors = [], [], 0
+        peak = 0
+        # Первый запрос прогревает шаблоны и импорты и в статистику не входит
+        payload = data if callable(data) else lambda: data
+        getattr(client, method)(make_url(), payload())
+        for _ in range(iterations):
+            url, values = make_url(), payload()
+            with CaptureQueriesContext(connection) as captured:
+                start = time.perf_counter()
+                response = getattr(client, method)(url, values)
+                latencies.append(time.perf_counter() - start)
+            queries.append(len(captured))
+            if response.status_code >= 400:
+                errors += 1
+        # Память - отдельным проходом: tracemalloc замедляет выделения и исказил бы задержки
+        for _ in range(min(iterations, self.memory_iterations)):
+            url, values = make_url(), payload()
+            tracemalloc.start()
+            try:
+                getattr(client, method)(url, values)
+                peak = max(peak, tracemalloc.get_traced_memory()[1])
+            finally:
+                tracemalloc.stop()
+        cache.clear()
+        return {
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 2),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+            'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+            'queries_mean': round(statistics.fmean(queries), 2),
+            'queries_max': max(queries),
+            'peak_memory_kb': round(peak / 1024, 1),
+            'errors': errors,
+        }
+
+    def print_table(self, report):
+        self.stderr.write(f"{'представление':<18}{'p50':>9}{'p95':>9}{'p99':>9}{'запросы':>9}{'память, КБ':>12}{'ошибки':>8}")
+        for name, result in report['views'].items():
+            self.stderr.write(
+                f"{name:<18}{result['p50_ms']:>9}{result['p95_ms']:>9}{result['p99_ms']:>9}"
+                f"{result['queries_max']:>9}{result['peak_memory_kb']:>12}{result['errors']:>8}"
+            )
+
+    def compare(self, report, baseline_path, tolerance):
+        """Регрессии: p95 хуже базового больше чем на tolerance или выросло число запросов"""
+        with open(baseline_path, encoding='utf-8') as file:
+            baseline = json.load(file)
+        if baseline['meta'].get('sizes') != report['meta']['sizes']:
+            self.stderr.write(self.style.WARNING('Размер данных отличается от базового прогона - сравнение неточное'))
+        regressions = []
+        for name, result in report['views'].items():
+            old = baseline['views'].get(name)
+            if old is None:
+                continue
+            if result['p95_ms'] > old['p95_ms'] * (1 + tolerance):
+                regressions.append(f"{name}: p95 {old['p95_ms']} -> {result['p95_ms']} мс")
+            if result['queries_max'] > old['queries_max']:
+                regressions.append(f"{name}: запросов {old['queries_max']} -> {result['queries_max']}")
+        for line in regressions:
+            self.stderr.write(self.style.ERROR(f'РЕГРЕССИЯ {line}'))
+        if not regressions:
+            self.stderr.write(self.style.SUCCESS('Регрессий относительно базового прогона нет'))
+        return regressions
@@ -0,0 +1,132 @@
+"""
+Проверка планов запросов горячих страниц блога.
+
+Команда открывает каждую страницу тестовым клиентом, собирает выполненные
+SELECT и прогоняет их через EXPLAIN QUERY PLAN (SQLite). Полный просмотр
+таблицы без индекса и сортировка во временном B-дереве (USE TEMP B-TREE FOR
+ORDER BY) считаются ошибкой, если запрос не внесён в ALLOWED с причиной.
+По умолчанию работает в отдельной тестовой БД с небольшим набором данных
+из blogbench, чтобы страницы выполнили все свои запросы.
+"""
+import random
+import re
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from blog.management.commands.blogbench import SCALES, Dataset
+from blog.models import Post, Reaction, Tag
+
+FULL_SCAN_RE = re.compile(r'^SCAN (\w+)$')
+TEMP_SORT_RE = re.compile(r'USE TEMP B-TREE FOR (?:RIGHT PART OF )?ORDER BY')
+
+# Допустимые планы: (регулярное выражение по SQL, причина)
+ALLOWED = [
+    (re.compile(r'MATCH %s ORDER BY rank'),
+     'FTS5 ранжирует совпадения по bm25: сортировка только найденных строк с LIMIT'),
+    (re.compile(r'ORDER BY CASE'),
+     'результаты поиска упорядочены по рангу FTS: сортируются не больше search_limit найденных постов'),
+    (re.compile(r'FROM "blog_comments" .*WHERE \("blog_comments"\."post_id" = %s AND \(\("blog_comments"\."path" >='),
+     'ответы веток берутся по индексу path и сортируются в пределах показанных веток'),
+]
+
+
+def hot_paths(post, busy_post, category, tag):
+    """Имя: (URL, нужен ли вход)"""
+    main = reverse('blog:main_page')
+    return {
+        'main_anonymous': (main, False),
+        'main': (main, True),
+        'main_page_2': (f'{main}?page=2', True),
+        'main_feed': (reverse('blog:main_feed'), True),
+        'post_list': (reverse('blog:post_list'), True),
+        'search': (f'{main}?q=django', True),
+        'category': (category.get_absolute_url(), True),
+        'tag': (tag.get_absolute_url(), True),
+        'favorites': (reverse('blog:favorite_posts'), True),
+        'detail': (reverse('blog:post_detail', args=[busy_post.slug]), True),
+        'more_comments': (reverse('blog:more_comments', args=[busy_post.slug]) + '?offset=0', True),
+        'detail_small': (reverse('blog:post_detail', args=[post.slug]), False),
+        'post_state': (f"{reverse('blog:post_state')}?ids={post.pk},{busy_post.pk}", True),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Проверяет EXPLAIN QUERY PLAN запросов горячих страниц: без полных просмотров и сортировок во временных B-деревьях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--in-place', action='store_true',
+                            help='Использовать текущую БД и её данные вместо отдельной тестовой')
+        parser.add_argument('--seed', type=int, default=42, help='Seed набора данных для тестовой БД')
+
+    def handle(self, *args, **options):
+        self.verbosity = options['verbosity']
+        if connection.vendor != 'sqlite':
+            raise CommandError('EXPLAIN QUERY PLAN поддерживается только для SQLite')
+        old_name = None
+        if not options['in_place']:
+            old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            if not options['in_place'] or not Post.objects.published().exists():
+                Dataset(random.Random(options['seed']), SCALES['tiny']).seed()
+            with override_settings(ALLOWED_HOSTS=['testserver', *settings.ALLOWED_HOSTS]):
+                problems = self.audit()
+        finally:
+            if old_name is not None:
+                connection.creation.destroy_test_db(old_name, verbosity=0)
+        if problems:
+            raise CommandError(f'Запросов с плохим планом: {problems}')
+        self.stdout.write(self.style.SUCCESS('Все запросы горячих страниц используют индексы'))
+
+    def audit(self):
+        published = Post.objects.published()
+        post = published.order_by('comments_count').first()
+        busy_post = published.order_by('-comments_count').first()
+        tag = Tag.objects.filter(posts__status='published').first()
+        reader = get_user_model().objects.filter(reactions__kind=Reaction.FAVORITE).first()
+        anonymous, authenticated = Client(), Client()
+        authenticated.force_login(reader)
+
+        problems = 0
+        for name, (url, login) in hot_paths(post, busy_post, post.category, tag).items():
+            executed = []
+
+            def collect(execute, sql, params, many, context):
+                if sql.lstrip().upper().startswith('SELECT'):
+                    executed.append((sql, params))
+                return execute(sql, params, many, context)
+
+            with connection.execute_wrapper(collect):
+                response = (authenticated if login else anonymous).get(url)
+            if response.status_code != 200:
+                raise CommandError(f'{name}: {url} ответил {response.status_code}')
+
+            issues = []
+            for sql, params in executed:
+                for issue in self.plan_issues(sql, params):
+                    reason = next((reason for pattern, reason in ALLOWED if pattern.search(sql)), None)
+                    if reason is None:
+                        issues.append((issue, sql))
+                    elif self.verbosity > 1:
+                        self.stdout.write(f'  {name}: {issue} - допустимо: {reason}')
+            status = self.style.ERROR('ПЛОХО') if issues else self.style.SUCCESS('ok')
+            self.stdout.write(f'{name:<16} запросов: {len(executed):>3}  {status}')
+            for issue, sql in issues:
+                self.stdout.write(f'    {issue}\n    {sql}')
+            problems += len(issues)
+        return problems
+
+    def plan_issues(self, sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            details = [row[-1] for row in cursor.fetchall()]
+        for detail in details:
+            match = FULL_SCAN_RE.match(detail)
+            if match:
+                yield f'полный просмотр таблицы {match.group(1)}'
+            elif TEMP_SORT_RE.search(detail):
+                yield 'сортировка во временном B-дереве'
@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand
+
+from blog.images import generate_variants
+from blog.models import Post
+
+
+class Command(BaseCommand):
+    help = 'Создаёт уменьшенные копии изображений постов, для которых их ещё нет'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--force', action='store_true', help='Пересоздать варианты у всех постов')
+
+    def handle(self, *args, **options):
+        posts = Post.objects.exclude(image='').exclude(image__isnull=True)
+        if options['force']:
+            posts.update(image_variants={})
+        processed = 0
+        for post_id in posts.values_list('pk', flat=True).iterator():
+            if generate_variants(post_id):
+                processed += 1
+        self.stdout.write(self.style.SUCCESS(f'Обработано изображений: {processed}'))
@@ -0,0 +1,381 @@
+"""
+Массовый импорт постов и комментариев из NDJSON или CSV.
+
+Записи читаются потоком и пишутся пачками через bulk_create. Авторы,
+категории и теги разрешаются через словари в памяти (недостающие создаются
+пачкой), slug, level и path комментариев вычисляются заранее, поэтому на
+пачку приходится несколько запросов вместо нескольких на каждую запись.
+В памяти, кроме текущей пачки, растут только словари "внешний id -> pk".
+
+Формат записи (поле type или опция --type):
+  post:    id, title, text, category, tags (список или "a, b"), author, status, created_at
+  comment: id, post (id поста из импорта), parent (id комментария), author, text, created_at
+Ответ должен идти после родителя; ответ глубже COMMENT_MAX_LEVEL
+прикрепляется к родителю родителя.
+"""
+import csv
+import json
+import sys
+import time
+from collections import Counter, defaultdict
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from django.utils.text import slugify
+from unidecode import unidecode
+
+from blog.cache import bump_listing_versions, bump_version, comments_version_name
+from blog.models import COMMENT_MAX_LEVEL, AuthorStats, Category, Comment, Post
+from blog.search import get_backend
+from blog.tags import normalize_tag_name, resolve_tags
+
+User = get_user_model()
+
+# Сколько ошибок в записях показывать подробно
+MAX_REPORTED_ERRORS = 20
+
+
+class RecordError(Exception):
+    pass
+
+
+def read_records(path, fmt):
+    """Записи файла по одной: (номер строки, dict)"""
+    file = sys.stdin if path == '-' else open(path, encoding='utf-8', newline='')
+    try:
+        if fmt == 'csv':
+            for number, row in enumerate(csv.DictReader(file), start=2):
+                yield number, {key: value for key, value in row.items() if value not in ('', None)}
+        else:
+            for number, line in enumerate(file, start=1):
+                if not line.strip():
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError as error:
+                    yield number, RecordError(f'некорректный JSON: {error}')
+                    continue
+                yield number, record if isinstance(record, dict) else RecordError('запись должна быть объектом')
+    finally:
+        if file is not sys.stdin:
+            file.close()
+
+
+def parse_date(value):
+    if not value:
+        return None
+    date = parse_datetime(value)
+    if date is None:
+        raise RecordError(f'некорректная дата: {value}')
+    return timezone.make_aware(date) if timezone.is_naive(date) else date
+
+
+def required(record, field):
+    value = record.get(field)
+    if value in (None, ''):
+        raise RecordError(f'не заполнено поле {field}')
+    return value
+
+
+class Importer:
+    def __init__(self, batch_size, create_authors, report_error):
+        self.batch_size = batch_size
+        self.create_authors = create_authors
+        self.report_error = report_error
+        self.stats = Counter()
+        # Внешний id -> pk; единственное, что растёт вместе с объёмом импорта
+        self.post_ids = {}
+        self.comment_ids = {}
+        self.users = {}
+        self.categories = {}
+        self.tags = {}
+        self.pending_posts = []
+        self.pending_post_ids = set()
+        self.pending_comments = []
+        self.category_slugs = set()
+        self.tag_slugs = set()
+        self.search = get_backend()
+
+    def add(self, kind, record, where):
+        if kind == 'post':
+            self.pending_posts.append((where, record))
+            if 'id' in record:
+                self.pending_post_ids.add(str(record['id']))
+            if len(self.pending_posts) >= self.batch_size:
+                self.flush_posts()
+        elif kind == 'comment':
+            if str(record.get('post')) in self.pending_post_ids:
+                self.flush_posts()  # Пост комментария ещё в пачке - сначала записываем его
+            self.pending_comments.append((where, record))
+            if len(self.pending_comments) >= self.batch_size:
+                self.flush_comments()
+        else:
+            self.fail(where, f'неизвестный тип записи: {kind}')
+
+    def finish(self):
+        self.flush_posts()
+        self.flush_comments()
+        if self.stats['posts']:
+            bump_listing_versions(self.category_slugs, self.tag_slugs)
+
+    def fail(self, where, message):
+        self.stats['errors'] += 1
+        self.report_error(where, message)
+
+    def resolve_users(self, usernames):
+        missing = set(usernames) - set(self.users)
+        if missing:
+            self.users.update(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+            missing -= set(self.users)
+        if missing and self.create_authors:
+            # Без пароля: войти можно будет только после сброса пароля
+            password = make_password(None)
+            User.objects.bulk_create([User(username=name, password=password) for name in missing],
+                                     ignore_conflicts=True)
+            self.users.update(User.objects.filter(username__in=missing).values_list('username', 'pk'))
+            self.stats['authors'] += len(missing)
+
+    def resolve_categories(self, names):
+        missing = set(names) - set(self.categories)
+        if not missing:
+            return
+        slugs = {name: slugify(unidecode(name)) for name in missing}
+        existing = dict(Category.objects.filter(slug__in=slugs.values()).values_list('slug', 'pk'))
+        new = {slug: name for name, slug in slugs.items() if slug not in existing}
+        if new:
+            Category.objects.bulk_create([Category(name=name, slug=slug) for slug, name in new.items()],
+                                         ignore_conflicts=True)
+            existing.update(Category.objects.filter(slug__in=new).values_list('slug', 'pk'))
+        for name, slug in slugs.items():
+            self.categories[name] = (existing[slug], slug)
+
+    def resolve_tags(self, names):
+        missing = [name for name in dict.fromkeys(names) if name not in self.tags]
+        for tag in resolve_tags(missing):
+            self.tags[tag.name] = (tag.pk, tag.slug)
+
+    def flush_posts(self):
+        records, self.pending_posts = self.pending_posts, []
+        self.pending_post_ids.clear()
+        if not records:
+            return
+        parsed = []
+        for where, record in records:
+            try:
+                title = str(required(record, 'title')).strip()
+                if len(title) > Post._meta.get_field('title').max_length:
+                    raise RecordError('слишком длинный заголовок')
+                status = record.get('status') or 'published'
+                if status not in dict(Post.STATUS_CHOICES):
+                    raise RecordError(f'неизвестный статус: {status}')
+                tags = record.get('tags') or []
+                if isinstance(tags, str):
+                    tags = tags.split(',')
+                parsed.append((where, record, {
+                    'title': title,
+                    'slug': slugify(unidecode(title)),
+                    'text': required(record, 'text'),
+                    'category': str(required(record, 'category')).strip(),
+                    'author': str(required(record, 'author')).strip(),
+                    'status': status,
+                    'tags': [normalize_tag_name(tag) for tag in tags if tag.strip()],
+                    'created_at': parse_date(record.get('created_at')),
+                }))
+            except RecordError as error:
+                self.fail(where, str(error))
+
+        self.resolve_users({values['author'] for _, _, values in parsed})
+        self.resolve_categories({values['category'] for _, _, values in parsed})
+        self.resolve_tags([tag for _, _, values in parsed for tag in values['tags']])
+        # Заголовок и slug уникальны: пропускаем уже существующие и повторы внутри пачки
+        taken = set()
+        for title, slug in Post.objects.filter(
+            Q(title__in=[values['title'] for _, _, values in parsed])
+            | Q(slug__in=[values['slug'] for _, _, values in parsed])
+        ).values_list('title', 'slug'):
+            taken.update((('title', title), ('slug', slug)))
+
+        posts, sources = [], []
+        for where, record, values in parsed:
+            if values['author'] not in self.users:
+                self.fail(where, f"неизвестный автор: {values['author']}")
+                continue
+            if not values['slug'] or {('title', values['title']), ('slug', values['slug'])} & taken:
+                self.stats['posts_skipped'] += 1
+                continue
+            taken.update((('title', values['title']), ('slug', values['slug'])))
+            category_id, category_slug = self.categories[values['category']]
+            self.category_slugs.add(category_slug)
+            posts.append(Post(
+                title=values['title'], slug=values['slug'], text=values['text'], status=values['status'],
+                category_id=category_id, author_id=self.users[values['author']],
+            ))
+            sources.append((record, values))
+
+        with transaction.atomic():
+            Post.objects.bulk_create(posts, batch_size=self.batch_size)
+            self.restore_dates(Post, posts, [values['created_at'] for _, values in sources])
+            through = []
+            for post, (_, values) in zip(posts, sources):
+                for name in dict.fromkeys(values['tags']):
+                    tag_id, tag_slug = self.tags[name]
+                    self.tag_slugs.add(tag_slug)
+                    through.append(Post.tags.through(post_id=post.pk, tag_id=tag_id))
+            Post.tags.through.objects.bulk_create(through, batch_size=self.batch_size)
+            # Сигналов нет - опубликованные посты добавляем в статистику авторов сами
+            AuthorStats.objects.add(
+                {author_id: {'published_posts': count} for author_id, count in
+                 Counter(post.author_id for post in posts if post.status == 'published').items()}
+            )
+            # bulk_create не шлёт сигналы - индексируем посты пачки сами
+            for post in Post.objects.filter(pk__in=[post.pk for post in posts]).select_related(
+                    'category').prefetch_related('tags'):
+                self.search.index(post)
+        for post, (record, _) in zip(posts, sources):
+            if 'id' in record:
+                self.post_ids[str(record['id'])] = post.pk
+        self.stats['posts'] += len(posts)
+
+    def flush_comments(self):
+        records, self.pending_comments = self.pending_comments, []
+        if not records:
+            return
+        self.resolve_users({str(record.get('author', '')).strip() for _, record in records})
+        # Родители из прошлых пачек: post, level, path, parent - одним запросом
+        parent_pks = {self.comment_ids[str(record['parent'])] for _, record in records
+                      if str(record.get('parent')) in self.comment_ids}
+        parents = {
+            pk: (post_id, level, path, parent_id)
+            for pk, post_id, level, path, parent_id in Comment.objects.filter(pk__in=parent_pks).values_list(
+                'pk', 'post_id', 'level', 'path', 'parent_id')
+        }
+        batch_ids = {str(record['id']) for _, record in records if 'id' in record}
+        counts = Counter()
+
+        # Уровень за уровнем: сначала записи, чей родитель уже в БД, затем ответы на только что созданные
+        remaining = records
+        while remaining:
+            ready, waiting = [], []
+            for where, record in remaining:
+                parent = record.get('parent')
+                if parent in (None, '') or str(parent) in self.comment_ids:
+                    ready.append((where, record))
+                elif str(parent) in batch_ids:
+                    waiting.append((where, record))
+                else:
+                    self.fail(where, f'родительский комментарий {parent} не найден')
+            if not ready:
+                for where, _ in waiting:
+                    self.fail(where, 'циклическая ссылка на родителя')
+                break
+            comments, sources = [], []
+            for where, record in ready:
+                try:
+                    comment = self.build_comment(record, parents)
+                except RecordError as error:
+                    self.fail(where, str(error))
+                    continue
+                comments.append(comment)
+                sources.append(record)
+            with transaction.atomic():
+                Comment.objects.bulk_create(comments, batch_size=self.batch_size)
+                self.restore_dates(Comment, comments, [parse_date(record.get('created_at')) for record in sources])
+            for comment, record in zip(comments, sources):
+                parents[comment.pk] = (comment.post_id, comment.level, comment.path, comment.parent_id)
+                if 'id' in record:
+                    self.comment_ids[str(record['id'])] = comment.pk
+                counts[comment.post_id] += 1
+            batch_ids -= {str(record['id']) for _, record in ready if 'id' in record}
+            remaining = waiting
+
+        # Счётчики: один UPDATE на каждое значение прироста, как при сбросе просмотров
+        by_delta = defaultdict(list)
+        for post_id, delta in counts.items():
+            by_delta[delta].append(post_id)
+        for delta, post_ids in by_delta.items():
+            Post.objects.filter(pk__in=post_ids).update(comments_count=F('comments_count') + delta)
+        AuthorStats.objects.add_post_deltas({post_id: {'comments_count': delta} for post_id, delta in counts.items()})
+        for post_id in counts:
+            bump_version(comments_version_name(post_id))
+        self.stats['comments'] += sum(counts.values())
+
+    def build_comment(self, record, parents):
+        author = str(required(record, 'author')).strip()
+        if author not in self.users:
+            raise RecordError(f'неизвестный автор: {author}')
+        text = required(record, 'text')
+        parse_date(record.get('created_at'))
+        parent = record.get('parent')
+        if parent in (None, ''):
+            post_id = self.post_ids.get(str(required(record, 'post')))
+            if post_id is None:
+                raise RecordError(f"пост {record['post']} не найден")
+            return Comment(post_id=post_id, author_id=self.users[author], text=text, level=0, path='')
+        parent_pk = self.comment_ids[str(parent)]
+        post_id, level, path, grandparent_pk = parents[parent_pk]
+        if level >= COMMENT_MAX_LEVEL:
+            # Глубже нельзя - отвечаем тому же, кому отвечал родитель
+            parent_pk, level = grandparent_pk, level - 1
+        else:
+            path = f'{path}{parent_pk:0{Comment.PATH_SEGMENT_WIDTH}d}/'
+        return Comment(post_id=post_id, author_id=self.users[author], text=text,
+                       parent_id=parent_pk, level=level + 1, path=path)
+
+    def restore_dates(self, model, objects, dates):
+        """auto_now_add перезаписывает дату при вставке - возвращаем исходные одним bulk_update"""
+        dated = []
+        for obj, date in zip(objects, dates):
+            if date is not None:
+                obj.created_at = date
+                dated.append(obj)
+        if dated:
+            model.objects.bulk_update(dated, ['created_at'], batch_size=self.batch_size)
+
+
+class Command(BaseCommand):
+    help = 'Импортирует посты и комментарии из NDJSON или CSV пачками через bulk_create'
+
+    def add_arguments(self, parser):
+        parser.add_argument('paths', nargs='+', help='Файлы .ndjson/.jsonl/.csv; "-" - stdin')
+        parser.add_argument('--format', choices=('ndjson', 'csv'), help='По умолчанию - по расширению файла')
+        parser.add_argument('--type', choices=('post', 'comment'), help='Тип записей без поля type')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--no-create-authors', action='store_true',
+                            help='Пропускать записи неизвестных авторов вместо создания пользователей')
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        importer = Importer(options['batch_size'], not options['no_create_authors'], self.report_error)
+        self.reported = 0
+        for path in options['paths']:
+            fmt = options['format'] or ('csv' if path.endswith('.csv') else 'ndjson')
+            try:
+                for number, record in read_records(path, fmt):
+                    where = f'{path}:{number}'
+                    if isinstance(record, RecordError):
+                        importer.fail(where, str(record))
+                        continue
+                    importer.add(record.get('type', options['type']), record, where)
+            except OSError as error:
+                raise CommandError(f'Не удалось прочитать {path}: {error}')
+        importer.finish()
+
+        stats = importer.stats
+        elapsed = time.monotonic() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"Импортировано постов: {stats['posts']} (пропущено существующих: {stats['posts_skipped']}), "
+            f"комментариев: {stats['comments']}, новых авторов: {stats['authors']}, "
+            f"ошибок: {stats['errors']} за {elapsed:.1f} с"
+        ))
+
+    def report_error(self, where, message):
+        self.reported += 1
+        if self.reported <= MAX_REPORTED_ERRORS:
+            self.stderr.write(f'{where}: {message}')
+        elif self.reported == MAX_REPORTED_ERRORS + 1:
+            self.stderr.write('... остальные ошибки не показаны')
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from blog.models import Post
+from blog.search import get_backend
+
+
+class Command(BaseCommand):
+    help = 'Перестраивает поисковый индекс постов'
+
+    def handle(self, *args, **options):
+        posts = Post.objects.select_related('category').prefetch_related('tags')
+        get_backend().rebuild(posts.iterator(chunk_size=500))
+        self.stdout.write(self.style.SUCCESS(f'Проиндексировано постов: {posts.count()}'))
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from blog.models import AuthorStats, Post, Comment, Reaction
+
+
+def _count(model, field='post', **filters):
+    counts = (
+        model.objects.filter(**{field: OuterRef('pk')}, **filters)
+        .values(field)
+        .annotate(total=Count('*'))
+        .values('total')
+    )
+    return Coalesce(Subquery(counts), Value(0))
+
+
+def actual_counters():
+    """Фактические значения счётчиков, посчитанные по исходным таблицам"""
+    return {
+        'like_count': _count(Reaction, kind=Reaction.LIKE),
+        'dislike_count': _count(Reaction, kind=Reaction.DISLIKE),
+        'favorites_count': _count(Reaction, kind=Reaction.FAVORITE),
+        'comments_count': _count(Comment),
+    }
+
+
+class Command(BaseCommand):
+    help = 'Сверяет денормализованные счётчики постов и статистику авторов с исходными таблицами и исправляет расхождения'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--dry-run', action='store_true', help='Только показать расхождения')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        fields = list(actual_counters())
+        annotations = {f'actual_{field}': expression for field, expression in actual_counters().items()}
+        fixed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                Post.objects.filter(pk__gt=last_pk).order_by('pk')
+                .annotate(**annotations)
+                .only('pk', *fields)[:batch_size]
+            )
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            drifted = [
+                post.pk for post in batch
+                if any(getattr(post, field) != getattr(post, f'actual_{field}') for field in fields)
+            ]
+            if drifted and not options['dry_run']:
+                # Пересчитываем в самом UPDATE, чтобы не затереть параллельные изменения
+                Post.objects.filter(pk__in=drifted).update(**actual_counters())
+            fixed += len(drifted)
+        verb = 'Найдено' if options['dry_run'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(f'{verb} постов с расхождениями: {fixed}'))
+        # Статистика авторов сверяется после счётчиков постов, из которых она складывается
+        fixed = self.reconcile_author_stats(batch_size, options['dry_run'])
+        self.stdout.write(self.style.SUCCESS(f'{verb} авторов с расхождениями: {fixed}'))
+
+    def reconcile_author_stats(self, batch_size, dry_run):
+        fixed = 0
+        last_pk = 0
+        while True:
+            batch = list(AuthorStats.objects.filter(pk__gt=last_pk).order_by('pk')[:batch_size])
+            if not batch:
+                break
+            last_pk = batch[-1].pk
+            actual = AuthorStats.objects.actual([stats.pk for stats in batch])
+            drifted = [
+                stats.pk for stats in batch
+                if any(getattr(stats, field) != actual[stats.pk][field] for field in AuthorStats.FIELDS)
+            ]
+            if drifted and not dry_run:
+                AuthorStats.objects.refresh(drifted)
+            fixed += len(drifted)
+        return fixed
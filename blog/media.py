@@ -0,0 +1,109 @@
+"""
+Отдача загруженных файлов.
+
+Файлы из ContentAddressedStorage (имя - хэш содержимого) неизменяемы: отдаются
+с Cache-Control immutable на год и сильным ETag из хэша. Старые файлы с
+обычными именами получают ETag из размера и времени изменения и проверяются
+браузером заново. Поддерживаются условные запросы (304) и один диапазон Range (206).
+"""
+import mimetypes
+import os
+import re
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, HttpResponseNotModified, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.http import http_date, parse_etags, quote_etag
+from django.views import View
+
+from .storage import hash_from_name
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, max-age=0, must-revalidate'
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+CHUNK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """(начало, конец) включительно для одного диапазона; None - отдать файл целиком"""
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None  # Несколько диапазонов и прочие единицы не поддерживаем
+    start, end = match.groups()
+    if not start:
+        if not end:
+            return None
+        length = int(end)
+        if not length:
+            raise ValueError('Пустой диапазон')
+        return max(size - length, 0), size - 1
+    start = int(start)
+    end = min(int(end), size - 1) if end else size - 1
+    if start > end or start >= size:
+        raise ValueError('Диапазон вне файла')
+    return start, end
+
+
+def read_range(path, start, length):
+    with open(path, 'rb') as file:
+        file.seek(start)
+        while length > 0:
+            chunk = file.read(min(CHUNK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+
+
+class MediaFileView(View):
+    http_method_names = ['get', 'head']
+
+    def get(self, request, path):
+        try:
+            full_path = safe_join(settings.MEDIA_ROOT, path)
+        except Exception:
+            raise Http404('Файл не найден')
+        if not os.path.isfile(full_path):
+            raise Http404('Файл не найден')
+
+        stat = os.stat(full_path)
+        digest = hash_from_name(path)
+        if digest:
+            etag, cache_control = quote_etag(digest), IMMUTABLE_CACHE_CONTROL
+        else:
+            etag, cache_control = quote_etag(f'{stat.st_size:x}-{int(stat.st_mtime):x}'), REVALIDATE_CACHE_CONTROL
+
+        if etag in parse_etags(request.headers.get('If-None-Match', '')) or \
+                request.headers.get('If-None-Match', '').strip() == '*':
+            response = HttpResponseNotModified()
+            response['ETag'] = etag
+            response['Cache-Control'] = cache_control
+            return response
+
+        content_type = mimetypes.guess_type(full_path)[0] or 'application/octet-stream'
+        byte_range = None
+        range_header = request.headers.get('Range')
+        # If-Range: диапазон только если файл не изменился с момента первого ответа
+        if range_header and request.headers.get('If-Range', etag) == etag:
+            try:
+                byte_range = parse_range(range_header, stat.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{stat.st_size}'
+                return response
+
+        if byte_range is None:
+            response = FileResponse(open(full_path, 'rb'), content_type=content_type)
+            response['Content-Length'] = stat.st_size
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(
+                read_range(full_path, start, end - start + 1), status=206, content_type=content_type,
+            )
+            response['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            response['Content-Length'] = end - start + 1
+        response['Accept-Ranges'] = 'bytes'
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(stat.st_mtime)
+        response['Cache-Control'] = cache_control
+        return response
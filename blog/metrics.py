@@ -0,0 +1,214 @@
+"""
+Агрегированные метрики в текстовом формате Prometheus: задержка и число
+SQL-запросов по имени URL, ошибки, попадания в кэш, очередь счётчика просмотров.
+
+Каждый процесс копит метрики в памяти и не реже раза в FLUSH_INTERVAL секунд
+атомарно перезаписывает свой снимок <DIR>/<pid>.json. MetricsView (/metrics)
+складывает снимки всех процессов, поэтому при нескольких воркерах счётчики и
+гистограммы суммируются правильно. Гейджи берутся только у живых процессов.
+Каталог нужно очищать при перезапуске сервиса, как multiprocess-каталог
+prometheus_client.
+"""
+import atexit
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.http import HttpResponse, HttpResponseForbidden
+from django.views import View
+
+DEFAULTS = {
+    'ENABLED': True,
+    # Каталог снимков процессов; None - <tmp>/blog-metrics
+    'DIR': None,
+    'FLUSH_INTERVAL': 5,
+    # Если задан, /metrics требует заголовок Authorization: Bearer <TOKEN>;
+    # без токена метрики видны только при DEBUG и с адресов INTERNAL_IPS
+    'TOKEN': None,
+}
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+
+# Имя: (тип, описание, имена меток, границы корзин гистограммы)
+METRICS = {
+    'blog_http_requests_total': ('counter', 'Обработанные запросы', ('view', 'method', 'status'), None),
+    'blog_http_errors_total': ('counter', 'Ответы с кодом 5xx', ('view',), None),
+    'blog_http_request_duration_seconds': ('histogram', 'Время ответа', ('view',), LATENCY_BUCKETS),
+    'blog_db_queries_per_request': ('histogram', 'SQL-запросов на один HTTP-запрос', ('view',), QUERY_BUCKETS),
+    'blog_cache_requests_total': ('counter', 'Обращения к кэшам блога', ('cache', 'result'), None),
+    'blog_view_counter_pending': ('gauge', 'Просмотры в буфере, ещё не записанные в БД', (), None),
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'BLOG_METRICS', {}).get(name, DEFAULTS[name])
+
+
+def enabled():
+    return get_setting('ENABLED')
+
+
+def metrics_dir():
+    return get_setting('DIR') or os.path.join(tempfile.gettempdir(), 'blog-metrics')
+
+
+class Registry:
+    """Метрики одного процесса; значения с метками хранятся по JSON-списку меток"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.values = defaultdict(dict)
+        self.gauges = {}
+        self.last_flush = time.monotonic()
+
+    def inc(self, name, labels, amount=1):
+        key = json.dumps(labels)
+        with self.lock:
+            series = self.values[name]
+            series[key] = series.get(key, 0) + amount
+        self.maybe_flush()
+
+    def observe(self, name, labels, value):
+        buckets = METRICS[name][3]
+        key = json.dumps(labels)
+        with self.lock:
+            series = self.values[name]
+            # Корзины хранятся некумулятивно, последняя - +Inf; затем сумма и количество
+            state = series.setdefault(key, [0] * (len(buckets) + 1) + [0, 0])
+            index = next((i for i, bound in enumerate(buckets) if value <= bound), len(buckets))
+            state[index] += 1
+            state[-2] += value
+            state[-1] += 1
+        self.maybe_flush()
+
+    def register_gauge(self, name, callback):
+        """Значение гейджа вычисляется callback() в момент сброса снимка"""
+        self.gauges[name] = callback
+
+    def maybe_flush(self):
+        if time.monotonic() - self.last_flush >= get_setting('FLUSH_INTERVAL'):
+            self.flush()
+
+    def flush(self):
+        with self.lock:
+            snapshot = {
+                'pid': os.getpid(),
+                'values': {name: dict(series) for name, series in self.values.items()},
+                'gauges': {name: callback() for name, callback in self.gauges.items()},
+            }
+            self.last_flush = time.monotonic()
+        directory = metrics_dir()
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f'{os.getpid()}.json')
+        # Запись во временный файл и os.replace: читатель не увидит половину снимка
+        fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+        with os.fdopen(fd, 'w') as file:
+            json.dump(snapshot, file)
+        os.replace(tmp_path, path)
+
+
+registry = Registry()
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        registry.flush()
+    except Exception:
+        pass
+
+
+def observe_request(view, method, status, duration, queries):
+    registry.inc('blog_http_requests_total', [view, method, str(status)])
+    if status >= 500:
+        registry.inc('blog_http_errors_total', [view])
+    registry.observe('blog_http_request_duration_seconds', [view], duration)
+    registry.observe('blog_db_queries_per_request', [view], queries)
+
+
+def cache_access(cache_name, hit):
+    if enabled():
+        registry.inc('blog_cache_requests_total', [cache_name, 'hit' if hit else 'miss'])
+
+
+def _process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except OSError:
+        pass  # Процесс есть, но чужой
+    return True
+
+
+def collect():
+    """Сумма снимков всех процессов: {имя: {ключ меток: значение}}"""
+    registry.flush()
+    totals = defaultdict(dict)
+    directory = metrics_dir()
+    for filename in os.listdir(directory):
+        if not filename.endswith('.json'):
+            continue
+        try:
+            with open(os.path.join(directory, filename)) as file:
+                snapshot = json.load(file)
+        except (OSError, ValueError):
+            continue  # Файл удалили или он повреждён
+        for name, series in snapshot['values'].items():
+            for key, value in series.items():
+                if isinstance(value, list):
+                    current = totals[name].get(key) or [0] * len(value)
+                    totals[name][key] = [a + b for a, b in zip(current, value)]
+                else:
+                    totals[name][key] = totals[name].get(key, 0) + value
+        if _process_alive(snapshot['pid']):
+            for name, value in snapshot['gauges'].items():
+                totals[name]['[]'] = totals[name].get('[]', 0) + value
+    return totals
+
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def render():
+    """Текстовый формат экспозиции Prometheus 0.0.4"""
+    totals = collect()
+    lines = []
+    for name, (kind, description, label_names, buckets) in METRICS.items():
+        lines.append(f'# HELP {name} {description}')
+        lines.append(f'# TYPE {name} {kind}')
+        for key, value in sorted(totals.get(name, {}).items()):
+            labels = json.loads(key)
+            if kind != 'histogram':
+                lines.append(f'{name}{_format_labels(label_names, labels)} {value}')
+                continue
+            cumulative = 0
+            for bound, count in zip((*buckets, '+Inf'), value):
+                cumulative += count
+                le = (('le', bound),)
+                lines.append(f'{name}_bucket{_format_labels(label_names, labels, le)} {cumulative}')
+            lines.append(f'{name}_sum{_format_labels(label_names, labels)} {value[-2]}')
+            lines.append(f'{name}_count{_format_labels(label_names, labels)} {value[-1]}')
+    return '\n'.join(lines) + '\n'
+
+
+class MetricsView(View):
+    def get(self, request):
+        token = get_setting('TOKEN')
+        if token:
+            allowed = request.headers.get('Authorization') == f'Bearer {token}'
+        else:
+            allowed = settings.DEBUG or request.META.get('REMOTE_ADDR') in settings.INTERNAL_IPS
+        if not allowed:
+            return HttpResponseForbidden()
+        return HttpResponse(render(), content_type='text/plain; version=0.0.4; charset=utf-8')
@@ -0,0 +1,38 @@
+from django.db import migrations
+
+from blog.search import build_document
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        "CREATE VIRTUAL TABLE IF NOT EXISTS blog_post_search USING fts5("
+        "title, body, category, tags, translit, "
+        "tokenize = 'unicode61 remove_diacritics 2')"
+    )
+    Post = apps.get_model('blog', 'Post')
+    for post in Post.objects.select_related('category').prefetch_related('tags'):
+        document = build_document(post.title, post.text, post.category.name, [tag.name for tag in post.tags.all()])
+        schema_editor.execute(
+            'INSERT INTO blog_post_search (rowid, title, body, category, tags, translit) '
+            'VALUES (%s, %s, %s, %s, %s, %s)',
+            [post.pk, document['title'], document['body'], document['category'],
+             document['tags'], document['translit']],
+        )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS blog_post_search')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0024_comment_level'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
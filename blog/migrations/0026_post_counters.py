@@ -0,0 +1,52 @@
+# Generated by Django 5.2.2 on 2026-10-18 14:02
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def fill_counters(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Comment = apps.get_model('blog', 'Comment')
+
+    def count(model):
+        counts = model.objects.filter(post=OuterRef('pk')).values('post').annotate(total=Count('*')).values('total')
+        return Coalesce(Subquery(counts), Value(0))
+
+    Post.objects.update(
+        like_count=count(Post.liked_users.through),
+        dislike_count=count(Post.disliked_users.through),
+        favorites_count=count(Post.favorites_users.through),
+        comments_count=count(Comment),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0025_post_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comments_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество комментариев'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='dislike_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество дизлайков'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество лайков'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.2 on 2026-10-18 14:04
+
+from django.db import migrations, models
+
+PATH_SEGMENT_WIDTH = 10
+
+
+def fill_paths(apps, schema_editor):
+    Comment = apps.get_model('blog', 'Comment')
+    # Родитель всегда создан раньше ответа, поэтому его путь уже посчитан
+    paths = {}
+    changed = []
+    for comment in Comment.objects.order_by('id').only('id', 'parent_id', 'path').iterator():
+        parent_path = paths.get(comment.parent_id)
+        comment.path = f'{parent_path}{comment.parent_id:0{PATH_SEGMENT_WIDTH}d}/' if comment.parent_id else ''
+        paths[comment.id] = comment.path
+        changed.append(comment)
+    Comment.objects.bulk_update(changed, ['path'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0026_post_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='path',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=100, verbose_name='Путь в дереве'),
+        ),
+        migrations.RunPython(fill_paths, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.2 on 2026-10-18 14:12
+
+import django.db.models.functions.text
+from django.db import migrations, models
+
+
+def merge_duplicate_tags(apps, schema_editor):
+    Tag = apps.get_model('blog', 'Tag')
+    PostTag = apps.get_model('blog', 'Post').tags.through
+    # Оставляем самый старый тег из группы, посты остальных переносим на него
+    keep = {}
+    for tag in Tag.objects.order_by('id'):
+        name = ' '.join(tag.name.split()).lower()
+        if name not in keep:
+            keep[name] = tag
+            if tag.name != name:
+                tag.name = name
+                tag.save(update_fields=['name'])
+            continue
+        target = keep[name]
+        tagged = set(PostTag.objects.filter(tag_id=target.id).values_list('post_id', flat=True))
+        PostTag.objects.filter(tag_id=tag.id).exclude(post_id__in=tagged).update(tag_id=target.id)
+        tag.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0028_comment_write_path'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicate_tags, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='tag',
+            constraint=models.UniqueConstraint(django.db.models.functions.text.Lower('name'), name='tag_name_lower_unique'),
+        ),
+    ]
@@ -0,0 +1,95 @@
+# Generated by Django 5.2.2 on 2026-10-18 14:40
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+# Старые M2M-поля поста и вид реакции, в который они переходят
+LEGACY_FIELDS = {'liked_users': 'like', 'disliked_users': 'dislike', 'favorites_users': 'favorite'}
+BATCH_SIZE = 5000
+
+
+def copy_to_reactions(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Reaction = apps.get_model('blog', 'Reaction')
+    liked = Post.liked_users.through.objects.filter(post_id=OuterRef('post_id'), user_id=OuterRef('user_id'))
+    for field, kind in LEGACY_FIELDS.items():
+        rows = getattr(Post, field).through.objects.all()
+        if kind == 'dislike':
+            # Лайк и дизлайк одного пользователя на посте больше не допускаются: остаётся лайк
+            rows = rows.exclude(Exists(liked))
+        batch = []
+        for post_id, user_id in rows.values_list('post_id', 'user_id').iterator(chunk_size=BATCH_SIZE):
+            batch.append(Reaction(post_id=post_id, user_id=user_id, kind=kind))
+            if len(batch) >= BATCH_SIZE:
+                Reaction.objects.bulk_create(batch)
+                batch = []
+        Reaction.objects.bulk_create(batch)
+
+    def count(kind):
+        counts = (
+            Reaction.objects.filter(post=OuterRef('pk'), kind=kind)
+            .values('post').annotate(total=Count('*')).values('total')
+        )
+        return Coalesce(Subquery(counts), Value(0))
+
+    Post.objects.update(like_count=count('like'), dislike_count=count('dislike'), favorites_count=count('favorite'))
+
+
+def copy_from_reactions(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    Reaction = apps.get_model('blog', 'Reaction')
+    for field, kind in LEGACY_FIELDS.items():
+        through = getattr(Post, field).through
+        rows = []
+        for post_id, user_id in Reaction.objects.filter(kind=kind).values_list('post_id', 'user_id').iterator(
+                chunk_size=BATCH_SIZE):
+            rows.append(through(post_id=post_id, user_id=user_id))
+            if len(rows) >= BATCH_SIZE:
+                through.objects.bulk_create(rows, ignore_conflicts=True)
+                rows = []
+        through.objects.bulk_create(rows, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0031_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Reaction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('like', 'Лайк'), ('dislike', 'Дизлайк'), ('favorite', 'Избранное')], max_length=10, verbose_name='Вид')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата')),
+                ('post', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to='blog.post', verbose_name='Пост')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reactions', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Реакция',
+                'verbose_name_plural': 'Реакции',
+                'db_table': 'blog_reactions',
+                'indexes': [models.Index(fields=['post', 'kind', 'user'], name='reaction_post_kind')],
+                'constraints': [models.UniqueConstraint(fields=('user', 'kind', 'post'), name='reaction_unique'), models.UniqueConstraint(condition=models.Q(('kind__in', ['like', 'dislike'])), fields=('user', 'post'), name='reaction_single_vote')],
+            },
+        ),
+        migrations.RunPython(copy_to_reactions, copy_from_reactions),
+        migrations.RemoveField(
+            model_name='post',
+            name='disliked_users',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='favorites_users',
+        ),
+        migrations.RemoveField(
+            model_name='post',
+            name='liked_users',
+        ),
+    ]
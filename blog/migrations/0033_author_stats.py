@@ -0,0 +1,52 @@
+# Generated by Django 5.2.2 on 2026-10-18 14:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def fill_author_stats(apps, schema_editor):
+    Post = apps.get_model('blog', 'Post')
+    AuthorStats = apps.get_model('blog', 'AuthorStats')
+    rows = (
+        Post.objects.filter(status='published').order_by().values('author_id')
+        .annotate(published_posts=Count('pk'), likes_received=Sum('like_count'),
+                  views_received=Sum('views_count'), comments_count=Sum('comments_count'))
+    )
+    # Остальные пользователи получат строку при первом открытии профиля
+    AuthorStats.objects.bulk_create(
+        [AuthorStats(user_id=row.pop('author_id'), **row) for row in rows.iterator()], batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('auth', '0012_alter_user_first_name_max_length'),
+        ('blog', '0032_reactions'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='author_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('published_posts', models.IntegerField(default=0, verbose_name='Опубликовано постов')),
+                ('likes_received', models.IntegerField(default=0, verbose_name='Получено лайков')),
+                ('views_received', models.IntegerField(default=0, verbose_name='Просмотров постов')),
+                ('comments_count', models.IntegerField(default=0, verbose_name='Комментариев к постам')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+                'db_table': 'blog_author_stats',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['author', 'created_at', 'id'], name='post_author_recent'),
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.2 on 2026-10-18 15:30
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0033_author_stats'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='reaction',
+            index=models.Index(fields=['user', 'kind', 'created_at'], name='reaction_user_recent'),
+        ),
+    ]
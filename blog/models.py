@@ -1,13 +1,44 @@
+from collections import Counter, defaultdict
+
 from django.db import models
+from django.db.models import Count, Exists, F, OuterRef, Q, Sum, Value
+from django.db.models.functions import Length, Lower
+from django.db.models.lookups import Exact
 from django.contrib.auth import get_user_model
 from django.utils.text import slugify
 from unidecode import unidecode
 from django.urls import reverse
+
+from .cache import bump_version, comments_version_name
+from .events import publish
 # from django.contrib.auth.models import User
 
 
 User = get_user_model()
 
+
+class PostQuerySet(models.QuerySet):
+    def published(self):
+        return self.filter(status='published')
+
+    def cards(self, user=None):
+        """Посты для карточек списков: связанные объекты, теги и флаги пользователя без N+1"""
+        queryset = self.select_related('category', 'author').prefetch_related('tags')
+        if user is not None and user.is_authenticated:
+            return queryset.annotate(
+                is_favorited=Reaction.objects.exists_for(user, Reaction.FAVORITE),
+                is_viewed=Exists(Post.viewed_users.through.objects.filter(post=OuterRef('pk'), user=user)),
+            )
+        return queryset.annotate(is_favorited=Value(False), is_viewed=Value(False))
+
+    def tagged(self, tag):
+        """
+        Посты с тегом через EXISTS, а не JOIN: план идёт по индексу постов в порядке
+        created_at и проверяет связь по уникальному индексу (post, tag) без сортировки
+        """
+        return self.filter(Exists(Post.tags.through.objects.filter(post=OuterRef('pk'), tag=tag)))
+
+
 class Post(models.Model):
     STATUS_CHOICES = [
         ('published', 'Опубликовано'),
@@ -26,23 +57,222 @@ class Post(models.Model):
     status = models.CharField(choices=STATUS_CHOICES, default='draft', verbose_name="Статус")
     views_count = models.PositiveIntegerField(default=0, verbose_name="Количество просмотров")
     viewed_users = models.ManyToManyField(User, related_name='viewed_posts', blank=True, verbose_name="Просмотренные пользователи")
-    liked_users = models.ManyToManyField(User, related_name='liked_posts', blank=True, verbose_name="Лайки")
-    disliked_users = models.ManyToManyField(User, related_name='disliked_posts', blank=True, verbose_name="Дизлайки")
-    favorites_users = models.ManyToManyField(User, related_name='favorite_posts', blank=True, verbose_name="В избранном у")
+    # Лайки, дизлайки и избранное - строки Reaction (post.reactions)
+    # Денормализованные счётчики: меняются атомарно через adjust_counters, сверяются командой reconcile_counters
+    like_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество лайков")
+    dislike_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество дизлайков")
+    favorites_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество добавлений в избранное")
+    comments_count = models.PositiveIntegerField(default=0, editable=False, verbose_name="Количество комментариев")
+    # Уменьшенные копии изображения (см. images.py): заполняются фоновым обработчиком
+    image_variants = models.JSONField(default=dict, blank=True, editable=False, verbose_name="Варианты изображения")
+
+    objects = PostQuerySet.as_manager()
 
     class Meta:
         verbose_name= "Пост"
         verbose_name_plural = "Посты"
         db_table = "blog_posts"
+        indexes = [
+            # Списки и keyset-пагинация: status='published' ORDER BY created_at, id (в обе стороны)
+            models.Index(fields=['created_at', 'id'], condition=Q(status='published'), name='post_published_recent'),
+            models.Index(fields=['category', 'created_at', 'id'], condition=Q(status='published'),
+                         name='post_category_recent'),
+            # Профиль автора: посты автора ORDER BY created_at, id (черновики видит только сам автор)
+            models.Index(fields=['author', 'created_at', 'id'], name='post_author_recent'),
+        ]
+
+    # Поля, которые обновляются только атомарно и не должны перезаписываться при save()
+    COUNTER_FIELDS = ('like_count', 'dislike_count', 'favorites_count', 'comments_count', 'views_count')
+    # Поля, которые пишутся фоновыми задачами через update()
+    BACKGROUND_FIELDS = ('image_variants',)
 
     def save (self, *args, **kwargs):
         self.slug = slugify(unidecode(self.title))
+        if not self._state.adding and kwargs.get('update_fields') is None and not kwargs.get('force_insert'):
+            # Не затираем счётчики и результаты фоновых задач устаревшими значениями из экземпляра
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.COUNTER_FIELDS + self.BACKGROUND_FIELDS
+            ]
         super().save(*args, **kwargs)
 
+    def adjust_counters(self, **deltas):
+        """Атомарно изменяет счётчики через F() и подтягивает новые значения в экземпляр"""
+        deltas = {field: delta for field, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        Post.objects.filter(pk=self.pk).update(**{field: F(field) + delta for field, delta in deltas.items()})
+        AuthorStats.objects.add_post_deltas({self.pk: deltas})
+        self.refresh_from_db(fields=list(deltas))
+        publish(self.pk, 'counters', {field: getattr(self, field) for field in deltas})
+
     def __str__(self):
         return self.title
 
 
+class AuthorStatsQuerySet(models.QuerySet):
+    def actual(self, user_ids):
+        """Значения статистики, посчитанные по опубликованным постам: {user_id: {поле: значение}}"""
+        totals = {user_id: dict.fromkeys(AuthorStats.FIELDS, 0) for user_id in user_ids}
+        rows = (
+            Post.objects.published().filter(author_id__in=totals).order_by().values('author_id')
+            .annotate(published_posts=Count('pk'), **{
+                stat: Sum(field) for field, stat in AuthorStats.POST_COUNTERS.items()
+            })
+        )
+        for row in rows:
+            totals[row.pop('author_id')].update(row)
+        return totals
+
+    def refresh(self, user_ids):
+        """Пересчитывает строки авторов по их постам; недостающие строки создаются"""
+        return self.bulk_create(
+            [AuthorStats(user_id=user_id, **values) for user_id, values in self.actual(user_ids).items()],
+            update_conflicts=True, unique_fields=['user'], update_fields=AuthorStats.FIELDS,
+        )
+
+    def for_user(self, user):
+        """Строка статистики автора; если её ещё нет, считается по его постам"""
+        stats = self.filter(user=user).first()
+        if stats is None:
+            stats, = self.refresh([user.pk])
+        return stats
+
+    def add(self, changes):
+        """
+        Прибавляет {user_id: {поле: прирост}} через F(): один UPDATE на каждое
+        значение прироста. Строк нет только у пользователей, созданных через bulk_create,
+        их пропускаем - строку посчитает for_user.
+        """
+        by_delta = defaultdict(list)
+        for user_id, deltas in changes.items():
+            deltas = frozenset((field, delta) for field, delta in deltas.items() if delta)
+            if deltas:
+                by_delta[deltas].append(user_id)
+        for deltas, user_ids in by_delta.items():
+            self.filter(user_id__in=user_ids).update(**{field: F(field) + delta for field, delta in deltas})
+
+    def add_post_deltas(self, post_deltas):
+        """Переносит изменения счётчиков постов {post_id: {счётчик: прирост}} на авторов опубликованных постов"""
+        post_deltas = {
+            post_id: {AuthorStats.POST_COUNTERS[field]: delta for field, delta in deltas.items()
+                      if field in AuthorStats.POST_COUNTERS and delta}
+            for post_id, deltas in post_deltas.items()
+        }
+        post_deltas = {post_id: deltas for post_id, deltas in post_deltas.items() if deltas}
+        if not post_deltas:
+            return
+        changes = defaultdict(Counter)
+        for post_id, author_id in Post.objects.published().filter(pk__in=post_deltas).values_list('pk', 'author_id'):
+            changes[author_id].update(post_deltas[post_id])
+        self.add(changes)
+
+
+class AuthorStats(models.Model):
+    """
+    Статистика автора по опубликованным постам для шапки профиля. Меняется
+    на приросты вместе со счётчиками постов и сменой статуса (signals.py),
+    сверяется командой reconcile_counters.
+    """
+    # Счётчик поста -> поле статистики автора
+    POST_COUNTERS = {'like_count': 'likes_received', 'views_count': 'views_received',
+                     'comments_count': 'comments_count'}
+    FIELDS = ['published_posts', *POST_COUNTERS.values()]
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name='author_stats',
+                                verbose_name="Пользователь")
+    published_posts = models.IntegerField(default=0, verbose_name="Опубликовано постов")
+    likes_received = models.IntegerField(default=0, verbose_name="Получено лайков")
+    views_received = models.IntegerField(default=0, verbose_name="Просмотров постов")
+    comments_count = models.IntegerField(default=0, verbose_name="Комментариев к постам")
+
+    objects = AuthorStatsQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Статистика автора"
+        verbose_name_plural = "Статистика авторов"
+        db_table = "blog_author_stats"
+
+    @staticmethod
+    def post_totals(counters, sign=1):
+        """Вклад одного опубликованного поста в статистику автора"""
+        return {
+            'published_posts': sign,
+            **{stat: sign * counters.get(field, 0) for field, stat in AuthorStats.POST_COUNTERS.items()},
+        }
+
+    def __str__(self):
+        return f'{self.user_id}: {self.published_posts}'
+
+
+# Отметка "просмотрено" в состоянии пользователя рядом с видами реакций
+VIEWED = 'viewed'
+
+
+class ReactionQuerySet(models.QuerySet):
+    def exists_for(self, user, kind):
+        """EXISTS для аннотации постов: есть ли у пользователя реакция этого вида"""
+        return Exists(self.filter(post=OuterRef('pk'), user=user, kind=kind))
+
+    def user_states(self, user, post_ids):
+        """
+        Отметки пользователя на постах одним запросом (UNION реакций и просмотров):
+        {post_id: {'like', 'favorite', 'viewed', ...}}
+        """
+        viewed = (
+            Post.viewed_users.through.objects.filter(user=user, post_id__in=post_ids)
+            .annotate(kind=Value(VIEWED)).values_list('post_id', 'kind')
+        )
+        rows = self.filter(user=user, post_id__in=post_ids).values_list('post_id', 'kind').union(viewed, all=True)
+        states = {}
+        for post_id, kind in rows:
+            states.setdefault(post_id, set()).add(kind)
+        return states
+
+
+class Reaction(models.Model):
+    """Лайк, дизлайк или избранное: одна строка на пользователя, пост и вид реакции"""
+    LIKE = 'like'
+    DISLIKE = 'dislike'
+    FAVORITE = 'favorite'
+    KIND_CHOICES = [
+        (LIKE, 'Лайк'),
+        (DISLIKE, 'Дизлайк'),
+        (FAVORITE, 'Избранное'),
+    ]
+    # Денормализованный счётчик поста для каждого вида реакции
+    COUNTER_FIELDS = {LIKE: 'like_count', DISLIKE: 'dislike_count', FAVORITE: 'favorites_count'}
+    VOTES = (LIKE, DISLIKE)
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='reactions', verbose_name="Пользователь")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='reactions', verbose_name="Пост")
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES, verbose_name="Вид")
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата")
+
+    objects = ReactionQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = "Реакция"
+        verbose_name_plural = "Реакции"
+        db_table = "blog_reactions"
+        constraints = [
+            # Индекс (user, kind, post): "что отметил пользователь" и проверка одной реакции
+            models.UniqueConstraint(fields=['user', 'kind', 'post'], name='reaction_unique'),
+            # Лайк и дизлайк взаимоисключающие - не больше одного голоса на пост
+            models.UniqueConstraint(fields=['user', 'post'], condition=Q(kind__in=['like', 'dislike']),
+                                    name='reaction_single_vote'),
+        ]
+        indexes = [
+            # "Кто отреагировал на пост"
+            models.Index(fields=['post', 'kind', 'user'], name='reaction_post_kind'),
+            # Избранное пользователя от новых отметок к старым
+            models.Index(fields=['user', 'kind', 'created_at'], name='reaction_user_recent'),
+        ]
+
+    def __str__(self):
+        return f'{self.get_kind_display()}: {self.user_id} -> {self.post_id}'
+
+
 class Category(models.Model):
     name = models.CharField(max_length=100, verbose_name="Название")
     slug = models.SlugField(unique=True, editable=False, verbose_name="URL")
@@ -77,6 +307,9 @@ class Tag(models.Model):
         verbose_name = "Тег"
         verbose_name_plural = "Теги"
         db_table = "blog_tags"
+        constraints = [
+            models.UniqueConstraint(Lower('name'), name='tag_name_lower_unique'),
+        ]
         
     def __str__(self):
         return f'#{self.name}'
@@ -85,37 +318,120 @@ class Tag(models.Model):
         return reverse('blog:tag_posts', args=[self.slug])
 
 
+# Ширина сегмента id в материализованном пути комментария (с ведущими нулями для сортировки строк)
+COMMENT_PATH_SEGMENT_WIDTH = 10
+# Максимальный уровень вложенности ответа (корень - уровень 0)
+COMMENT_MAX_LEVEL = 6
+
+
+def subtree_q(comments):
+    """Условие на ответы (любой глубины) к перечисленным комментариям"""
+    conditions = Q()
+    for comment in comments:
+        prefix = comment.subtree_prefix
+        # Диапазон вместо LIKE, чтобы работал индекс: '0' - следующий символ после '/'
+        conditions |= Q(path__gte=prefix, path__lt=prefix[:-1] + '0')
+    return conditions
+
+
+class CommentQuerySet(models.QuerySet):
+    def roots(self):
+        return self.filter(parent__isnull=True)
+
+    def threads(self, roots):
+        """Все ответы в ветках перечисленных корневых комментариев - одним запросом по path"""
+        conditions = subtree_q(roots)
+        if not conditions:
+            return self.none()
+        return self.filter(conditions)
+
+    def with_replies(self, comments):
+        """Сами комментарии и все ответы на них"""
+        comments = list(comments)
+        return self.filter(Q(pk__in=[comment.pk for comment in comments]) | subtree_q(comments))
+
+    def delete(self):
+        """Удаляет комментарии вместе со всеми ответами: parent без каскада, иначе ответы нарушат FK"""
+        return self.delete_with_replies(self.only('pk', 'post_id', 'path'))
+
+    def delete_with_replies(self, comments):
+        """Один DELETE по id и path; блоки комментариев затронутых постов устаревают"""
+        comments = list(comments)
+        if not comments:
+            return 0, {}
+        # Ответы ищем по всей таблице, а не внутри фильтров текущей выборки
+        replies = self.model._default_manager.db_manager(self.db).with_replies(comments)
+        result = models.QuerySet.delete(replies)
+        for post_id in {comment.post_id for comment in comments}:
+            bump_version(comments_version_name(post_id))
+        return result
+
+
 class Comment(models.Model):
+    PATH_SEGMENT_WIDTH = COMMENT_PATH_SEGMENT_WIDTH
+
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name='comments', verbose_name="Пост")
     author = models.ForeignKey(User, on_delete=models.CASCADE, related_name='comments', verbose_name="Автор")
     text = models.TextField(verbose_name="Текст комментария")
     created_at = models.DateTimeField(auto_now_add=True, verbose_name="Дата создания")
     updated_at = models.DateTimeField(auto_now=True, verbose_name="Дата обновления")
-    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.CASCADE, related_name='replies', verbose_name="Родительский комментарий")
+    # DO_NOTHING: ветка удаляется одним DELETE по path (см. CommentQuerySet.delete), без каскада Django по каждому ответу
+    parent = models.ForeignKey('self', null=True, blank=True, on_delete=models.DO_NOTHING, related_name='replies', verbose_name="Родительский комментарий")
     is_edited = models.BooleanField(default=False, verbose_name="Отредактирован")
     level = models.PositiveIntegerField(default=0, verbose_name="Уровень вложенности")
+    # Материализованный путь: id предков от корня, например "0000000001/0000000007/"
+    path = models.CharField(max_length=100, blank=True, default='', editable=False, db_index=True, verbose_name="Путь в дереве")
+
+    objects = CommentQuerySet.as_manager()
 
     class Meta:
         verbose_name = "Комментарий"
         verbose_name_plural = "Комментарии"
         db_table = "blog_comments"
         ordering = ['created_at']
+        indexes = [
+            # Корневые комментарии поста по времени (страница поста, "ещё комментарии")
+            models.Index(fields=['post', 'created_at', 'id'], condition=Q(parent__isnull=True),
+                         name='comment_post_roots'),
+        ]
+        constraints = [
+            models.CheckConstraint(
+                condition=Q(level__lte=COMMENT_MAX_LEVEL),
+                name='comment_level_max',
+            ),
+            # Уровень равен числу предков в path
+            models.CheckConstraint(
+                condition=Exact(Length('path'), F('level') * (COMMENT_PATH_SEGMENT_WIDTH + 1)),
+                name='comment_level_matches_path',
+            ),
+        ]
 
     def save(self, *args, **kwargs):
         if self.parent:
-            # Вычисляем уровень, проходя по всей цепочке parent
-            current = self.parent
-            self.level = 0
-            while current:
-                self.level += 1
-                current = current.parent
+            # Уровень и путь берём у родителя, без обхода всей цепочки
+            self.level = self.parent.level + 1
             
             # Проверяем, не превышен ли лимит вложенности (7 уровней)
-            if self.level >= 7:
+            if self.level > COMMENT_MAX_LEVEL:
                 raise ValueError("Достигнут максимальный уровень вложенности комментариев (7)")
+            self.path = self.parent.subtree_prefix
         else:
             self.level = 0  # Корневой комментарий
+            self.path = ''
         super().save(*args, **kwargs)
+        # Закэшированный блок комментариев поста устарел
+        bump_version(comments_version_name(self.post_id))
+
+    def delete(self, using=None, keep_parents=False):
+        """Удаляет комментарий вместе со всеми ответами одним DELETE"""
+        result = Comment.objects.using(using).delete_with_replies([self])
+        publish(self.post_id, 'comment_deleted', {'id': self.pk})
+        return result
+
+    @property
+    def subtree_prefix(self):
+        """Префикс path у всех потомков комментария"""
+        return f'{self.path}{self.pk:0{self.PATH_SEGMENT_WIDTH}d}/'
 
     def __str__(self):
-        return f"Комментарий от {self.author.username} к {self.post.title}"
\ No newline at end of file
+        return f"Комментарий от {self.author.username} к {self.post.title}"
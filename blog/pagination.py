@@ -0,0 +1,102 @@
+import base64
+import json
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+class CursorPage:
+    """Страница keyset-пагинации (совместима по интерфейсу с Page там, где это нужно шаблонам)"""
+
+    def __init__(self, object_list, next_cursor, previous_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+
+class CursorPaginator:
+    """
+    Пагинация по ключу (created_at, id) вместо OFFSET.
+    Каждая страница - это один запрос с WHERE по индексу и LIMIT per_page + 1,
+    без COUNT(*), поэтому время не зависит от номера страницы.
+    Курсоры непрозрачны для клиента: base64 от JSON с позицией и направлением.
+    """
+
+    def __init__(self, queryset, per_page):
+        self.queryset = queryset
+        self.per_page = per_page
+
+    @staticmethod
+    def encode_cursor(post, direction):
+        payload = {'c': post.created_at.isoformat(), 'i': post.pk, 'd': direction}
+        raw = json.dumps(payload, separators=(',', ':')).encode()
+        return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+    @staticmethod
+    def decode_cursor(cursor):
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+            created_at = parse_datetime(payload['c'])
+            pk = int(payload['i'])
+            direction = payload['d']
+        except (ValueError, TypeError, KeyError, json.JSONDecodeError):
+            raise InvalidCursor('Некорректный курсор пагинации')
+        if created_at is None or direction not in ('next', 'prev'):
+            raise InvalidCursor('Некорректный курсор пагинации')
+        return created_at, pk, direction
+
+    def page(self, cursor=None):
+        """Возвращает CursorPage после (next) или до (prev) позиции курсора"""
+        queryset = self.queryset
+        direction = 'next'
+        if cursor:
+            created_at, pk, direction = self.decode_cursor(cursor)
+            if direction == 'next':
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, pk__lt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, pk__gt=pk)
+                )
+
+        if direction == 'next':
+            rows = list(queryset.order_by('-created_at', '-pk')[:self.per_page + 1])
+        else:
+            rows = list(queryset.order_by('created_at', 'pk')[:self.per_page + 1])
+
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if direction == 'prev':
+            rows.reverse()
+
+        if not rows:
+            return CursorPage([], None, None)
+
+        has_next = has_more if direction == 'next' else True
+        has_previous = bool(cursor) if direction == 'next' else has_more
+        return CursorPage(
+            rows,
+            self.encode_cursor(rows[-1], 'next') if has_next else None,
+            self.encode_cursor(rows[0], 'prev') if has_previous else None,
+        )
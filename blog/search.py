@@ -0,0 +1,251 @@
+"""
+Полнотекстовый поиск по постам.
+
+Индекс хранится отдельно от blog_posts и обновляется сигналами (см. signals.py)
+через index_on_commit - один раз на пост за транзакцию.
+Бэкенд выбирается настройкой BLOG_SEARCH_BACKEND; по умолчанию на SQLite
+используется виртуальная таблица FTS5, на остальных СУБД - поиск через ORM.
+"""
+import re
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.html import escape
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+from unidecode import unidecode
+
+# Поля, по которым можно искать, и соответствующие колонки индекса
+FIELD_COLUMNS = {
+    'text': ('title', 'body', 'translit'),
+    'category': ('category',),
+    'tags': ('tags',),
+}
+
+# Частые окончания русских слов: отрезаем их у слов запроса и ищем по префиксу,
+# чтобы "москвы" находило "москва", а "постами" - "пост"
+RUSSIAN_ENDINGS = sorted([
+    'иями', 'ями', 'ами', 'ией', 'иям', 'ием', 'иях', 'ого', 'его', 'ому', 'ему',
+    'ыми', 'ими', 'ой', 'ей', 'ий', 'ый', 'ая', 'яя', 'ое', 'ее', 'ие', 'ые',
+    'ам', 'ям', 'ах', 'ях', 'ом', 'ем', 'ов', 'ев', 'ью', 'ия', 'ию', 'ии',
+    'а', 'я', 'о', 'е', 'ы', 'и', 'у', 'ю', 'ь',
+], key=len, reverse=True)
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+MARK_START, MARK_END = '\x02', '\x03'
+
+
+def fold_yo(text):
+    return (text or '').replace('ё', 'е').replace('Ё', 'Е')
+
+
+def normalize(text):
+    """Нижний регистр (в том числе для кириллицы) и ё -> е"""
+    return fold_yo(text).lower()
+
+
+def transliterate(text):
+    return unidecode(normalize(text)).lower()
+
+
+def stem(word):
+    """Лёгкий стеммер: отрезает окончание, оставляя основу не короче 3 символов"""
+    if len(word) <= 4:
+        return word
+    for ending in RUSSIAN_ENDINGS:
+        if word.endswith(ending) and len(word) - len(ending) >= 3:
+            return word[:-len(ending)]
+    return word
+
+
+def query_terms(query):
+    """Слова запроса с вариантами написания: основа и её транслитерация"""
+    terms = []
+    for word in WORD_RE.findall(normalize(query)):
+        base = stem(word)
+        variants = list(dict.fromkeys([base, transliterate(base)]))
+        terms.append(variants)
+    return terms
+
+
+def build_document(title, text, category_name, tag_names):
+    """
+    Строка индекса для поста (только простые значения - используется и в миграциях).
+    Регистр сохраняется для фрагментов: токенизатор FTS5 сам приводит кириллицу к нижнему регистру.
+    """
+    tags = ' '.join(tag_names)
+    return {
+        'title': fold_yo(title),
+        'body': fold_yo(text),
+        'category': f'{normalize(category_name)} {transliterate(category_name)}',
+        'tags': f'{normalize(tags)} {transliterate(tags)}',
+        'translit': transliterate(f'{title} {text}'),
+    }
+
+
+def document_for_post(post):
+    return build_document(post.title, post.text, post.category.name, [tag.name for tag in post.tags.all()])
+
+
+def highlight(snippet):
+    """Экранирует фрагмент и превращает маркеры совпадений в <mark>"""
+    html = escape(snippet).replace(MARK_START, '<mark>').replace(MARK_END, '</mark>')
+    return mark_safe(html)
+
+
+@dataclass
+class SearchHit:
+    post_id: int
+    rank: float
+    snippet: str = ''
+
+
+class BaseSearchBackend:
+    def index(self, post):
+        raise NotImplementedError
+
+    def remove(self, post_id):
+        raise NotImplementedError
+
+    def search(self, query, fields=('text',), limit=None):
+        """Возвращает список SearchHit, отсортированный по релевантности"""
+        raise NotImplementedError
+
+    def rebuild(self, posts):
+        for post in posts:
+            self.index(post)
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """Запасной вариант без индекса: icontains по полям поста"""
+
+    def index(self, post):
+        pass
+
+    def remove(self, post_id):
+        pass
+
+    def search(self, query, fields=('text',), limit=None):
+        from .models import Post
+
+        conditions = Q()
+        for word in WORD_RE.findall(query):
+            word_conditions = Q()
+            if 'text' in fields:
+                word_conditions |= Q(title__icontains=word) | Q(text__icontains=word)
+            if 'category' in fields:
+                word_conditions |= Q(category__name__icontains=word)
+            if 'tags' in fields:
+                word_conditions |= Q(tags__name__icontains=word)
+            conditions &= word_conditions
+        if not conditions:
+            return []
+        ids = Post.objects.filter(conditions).order_by('-created_at').values_list('pk', flat=True).distinct()
+        if limit:
+            ids = ids[:limit]
+        return [SearchHit(post_id=pk, rank=position) for position, pk in enumerate(ids)]
+
+
+class SQLiteFTS5Backend(BaseSearchBackend):
+    """Инвертированный индекс в виртуальной таблице FTS5, rowid = id поста"""
+    table = 'blog_post_search'
+    # Веса колонок для bm25: title, body, category, tags, translit
+    weights = (10.0, 1.0, 4.0, 6.0, 0.5)
+
+    def index(self, post):
+        document = document_for_post(post)
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [post.pk])
+            cursor.execute(
+                f'INSERT INTO {self.table} (rowid, title, body, category, tags, translit) '
+                'VALUES (%s, %s, %s, %s, %s, %s)',
+                [post.pk, document['title'], document['body'], document['category'],
+                 document['tags'], document['translit']],
+            )
+
+    def remove(self, post_id):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table} WHERE rowid = %s', [post_id])
+
+    def rebuild(self, posts):
+        with connection.cursor() as cursor:
+            cursor.execute(f'DELETE FROM {self.table}')
+        super().rebuild(posts)
+
+    @staticmethod
+    def match_expression(query, fields):
+        columns = ' '.join(column for field in fields for column in FIELD_COLUMNS[field])
+        groups = []
+        for variants in query_terms(query):
+            quoted = ' OR '.join('"{}"*'.format(variant.replace('"', '""')) for variant in variants)
+            groups.append(f'({quoted})')
+        if not groups:
+            return None
+        return '{%s} : (%s)' % (columns, ' AND '.join(groups))
+
+    def search(self, query, fields=('text',), limit=None):
+        expression = self.match_expression(query, fields)
+        if expression is None:
+            return []
+        sql = (
+            f'SELECT rowid, bm25({self.table}, {", ".join(map(str, self.weights))}) AS rank, '
+            f"snippet({self.table}, 1, %s, %s, '…', 24) "
+            f'FROM {self.table} WHERE {self.table} MATCH %s ORDER BY rank'
+        )
+        params = [MARK_START, MARK_END, expression]
+        if limit:
+            sql += ' LIMIT %s'
+            params.append(limit)
+        with connection.cursor() as cursor:
+            cursor.execute(sql, params)
+            return [SearchHit(post_id=row[0], rank=row[1], snippet=row[2]) for row in cursor.fetchall()]
+
+
+_backend = None
+
+
+def get_backend():
+    global _backend
+    if _backend is None:
+        path = getattr(settings, 'BLOG_SEARCH_BACKEND', None)
+        if path is None:
+            path = ('blog.search.SQLiteFTS5Backend' if connection.vendor == 'sqlite'
+                    else 'blog.search.DatabaseSearchBackend')
+        _backend = import_string(path)()
+    return _backend
+
+
+def index_on_commit(post_ids):
+    """
+    Переиндексирует посты после коммита текущей транзакции. Сохранение поста формой
+    шлёт post_save и несколько m2m_changed: сигналы только добавляют id в общую
+    пачку транзакции, и каждый пост индексируется один раз.
+    """
+    batch = getattr(connection, 'blog_search_batch', None)
+    # После коммита или отката пачки уже нет в очереди on_commit - заводим новую
+    if batch is not None and any(entry[1] is batch for entry in connection.run_on_commit):
+        batch.post_ids.update(post_ids)
+        return
+
+    def batch():
+        connection.blog_search_batch = None
+        _index_posts(batch.post_ids)
+
+    batch.post_ids = set(post_ids)
+    connection.blog_search_batch = batch
+    transaction.on_commit(batch)  # Вне транзакции выполняется сразу
+
+
+def _index_posts(post_ids):
+    from .models import Post
+
+    backend = get_backend()
+    found = set()
+    for post in Post.objects.filter(pk__in=post_ids).select_related('category').prefetch_related('tags'):
+        backend.index(post)
+        found.add(post.pk)
+    for post_id in set(post_ids) - found:
+        backend.remove(post_id)  # Пост удалён в той же транзакции
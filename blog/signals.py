@@ -0,0 +1,219 @@
+from collections import Counter, defaultdict
+from functools import partial
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.db import transaction
+from django.db.models import Count, F, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import post_save, post_delete, pre_save, pre_delete, m2m_changed
+from django.dispatch import receiver
+
+from .cache import (
+    bump_listing_versions, bump_version, comments_version_name,
+    invalidate_post_listings, tag_listing_name,
+)
+from .comments import comment_data
+from .events import publish
+from .images import delete_variants, schedule_variants, variants_are_current
+from .models import AuthorStats, Post, Category, Tag, Comment, Reaction
+from .search import get_backend, index_on_commit
+
+
+# Поисковый индекс: посты переиндексируются после коммита, по разу за транзакцию
+@receiver(post_save, sender=Post)
+def index_post(sender, instance, raw=False, **kwargs):
+    if not raw:
+        index_on_commit([instance.pk])
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def index_post_tags(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear' and reverse:
+        # После очистки у тега уже не узнать, какие посты он терял
+        index_on_commit(instance.posts.values_list('pk', flat=True))
+    elif action in ('post_add', 'post_remove'):
+        index_on_commit(pk_set or () if reverse else [instance.pk])
+    elif action == 'post_clear' and not reverse:
+        index_on_commit([instance.pk])
+
+
+@receiver(post_delete, sender=Post)
+def unindex_post(sender, instance, **kwargs):
+    get_backend().remove(instance.pk)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def reindex_related_posts(sender, instance, created=False, raw=False, **kwargs):
+    if created or raw:
+        return
+    index_on_commit(instance.posts.values_list('pk', flat=True))
+
+
+# Комментарии
+@receiver(pre_delete, sender=get_user_model())
+def delete_replies_to_user_comments(sender, instance, **kwargs):
+    """
+    У Comment.parent нет каскада Django, поэтому комментарии удаляемого пользователя
+    вместе с ответами удаляем сами - пачками, по диапазонам path. Каскад не меняет
+    и счётчики постов: уменьшаем их на удалённые комментарии и реакции пользователя.
+    """
+    deltas = defaultdict(Counter)
+    for post_id, kind, count in (
+        Reaction.objects.filter(user=instance).order_by().values('post_id', 'kind')
+        .annotate(count=Count('pk')).values_list('post_id', 'kind', 'count')
+    ):
+        deltas[post_id][Reaction.COUNTER_FIELDS[kind]] -= count
+    comments = Comment.objects.filter(author=instance).only('pk', 'path').order_by('pk')
+    commented = set()
+    last_pk = 0
+    while True:
+        batch = list(comments.filter(pk__gt=last_pk)[:500])
+        if not batch:
+            break
+        last_pk = batch[-1].pk
+        doomed = Comment.objects.with_replies(batch)
+        for post_id, count in doomed.order_by().values('post_id').annotate(count=Count('pk')).values_list(
+                'post_id', 'count'):
+            deltas[post_id]['comments_count'] -= count
+            commented.add(post_id)
+        doomed.delete()
+
+    # Один UPDATE на группу постов с одинаковыми изменениями, как в apply_reactions.
+    # Не ниже нуля: строки, созданные в обход счётчиков, не должны ронять удаление пользователя
+    by_delta = defaultdict(list)
+    for post_id, changes in deltas.items():
+        by_delta[frozenset(changes.items())].append(post_id)
+    for changes, post_ids in by_delta.items():
+        Post.objects.filter(pk__in=post_ids).update(
+            **{field: Greatest(F(field) + delta, Value(0)) for field, delta in changes}
+        )
+    AuthorStats.objects.add_post_deltas(deltas)
+    for post_id in commented:
+        bump_version(comments_version_name(post_id))
+
+
+# Кэш страниц списков (состояние до сохранения нужно и статистике авторов)
+@receiver(pre_save, sender=Post)
+def remember_post_listing_state(sender, instance, raw=False, **kwargs):
+    instance._listing_before = None
+    if instance.pk and not raw:
+        instance._listing_before = Post.objects.filter(pk=instance.pk).values(
+            'status', 'category__slug', 'author_id', *AuthorStats.POST_COUNTERS,
+        ).first()
+
+
+@receiver(post_save, sender=Post)
+def invalidate_post_listing_cache(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_listing_before', None)
+    if instance.status != 'published' and not (before and before['status'] == 'published'):
+        return  # Черновик остался черновиком - в списках его нет
+    invalidate_post_listings(Post.objects.filter(pk=instance.pk))
+    if before:
+        bump_listing_versions(category_slugs=[before['category__slug']])
+
+
+@receiver(pre_delete, sender=Post)
+def invalidate_deleted_post_listing_cache(sender, instance, **kwargs):
+    if instance.status == 'published':
+        invalidate_post_listings(Post.objects.filter(pk=instance.pk))
+
+
+@receiver(m2m_changed, sender=Post.tags.through)
+def invalidate_post_tags_listing_cache(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if reverse:
+        posts = Post.objects.published().filter(pk__in=pk_set or instance.posts.values('pk'))
+        invalidate_post_listings(posts)
+        bump_version(tag_listing_name(instance.slug))
+    elif instance.status == 'published':
+        # Снятые теги уже не найдутся через пост, поэтому берём их из pk_set
+        invalidate_post_listings(Post.objects.filter(pk=instance.pk))
+        if pk_set:
+            bump_listing_versions(tag_slugs=Tag.objects.filter(pk__in=pk_set).values_list('slug', flat=True))
+
+
+@receiver(pre_save, sender=Category)
+@receiver(pre_save, sender=Tag)
+def remember_old_slug(sender, instance, raw=False, **kwargs):
+    instance._old_slug = None
+    if instance.pk and not raw:
+        instance._old_slug = sender.objects.filter(pk=instance.pk).values_list('slug', flat=True).first()
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_save, sender=Tag)
+def invalidate_taxonomy_listing_cache(sender, instance, created=False, raw=False, **kwargs):
+    if created or raw:
+        return
+    invalidate_post_listings(instance.posts.published())
+    slugs = [instance.slug, getattr(instance, '_old_slug', None)]
+    if sender is Category:
+        bump_listing_versions(category_slugs=slugs)
+    else:
+        bump_listing_versions(tag_slugs=slugs)
+
+
+@receiver(pre_delete, sender=Tag)
+def invalidate_deleted_tag_listing_cache(sender, instance, **kwargs):
+    invalidate_post_listings(instance.posts.published())
+    # Связи с постами удаляются без m2m_changed: имя тега иначе останется в поисковом индексе
+    index_on_commit(list(instance.posts.values_list('pk', flat=True)))
+
+
+# Статистика авторов: строка заводится вместе с пользователем, приросты счётчиков
+# переносит adjust_counters, здесь - публикация, снятие с публикации, смена автора и удаление
+@receiver(post_save, sender=get_user_model())
+def create_author_stats(sender, instance, created=False, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.create(user=instance)
+
+
+@receiver(post_save, sender=Post)
+def update_author_stats(sender, instance, raw=False, **kwargs):
+    if raw:
+        return
+    before = getattr(instance, '_listing_before', None)
+    # save() не пишет счётчики, поэтому их значения в БД - из before (у нового поста нули)
+    counters = before or {}
+    changes = defaultdict(Counter)
+    if before and before['status'] == 'published':
+        changes[before['author_id']].update(AuthorStats.post_totals(counters, sign=-1))
+    if instance.status == 'published':
+        changes[instance.author_id].update(AuthorStats.post_totals(counters))
+    AuthorStats.objects.add(changes)
+
+
+@receiver(post_delete, sender=Post)
+def remove_post_from_author_stats(sender, instance, **kwargs):
+    if instance.status == 'published':
+        counters = {field: getattr(instance, field) for field in AuthorStats.POST_COUNTERS}
+        AuthorStats.objects.add({instance.author_id: AuthorStats.post_totals(counters, sign=-1)})
+
+
+# Уменьшенные копии изображений
+@receiver(post_save, sender=Post)
+def schedule_image_variants(sender, instance, raw=False, **kwargs):
+    if not raw and instance.image and not variants_are_current(instance):
+        # После коммита, чтобы обработчик в другом потоке уже видел пост
+        transaction.on_commit(partial(schedule_variants, instance.pk))
+
+
+@receiver(post_delete, sender=Post)
+def delete_image_variants(sender, instance, **kwargs):
+    delete_variants(instance.image_variants)
+
+
+# События страницы поста (SSE). Удаление публикует Comment.delete:
+# обработчики удаления у Comment отключили бы быстрое удаление ветки
+@receiver(post_save, sender=Comment)
+def publish_comment_event(sender, instance, created=False, raw=False, **kwargs):
+    if raw:
+        return
+    # Данные общие для всех читателей: кнопки автора включает скрипт по author_id
+    data = {**comment_data(instance, AnonymousUser()), 'author_id': instance.author_id, 'parent_id': instance.parent_id}
+    publish(instance.post_id, 'comment_created' if created else 'comment_updated', data)
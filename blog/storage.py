@@ -0,0 +1,57 @@
+"""
+Хранилище загруженных файлов, адресуемое по содержимому.
+
+Файл сохраняется под именем из SHA-256 его содержимого (posts/ab/abcd...ef.jpg),
+поэтому повторная загрузка того же файла не создаёт копию, а URL файла никогда
+не меняет смысл - его можно кэшировать навсегда (см. media.py).
+"""
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+HASH_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    for chunk in content.chunks():
+        digest.update(chunk)
+    if hasattr(content, 'seek'):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def hash_from_name(name):
+    """Хэш содержимого из имени файла или None для файлов, сохранённых до хранилища"""
+    stem = os.path.splitext(os.path.basename(name))[0]
+    return stem if HASH_RE.match(stem) else None
+
+
+class _AlreadyStored(Exception):
+    pass
+
+
+class ContentAddressedStorage(FileSystemStorage):
+    def _save(self, name, content):
+        directory, filename = os.path.split(name)
+        digest = content_hash(content)
+        extension = os.path.splitext(filename)[1].lower()
+        name = os.path.join(directory, digest[:2], f'{digest}{extension}')
+        if self.exists(name):
+            return name  # Такой файл уже загружен
+        try:
+            return super()._save(name, content)
+        except _AlreadyStored:
+            return name  # Тот же файл параллельно записал другой запрос
+
+    def get_available_name(self, name, max_length=None):
+        # Итоговое имя определяется содержимым в _save, суффиксы не нужны.
+        # Для имени-хэша сюда попадаем, только если файл появился во время записи
+        digest = hash_from_name(name)
+        if digest and os.path.basename(os.path.dirname(name)) == digest[:2] and self.exists(name):
+            raise _AlreadyStored(name)
+        return name
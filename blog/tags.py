@@ -0,0 +1,55 @@
+"""
+Назначение тегов посту.
+
+Все имена разрешаются одним запросом, недостающие теги создаются одним
+bulk_create, а у поста меняется только разница между старым и новым набором.
+"""
+import hashlib
+
+from django.db import transaction
+from django.utils.text import slugify
+from unidecode import unidecode
+
+from .models import Tag
+
+
+def normalize_tag_name(name):
+    """Имя тега в каноническом виде: без лишних пробелов, в нижнем регистре"""
+    return ' '.join(name.split()).lower()
+
+
+def tag_slug(name):
+    return slugify(unidecode(name))
+
+
+def resolve_tags(names):
+    """Возвращает теги для имён в исходном порядке, создавая недостающие"""
+    names = list(dict.fromkeys(normalize_tag_name(name) for name in names if name.strip()))
+    if not names:
+        return []
+    tags = {tag.name: tag for tag in Tag.objects.filter(name__in=names)}
+    missing = [name for name in names if name not in tags]
+    if missing:
+        # Тег мог появиться в параллельном запросе - конфликт по имени просто пропускаем
+        Tag.objects.bulk_create([Tag(name=name, slug=tag_slug(name)) for name in missing], ignore_conflicts=True)
+        tags.update((tag.name, tag) for tag in Tag.objects.filter(name__in=missing))
+        for name in missing:
+            if name not in tags:
+                # Slug совпал с другим тегом ("c++" и "c"): добавляем к нему хэш имени
+                suffix = hashlib.blake2b(name.encode(), digest_size=3).hexdigest()
+                # (bulk_create, потому что Tag.save пересчитывает slug)
+                tags[name], = Tag.objects.bulk_create([Tag(name=name, slug=f'{tag_slug(name)}-{suffix}')])
+    return [tags[name] for name in names]
+
+
+def set_post_tags(post, names):
+    """Приводит теги поста к списку имён, добавляя и удаляя только разницу"""
+    with transaction.atomic():
+        tags = resolve_tags(names)
+        new_ids = {tag.pk for tag in tags}
+        current_ids = set(post.tags.values_list('pk', flat=True))
+        if current_ids - new_ids:
+            post.tags.remove(*(current_ids - new_ids))
+        if new_ids - current_ids:
+            post.tags.add(*(new_ids - current_ids))
+    return tags
@@ -0,0 +1,40 @@
+from django import template
+from django.core.files.storage import default_storage
+from django.utils.html import format_html, format_html_join
+
+from blog.images import CONTENT_TYPES, variants_are_current
+
+register = template.Library()
+
+
+def build_srcset(variants):
+    return ', '.join(f"{default_storage.url(variant['name'])} {variant['width']}w" for variant in variants)
+
+
+@register.simple_tag
+def responsive_image(post, sizes='100vw', **attrs):
+    """
+    <picture> с WebP и JPEG вариантами изображения поста; sizes - ширина картинки в макете.
+    Пока варианты не готовы, выводится исходный файл.
+    """
+    attrs.setdefault('alt', post.title)
+    attrs.setdefault('loading', 'lazy')
+    attrs.setdefault('decoding', 'async')
+    attributes = format_html_join(' ', '{}="{}"', sorted(attrs.items()))
+    if not variants_are_current(post):
+        return format_html('<img src="{}" {}>', post.image.url, attributes)
+
+    metadata = post.image_variants
+    by_format = {}
+    for variant in metadata['variants']:
+        by_format.setdefault(variant['format'], []).append(variant)
+    fallback = by_format.pop('jpeg', None) or [{'name': post.image.name, 'width': metadata['width']}]
+    sources = format_html_join(
+        '', '<source type="{}" srcset="{}" sizes="{}">',
+        ((CONTENT_TYPES[image_format], build_srcset(variants), sizes) for image_format, variants in by_format.items()),
+    )
+    return format_html(
+        '<picture>{}<img src="{}" srcset="{}" sizes="{}" width="{}" height="{}" {}></picture>',
+        sources, default_storage.url(fallback[-1]['name']), build_srcset(fallback), sizes,
+        metadata['width'], metadata['height'], attributes,
+    )
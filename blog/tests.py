@@ -1,3 +1,1593 @@
-from django.test import TestCase
+import asyncio
+import itertools
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest.mock import patch
 
-# Create your tests here.
+from PIL import Image
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.contrib.auth import get_user_model
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.management import CommandError, call_command
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import IntegrityError, connection, transaction
+from django.db.models import QuerySet
+from django.template import Context, Template
+from django.http import HttpResponse
+from django.test import AsyncRequestFactory, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils.crypto import get_random_string
+
+from .models import COMMENT_MAX_LEVEL, AuthorStats, Post, Category, Tag, Comment, Reaction
+from . import async_views, events, metrics
+from .comments import build_comment_tree, load_comment_tree
+from .interactions import apply_reactions, create_comment, delete_comment, toggle_favorite, toggle_reaction
+from .instrumentation import RequestInstrumentationMiddleware
+from .management.commands.explain_hot_paths import Command as ExplainCommand
+from .pagination import CursorPaginator, InvalidCursor
+from .search import get_backend
+from .tags import set_post_tags
+from .view_counter import view_counter
+
+User = get_user_model()
+
+
+class BlogTestMixin:
+    """Общие фабрики тестовых данных"""
+    _numbers = itertools.count()
+    # Замеры выключены: предупреждения о медленных запросах и N+1 не засоряют вывод тестов
+    instrumentation = {'SAMPLE_RATE': 0}
+
+    def setUp(self):
+        super().setUp()
+        # id объектов повторяются между тестами, поэтому кэш с прошлых тестов недействителен
+        cache.clear()
+        self.enterContext(self.settings(BLOG_INSTRUMENTATION=self.instrumentation))
+
+    @classmethod
+    def make_posts(cls, count, author, category, tags=(), status='published', prefix='Пост'):
+        posts = []
+        # Поисковый индекс обновляется после коммита: в TestCase его нужно выполнить явно
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls._make_posts(posts, count, author, category, tags, status, prefix)
+        return posts
+
+    @classmethod
+    def _make_posts(cls, posts, count, author, category, tags, status, prefix):
+        for _ in range(count):
+            post = Post.objects.create(
+                title=f'{prefix} {next(cls._numbers)}',
+                text='Текст поста',
+                category=category,
+                author=author,
+                status=status,
+            )
+            post.tags.set(tags)
+            Reaction.objects.bulk_create([
+                Reaction(user=author, post=post, kind=Reaction.LIKE),
+                Reaction(user=author, post=post, kind=Reaction.FAVORITE),
+            ])
+            Comment.objects.create(post=post, author=author, text='Комментарий')
+            posts.append(post)
+
+
+class ListingQueryCountTests(BlogTestMixin, TestCase):
+    """Количество запросов на страницах списков не зависит от числа карточек"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.tags = [Tag.objects.create(name=f'тег{i}') for i in range(3)]
+
+    def assertConstantQueries(self, url, expected, login=False):
+        if login:
+            self.client.force_login(self.user)
+        self.make_posts(2, self.user, self.category, self.tags)
+        with self.assertNumQueries(expected):
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.make_posts(7, self.user, self.category, self.tags)
+        with self.assertNumQueries(expected):
+            self.assertEqual(self.client.get(url).status_code, 200)
+
+    def test_main_page(self):
+        # COUNT для пагинатора, посты, теги
+        self.assertConstantQueries(reverse('blog:main_page'), 3)
+
+    def test_main_page_authenticated(self):
+        # + сессия и пользователь
+        self.assertConstantQueries(reverse('blog:main_page'), 5, login=True)
+
+    def test_main_page_search(self):
+        # + запрос к поисковому индексу
+        self.assertConstantQueries(reverse('blog:main_page') + '?q=тег&search_tag=on', 4)
+
+    def test_post_list(self):
+        self.assertConstantQueries(reverse('blog:post_list'), 3)
+
+    def test_category_posts(self):
+        # категория, посты, теги
+        self.assertConstantQueries(self.category.get_absolute_url(), 3)
+
+    def test_tag_posts(self):
+        self.assertConstantQueries(self.tags[0].get_absolute_url(), 3)
+
+    def test_favorite_posts(self):
+        self.assertConstantQueries(reverse('blog:favorite_posts'), 5, login=True)
+
+    def test_user_profile(self):
+        # профиль, COUNT, статистика автора, посты, теги
+        url = reverse('users:profile', kwargs={'user_username': self.user.username})
+        self.assertConstantQueries(url, 5)
+
+
+class PostCardsQuerySetTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.other = User.objects.create_user('other', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.post, = cls.make_posts(1, cls.user, cls.category)
+
+    def test_user_flags(self):
+        post = Post.objects.cards(self.user).get(pk=self.post.pk)
+        self.assertTrue(post.is_favorited)
+        self.assertFalse(post.is_viewed)
+        self.assertFalse(Post.objects.cards(self.other).get(pk=self.post.pk).is_favorited)
+        self.assertFalse(Post.objects.cards().get(pk=self.post.pk).is_favorited)
+
+
+class CounterTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.post = Post.objects.create(
+            title='Пост', text='Текст', category=cls.category, author=cls.user, status='published',
+        )
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.user)
+
+    def like(self, action):
+        return self.client.post(reverse('blog:post_like', args=[self.post.pk]), {'action': action}).json()
+
+    def test_like_dislike_toggle(self):
+        self.assertEqual(self.like('like')['like_count'], 1)
+        data = self.like('dislike')
+        self.assertEqual((data['like_count'], data['dislike_count']), (0, 1))
+        data = self.like('dislike')
+        self.assertEqual((data['like_count'], data['dislike_count']), (0, 0))
+
+    def test_favorite_toggle(self):
+        url = reverse('blog:post_favorite', args=[self.post.pk])
+        self.assertEqual(self.client.post(url).json()['favorites_count'], 1)
+        self.assertEqual(self.client.post(url).json()['favorites_count'], 0)
+
+    def test_comments_count_with_cascade(self):
+        create_url = reverse('blog:comment_create', args=[self.post.pk])
+        root = self.client.post(create_url, {'text': 'Корень'}).json()['comment']['id']
+        self.client.post(create_url, {'text': 'Ответ', 'parent_id': root})
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 2)
+        self.client.post(reverse('blog:comment_delete', args=[root]))
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+
+    def test_save_does_not_overwrite_counters(self):
+        stale = Post.objects.get(pk=self.post.pk)
+        self.like('like')
+        stale.text = 'Новый текст'
+        stale.save()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+    def test_reconcile_counters(self):
+        Reaction.objects.create(user=self.user, post=self.post, kind=Reaction.LIKE)
+        Comment.objects.create(post=self.post, author=self.user, text='Мимо счётчика')
+        call_command('reconcile_counters', stdout=StringIO())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.like_count, self.post.comments_count), (1, 1))
+
+
+class ReactionTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.post = Post.objects.create(
+            title='Пост', text='Текст', category=cls.category, author=cls.user, status='published',
+        )
+
+    def counters(self):
+        self.post.refresh_from_db()
+        return self.post.like_count, self.post.dislike_count, self.post.favorites_count
+
+    def test_like_and_dislike_are_exclusive(self):
+        self.assertEqual(toggle_reaction(self.post, self.user, 'like'), 'liked')
+        self.assertEqual(toggle_reaction(self.post, self.user, 'dislike'), 'disliked')
+        self.assertEqual(toggle_favorite(self.post, self.user), 'added')
+        kinds = set(Reaction.objects.filter(user=self.user).values_list('kind', flat=True))
+        self.assertEqual(kinds, {Reaction.DISLIKE, Reaction.FAVORITE})
+        self.assertEqual(self.counters(), (0, 1, 1))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Reaction.objects.create(user=self.user, post=self.post, kind=Reaction.LIKE)
+
+    def test_toggle_cost_does_not_depend_on_reactions(self):
+        def toggle_queries():
+            with CaptureQueriesContext(connection) as queries:
+                toggle_reaction(self.post, self.user, 'like')
+            return len(queries)
+
+        few = toggle_queries()
+        toggle_reaction(self.post, self.user, 'like')
+        others = [User(username=f'fan{i}') for i in range(50)]
+        User.objects.bulk_create(others)
+        Reaction.objects.bulk_create(
+            Reaction(user=user, post=self.post, kind=Reaction.LIKE)
+            for user in User.objects.filter(username__startswith='fan')
+        )
+        self.assertEqual(toggle_queries(), few)
+
+    def test_concurrent_duplicate_does_not_drift_counters(self):
+        # Параллельный запрос вставил строку между нашим DELETE и INSERT
+        original_delete = QuerySet.delete
+
+        def delete_then_race(queryset):
+            result = original_delete(queryset)
+            if not Reaction.objects.filter(user=self.user, post=self.post).exists():
+                Reaction.objects.create(user=self.user, post=self.post, kind=Reaction.LIKE)
+                self.post.adjust_counters(like_count=1)
+            return result
+
+        with patch.object(QuerySet, 'delete', delete_then_race):
+            toggle_reaction(self.post, self.user, 'like')
+        self.assertEqual(Reaction.objects.filter(user=self.user, post=self.post).count(), 1)
+        self.assertEqual(self.counters(), (1, 0, 0))
+
+
+class ReactionBatchTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.reader = User.objects.create_user('reader', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.first, cls.second = [
+            Post.objects.create(title=f'Пост {i}', text='Текст', category=cls.category, author=cls.user,
+                                status='published')
+            for i in range(2)
+        ]
+
+    def setUp(self):
+        super().setUp()
+        self.client.force_login(self.reader)
+
+    def send(self, *operations):
+        payload = {'operations': [
+            {'post_id': post.pk, 'kind': kind, 'active': active} for post, kind, active in operations
+        ]}
+        response = self.client.post(reverse('blog:reaction_batch'), payload, content_type='application/json')
+        return response.status_code, response.json()
+
+    def kinds(self, post):
+        return set(Reaction.objects.filter(user=self.reader, post=post).values_list('kind', flat=True))
+
+    def test_operations_collapse_to_final_state(self):
+        status, data = self.send(
+            (self.first, 'like', True), (self.first, 'dislike', True), (self.first, 'like', True),
+            (self.first, 'favorite', True), (self.first, 'favorite', False), (self.first, 'favorite', True),
+            (self.second, 'dislike', True), (self.second, 'dislike', False),
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(self.kinds(self.first), {Reaction.LIKE, Reaction.FAVORITE})
+        self.assertEqual(self.kinds(self.second), set())
+        self.assertEqual(data['posts'][str(self.first.pk)], {
+            'liked': True, 'disliked': False, 'favorited': True,
+            'like_count': 1, 'dislike_count': 0, 'favorites_count': 1,
+        })
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.like_count, self.first.favorites_count), (1, 1))
+
+    def test_writes_do_not_depend_on_number_of_clicks(self):
+        clicks = [(self.first, 'like', active) for active in (True, False) * 20] + [(self.first, 'like', True)]
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.send(*clicks)[0], 200)
+        writes = [q['sql'] for q in queries if q['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))]
+        # вставка реакции, один UPDATE счётчиков и один - статистики автора (плюс обновление сессии)
+        self.assertEqual(len([sql for sql in writes if 'blog_' in sql]), 3)
+        # Смена голоса: лайк удаляется до вставки дизлайка, ограничение одного голоса не мешает
+        self.assertEqual(self.send((self.first, 'dislike', True))[0], 200)
+        self.first.refresh_from_db()
+        self.assertEqual((self.first.like_count, self.first.dislike_count), (0, 1))
+
+    def test_concurrent_insert_does_not_drift_counters(self):
+        original_bulk_create = QuerySet.bulk_create
+
+        def race_then_bulk_create(queryset, objs, *args, **kwargs):
+            # Параллельный запрос успел поставить ту же реакцию и увеличить счётчик
+            Reaction.objects.create(user=self.reader, post=self.first, kind=Reaction.LIKE)
+            self.first.adjust_counters(like_count=1)
+            return original_bulk_create(queryset, objs, *args, **kwargs)
+
+        with patch.object(QuerySet, 'bulk_create', race_then_bulk_create):
+            status, data = self.send((self.first, 'like', True), (self.second, 'like', True))
+        self.assertEqual(status, 200)
+        self.assertEqual(data['posts'][str(self.first.pk)]['like_count'], 1)
+        self.assertEqual(data['posts'][str(self.second.pk)]['like_count'], 1)
+
+    def test_invalid_batches(self):
+        missing = Post(pk=10 ** 6)
+        self.assertEqual(self.send((missing, 'like', True))[0], 400)
+        self.assertEqual(self.send((self.first, 'love', True))[0], 400)
+        self.assertEqual(self.send()[0], 400)
+        self.assertEqual(self.send(*[(self.first, 'like', True)] * 101)[0], 400)
+        response = self.client.post(reverse('blog:reaction_batch'), 'не json', content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Reaction.objects.exists())
+
+
+class PostStateTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.reader = User.objects.create_user('reader', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.posts = cls.make_posts(3, cls.user, cls.category)
+
+    def state(self, post_ids):
+        response = self.client.get(reverse('blog:post_state'), {'ids': ','.join(map(str, post_ids))})
+        return response.status_code, response.json()
+
+    def test_state_of_all_posts_in_one_query(self):
+        first, second, third = self.posts
+        toggle_reaction(first, self.reader, 'dislike')
+        toggle_favorite(second, self.reader)
+        Post.viewed_users.through.objects.create(post=third, user=self.reader)
+        self.client.force_login(self.reader)
+        # сессия, пользователь, UNION реакций с просмотрами и счётчики
+        with self.assertNumQueries(4):
+            status, data = self.state([post.pk for post in self.posts])
+        self.assertEqual(status, 200)
+        self.assertEqual(data['user_id'], self.reader.pk)
+        flags = ('liked', 'disliked', 'favorited', 'viewed')
+        self.assertEqual({flag: data['posts'][str(first.pk)][flag] for flag in flags},
+                         {'liked': False, 'disliked': True, 'favorited': False, 'viewed': False})
+        self.assertEqual({flag: data['posts'][str(second.pk)][flag] for flag in flags},
+                         {'liked': False, 'disliked': False, 'favorited': True, 'viewed': False})
+        self.assertTrue(data['posts'][str(third.pk)]['viewed'])
+        self.assertEqual((data['posts'][str(first.pk)]['dislike_count'],
+                          data['posts'][str(second.pk)]['favorites_count']), (1, 1))
+
+    def test_anonymous_and_invalid_requests(self):
+        # только счётчики
+        with self.assertNumQueries(1):
+            status, data = self.state([self.posts[0].pk])
+        self.assertEqual((status, data['user_id']), (200, None))
+        state = data['posts'][str(self.posts[0].pk)]
+        self.assertFalse(any(state[flag] for flag in ('liked', 'disliked', 'favorited', 'viewed')))
+        self.assertIn('views_count', state)
+        self.assertEqual(self.state(['abc'])[0], 400)
+        self.assertEqual(self.state(range(1, 200))[0], 400)
+
+    def test_cards_are_shared_between_readers(self):
+        url = reverse('blog:main_page')
+        self.client.force_login(self.user)
+        own = self.client.get(url).content.decode()
+        self.client.force_login(self.reader)
+        # Карточки из общего кэша: только сессия, пользователь и COUNT пагинатора
+        with self.assertNumQueries(3):
+            response = self.client.get(url)
+        self.assertNotIn('bi-star-fill', own)
+        self.assertEqual(own.count('post-own-badge'), response.content.decode().count('post-own-badge'))
+
+    def test_deploy_check_warns_about_local_cache(self):
+        from .checks import check_shared_cache
+        self.assertEqual([warning.id for warning in check_shared_cache(None)], ['blog.W001'])
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://x'}}
+        with override_settings(CACHES=redis):
+            self.assertEqual(check_shared_cache(None), [])
+
+    def test_counters_come_from_state_not_cached_cards(self):
+        url = reverse('blog:main_page')
+        self.client.get(url)
+        Post.objects.filter(pk=self.posts[0].pk).update(views_count=42)
+        # Карточки по-прежнему из кэша, актуальное значение отдаёт PostStateView
+        self.assertNotContains(self.client.get(url), '>42<')
+        self.assertEqual(self.state([self.posts[0].pk])[1]['posts'][str(self.posts[0].pk)]['views_count'], 42)
+
+
+class AuthorStatsTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user('author', password='pass12345')
+        cls.reader = User.objects.create_user('reader', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+
+    def setUp(self):
+        super().setUp()
+        view_counter.counts.clear()
+        view_counter.viewers.clear()
+
+    def assertStats(self, published_posts, likes_received, views_received, comments_count):
+        stats = AuthorStats.objects.get(user=self.author)
+        values = [getattr(stats, field) for field in AuthorStats.FIELDS]
+        self.assertEqual(values, [published_posts, likes_received, views_received, comments_count])
+        # Приросты сходятся с пересчётом по постам
+        self.assertEqual(values, list(AuthorStats.objects.actual([self.author.pk])[self.author.pk].values()))
+
+    def test_stats_follow_interactions(self):
+        post, draft = self.make_posts(1, self.author, self.category) + self.make_posts(
+            1, self.author, self.category, status='draft')
+        toggle_reaction(post, self.reader, 'like')
+        toggle_reaction(draft, self.reader, 'like')
+        comment = create_comment(post, self.reader, 'Комментарий')
+        create_comment(post, self.reader, 'Ответ', parent=comment)
+        view_counter.counts.update({post.pk: 3, draft.pk: 1})
+        view_counter.flush()
+        self.assertStats(1, 1, 3, 2)
+
+        delete_comment(comment)
+        apply_reactions(self.reader, [(post.pk, Reaction.DISLIKE, True)])
+        self.assertStats(1, 0, 3, 0)
+
+    def test_stats_follow_status_and_deletion(self):
+        post, = self.make_posts(1, self.author, self.category, status='draft')
+        toggle_reaction(post, self.reader, 'like')
+        create_comment(post, self.reader, 'Комментарий')
+        self.assertStats(0, 0, 0, 0)
+        post = Post.objects.get(pk=post.pk)
+        post.status = 'published'
+        post.save()
+        self.assertStats(1, 1, 0, 1)
+        post.status = 'draft'
+        post.save()
+        self.assertStats(0, 0, 0, 0)
+        post.status = 'published'
+        post.save()
+        Post.objects.get(pk=post.pk).delete()
+        self.assertStats(0, 0, 0, 0)
+
+    def test_admin_actions_update_stats(self):
+        self.make_posts(2, self.author, self.category, status='draft')
+        post, = self.make_posts(1, self.author, self.category)
+        toggle_reaction(post, self.reader, 'like')
+        self.client.force_login(User.objects.create_superuser('admin', password='pass12345'))
+        url = reverse('admin:blog_post_changelist')
+        selected = list(Post.objects.values_list('pk', flat=True))
+        self.client.post(url, {'action': 'publish_selected', '_selected_action': selected})
+        self.assertStats(3, 1, 0, 0)
+        self.client.post(url, {'action': 'unpublish_selected', '_selected_action': selected})
+        self.assertStats(0, 0, 0, 0)
+
+    def test_missing_row_is_computed_on_read(self):
+        self.make_posts(2, self.author, self.category)
+        AuthorStats.objects.filter(user=self.author).delete()
+        self.assertEqual(AuthorStats.objects.for_user(self.author).published_posts, 2)
+
+    def test_reconcile_fixes_drift(self):
+        self.make_posts(2, self.author, self.category)
+        AuthorStats.objects.filter(user=self.author).update(published_posts=7, likes_received=5)
+        out = StringIO()
+        call_command('reconcile_counters', stdout=out)
+        self.assertIn('авторов с расхождениями: 1', out.getvalue())
+        # make_posts пишет реакции и комментарии мимо счётчиков: их чинит первый проход
+        self.assertStats(2, 2, 0, 2)
+
+    def test_profile_filters_drafts_in_query(self):
+        self.make_posts(7, self.author, self.category, status='draft', prefix='Черновик')
+        self.make_posts(2, self.author, self.category)
+        url = reverse('users:profile', kwargs={'user_username': self.author.username})
+        response = self.client.get(url)
+        self.assertEqual(len(response.context['posts']), 2)
+        self.assertFalse(response.context['is_paginated'])
+        self.assertNotContains(response, 'Черновик')
+        self.assertContains(response, 'Постов: 2')
+
+        self.client.force_login(self.author)
+        response = self.client.get(url)
+        self.assertEqual(response.context['page_obj'].paginator.count, 9)
+
+
+class CursorPaginationTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.posts = cls.make_posts(7, cls.user, cls.category)
+
+    def test_walk_forward_and_back(self):
+        paginator = CursorPaginator(Post.objects.published(), 3)
+        pages = [paginator.page()]
+        while pages[-1].has_next():
+            pages.append(paginator.page(pages[-1].next_cursor))
+        seen = [post.pk for page in pages for post in page]
+        self.assertEqual(seen, sorted((post.pk for post in self.posts), reverse=True))
+        self.assertFalse(pages[0].has_previous())
+
+        back = paginator.page(pages[-1].previous_cursor)
+        self.assertEqual([post.pk for post in back], [post.pk for post in pages[-2]])
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            CursorPaginator(Post.objects.all(), 3).page('не-курсор')
+        response = self.client.get(reverse('blog:main_feed'), {'cursor': 'мусор'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_mode_skips_count(self):
+        first = CursorPaginator(Post.objects.published(), 9).page()
+        with self.assertNumQueries(2):
+            response = self.client.get(reverse('blog:main_page'), {'cursor': ''})
+        self.assertTrue(response.context['cursor_mode'])
+        self.assertEqual(len(response.context['posts']), len(first))
+
+    def test_feed(self):
+        response = self.client.get(reverse('blog:main_page'))
+        self.assertNotIn('next_cursor', response.context)  # все 7 постов уместились на первой странице
+
+        page = CursorPaginator(Post.objects.published(), 3).page()
+        data = self.client.get(reverse('blog:main_feed'), {'cursor': page.next_cursor}).json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['count'], 4)
+        self.assertFalse(data['has_next'])
+
+
+    def test_search_pages_by_number_in_relevance_order(self):
+        self.make_posts(12, self.user, self.category, prefix='Находка')
+        params = {'q': 'находка'}
+        first = self.client.get(reverse('blog:main_page'), params)
+        self.assertNotIn('next_cursor', first.context)
+        self.assertNotContains(first, 'feed-sentinel')
+        self.assertContains(first, 'href="?q=%D0%BD%D0%B0%D1%85%D0%BE%D0%B4%D0%BA%D0%B0&amp;page=2"')
+        second = self.client.get(reverse('blog:main_page'), {**params, 'page': 2})
+        found = list(first.context['posts']) + list(second.context['posts'])
+        self.assertEqual(len({post.pk for post in found}), 12)
+        # Курсор по дате к выдаче по релевантности не применяется
+        self.assertFalse(self.client.get(reverse('blog:main_page'), {**params, 'cursor': ''}).context['cursor_mode'])
+        self.assertEqual(self.client.get(reverse('blog:main_feed'), params).status_code, 400)
+
+
+class SearchTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.category = Category.objects.create(name='Путешествия')
+        with cls.captureOnCommitCallbacks(execute=True):
+            cls.moscow = Post.objects.create(
+                title='Прогулка по Москве', text='Весной Москва особенно красива. <b>Ёлки</b> в парке.',
+                category=cls.category, author=cls.user, status='published',
+            )
+            cls.tag = Tag.objects.create(name='Города')
+            cls.moscow.tags.add(cls.tag)
+            cls.other = Post.objects.create(
+                title='Рецепт борща', text='Свёкла, капуста и немного терпения.',
+                category=Category.objects.create(name='Кухня'), author=cls.user, status='published',
+            )
+
+    def search(self, **params):
+        response = self.client.get(reverse('blog:main_page'), params)
+        return list(response.context['posts'])
+
+    def test_case_insensitive_cyrillic_and_word_forms(self):
+        self.assertEqual(self.search(q='МОСКВА'), [self.moscow])
+        self.assertEqual(self.search(q='москвы'), [self.moscow])
+        self.assertEqual(self.search(q='елки'), [self.moscow])
+
+    def test_transliteration(self):
+        self.assertEqual(self.search(q='moskva'), [self.moscow])
+        self.assertEqual(self.search(q='borshch'), [self.other])
+
+    def test_category_and_tag_fields(self):
+        self.assertEqual(self.search(q='кухня', search_category='on'), [self.other])
+        self.assertEqual(self.search(q='кухня'), [])
+        self.assertEqual(self.search(q='город', search_tag='on'), [self.moscow])
+
+    def test_deleted_tag_leaves_index(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.tag.delete()
+        self.assertEqual(self.search(q='город', search_tag='on'), [])
+        self.assertEqual(self.search(q='москва'), [self.moscow])
+
+    def test_snippet_is_highlighted_and_escaped(self):
+        post, = self.search(q='красива')
+        self.assertIn('<mark>красива</mark>', post.search_snippet)
+        self.assertIn('&lt;b&gt;', post.search_snippet)
+
+    def test_index_follows_updates_and_deletes(self):
+        self.other.title = 'Рецепт щей'
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.save()
+        self.assertEqual(self.search(q='щей'), [self.other])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.other.delete()
+        self.assertEqual(self.search(q='свекла'), [])
+
+    def test_post_save_with_tags_reindexes_once(self):
+        self.moscow.title = 'Прогулка по Петербургу'
+        with CaptureQueriesContext(connection) as queries:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    self.moscow.save()
+                    self.moscow.tags.set([Tag.objects.create(name='Мосты')])
+        self.assertEqual(len([q for q in queries if q['sql'].startswith('INSERT INTO blog_post_search')]), 1)
+        self.assertEqual(self.search(q='мосты', search_tag='on'), [self.moscow])
+        self.assertEqual(self.search(q='города', search_tag='on'), [])
+
+    def test_rolled_back_batch_does_not_swallow_later_changes(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            try:
+                with transaction.atomic():
+                    self.other.title = 'Рецепт окрошки'
+                    self.other.save()
+                    raise IntegrityError
+            except IntegrityError:
+                pass
+            self.other.refresh_from_db()
+            self.other.text = 'Квас и огурцы'
+            self.other.save()
+        self.assertEqual(self.search(q='квас'), [self.other])
+
+
+@override_settings(BLOG_VIEW_COUNTER={'FLUSH_INTERVAL': 3600, 'FLUSH_THRESHOLD': 3})
+class ViewCounterTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('reader', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.post, cls.other = cls.make_posts(2, cls.user, cls.category)
+
+    def setUp(self):
+        super().setUp()
+        # Забываем просмотры, накопленные другими тестами
+        view_counter.counts.clear()
+        view_counter.viewers.clear()
+
+    def test_detail_page_does_not_write_views(self):
+        url = reverse('blog:post_detail', args=[self.post.slug])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(url)
+        self.assertFalse([q for q in queries if q['sql'].startswith(('UPDATE', 'INSERT'))])
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views_count, 0)
+        self.assertEqual(view_counter.pending(self.post.pk), 1)
+
+    def test_views_are_deduplicated_and_flushed_in_batch(self):
+        self.client.force_login(self.user)
+        for _ in range(3):
+            self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        self.client.get(reverse('blog:post_detail', args=[self.other.slug]))
+        self.assertEqual(view_counter.pending(), 2)
+
+        self.client.logout()
+        # Третий уникальный просмотр достигает порога и сбрасывает буфер
+        self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        self.assertEqual(view_counter.pending(), 0)
+        self.post.refresh_from_db()
+        self.other.refresh_from_db()
+        self.assertEqual((self.post.views_count, self.other.views_count), (2, 1))
+        self.assertTrue(self.post.viewed_users.filter(pk=self.user.pk).exists())
+
+
+    def test_flush_drops_deleted_posts_and_users(self):
+        gone_user = User.objects.create_user('gone', password='pass12345')
+        gone_post, = self.make_posts(1, self.user, self.category)
+        view_counter.counts.update({self.post.pk: 2, gone_post.pk: 1})
+        view_counter.viewers |= {(self.post.pk, gone_user.pk), (gone_post.pk, self.user.pk), (self.post.pk, self.user.pk)}
+        gone_post.delete()
+        gone_user.delete()
+        self.assertEqual(view_counter.flush(), 2)
+        self.assertEqual(view_counter.pending(), 0)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.views_count, 2)
+        self.assertEqual(list(self.post.viewed_users.all()), [self.user])
+
+    @override_settings(BLOG_VIEW_COUNTER={'FLUSH_THRESHOLD': 1})
+    def test_flush_error_does_not_break_page(self):
+        with patch.object(Post.viewed_users.through.objects, 'bulk_create', side_effect=IntegrityError), \
+                self.assertLogs('blog.view_counter', 'ERROR'):
+            response = self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        self.assertEqual(response.status_code, 200)
+        # Просмотр остался в буфере до следующего сброса
+        self.assertEqual(view_counter.pending(self.post.pk), 1)
+
+
+class CommentTreeTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.post = Post.objects.create(
+            title='Пост', text='Текст', category=cls.category, author=cls.user, status='published',
+        )
+        cls.other_post = Post.objects.create(
+            title='Другой пост', text='Текст', category=cls.category, author=cls.user, status='published',
+        )
+
+    def make_thread(self, depth, post=None):
+        parent = None
+        for level in range(depth):
+            parent = Comment.objects.create(post=post or self.post, author=self.user, text=f'Уровень {level}', parent=parent)
+        return parent
+
+    def test_reply_dated_before_parent_stays_in_tree(self):
+        leaf = self.make_thread(3)
+        root = Comment.objects.get(pk=leaf.parent.parent_id)
+        # Как после импорта: даты ответов раньше даты родителя
+        Comment.objects.filter(pk=leaf.pk).update(created_at=root.created_at - timedelta(days=2))
+        Comment.objects.filter(pk=leaf.parent_id).update(created_at=root.created_at - timedelta(days=1))
+        tree = load_comment_tree(self.post, [root])
+        self.assertEqual(tree[0].replies[0].comment.pk, leaf.parent_id)
+        self.assertEqual(tree[0].replies[0].replies[0].comment.pk, leaf.pk)
+
+    def test_orphans_are_reported(self):
+        root = self.make_thread(1)
+        orphan = Comment(pk=10 ** 6, post=self.post, author=self.user, text='Сирота', parent_id=10 ** 6 + 1)
+        with self.assertLogs('blog.comments', 'WARNING') as logs:
+            tree = build_comment_tree([root], [orphan])
+        self.assertEqual(tree[0].replies, [])
+        self.assertIn(str(orphan.pk), logs.output[0])
+
+    def test_path_follows_parent(self):
+        leaf = self.make_thread(3)
+        root = Comment.objects.get(pk=leaf.parent.parent_id)
+        self.assertEqual(root.path, '')
+        self.assertEqual(leaf.path, f'{root.pk:010d}/{leaf.parent_id:010d}/')
+
+    def test_detail_page_queries_do_not_depend_on_thread_size(self):
+        url = reverse('blog:post_detail', args=[self.post.slug])
+        self.make_thread(2)
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for _ in range(6):
+            self.make_thread(6)
+        with CaptureQueriesContext(connection) as large:
+            response = self.client.get(url)
+        self.assertEqual(len(small), len(large))
+        depth, node = 0, response.context['comments'][-1]
+        while node.replies:
+            depth, node = depth + 1, node.replies[0]
+        self.assertEqual(depth, 5)
+
+    def test_more_comments_returns_whole_threads(self):
+        self.make_thread(3, post=self.other_post)
+        for _ in range(7):
+            self.make_thread(3)
+        url = reverse('blog:more_comments', args=[self.post.slug])
+        with self.assertNumQueries(4):  # пост, корни, ответы, COUNT корней
+            data = self.client.get(url, {'offset': 0}).json()
+        self.assertEqual(len(data['comments']), 5)
+        self.assertEqual(data['comments'][0]['replies'][0]['replies'][0]['level'], 2)
+        self.assertEqual(data['comments'][0]['replies'][0]['replies'][0]['replies'], [])
+
+
+class CommentWritePathTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.other = User.objects.create_user('other', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.post = Post.objects.create(
+            title='Пост', text='Текст', category=cls.category, author=cls.user, status='published',
+        )
+
+    def reply(self, parent, author=None):
+        return Comment.objects.create(post=self.post, author=author or self.user, text='Ответ', parent=parent)
+
+    def test_level_comes_from_parent_without_walking_chain(self):
+        parent = self.reply(self.reply(None))
+        parent = Comment.objects.get(pk=parent.pk)
+        with self.assertNumQueries(1):
+            child = self.reply(parent)
+        self.assertEqual(child.level, 2)
+
+    def test_max_level(self):
+        comment = None
+        for _ in range(7):
+            comment = self.reply(comment)
+        self.assertEqual(comment.level, 6)
+        with self.assertRaises(ValueError):
+            self.reply(comment)
+
+    def test_level_constraint(self):
+        root = self.reply(None)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Comment.objects.filter(pk=root.pk).update(level=3)
+
+    def test_subtree_delete_is_set_based(self):
+        root = self.reply(None)
+        sibling = self.reply(None)
+        comment = root
+        for _ in range(5):
+            comment = self.reply(comment)
+        with self.assertNumQueries(1):
+            deleted, _ = root.delete()
+        self.assertEqual(deleted, 6)
+        self.assertEqual(list(Comment.objects.all()), [sibling])
+
+    def test_queryset_delete_removes_replies(self):
+        # Массовое удаление (например, из админки) не упирается в FK ответов
+        root = self.reply(None)
+        sibling = self.reply(None)
+        self.reply(self.reply(root))
+        with self.assertNumQueries(2):
+            deleted, _ = Comment.objects.filter(pk=root.pk).delete()
+        self.assertEqual(deleted, 3)
+        self.assertEqual(list(Comment.objects.all()), [sibling])
+
+    def test_deleting_user_removes_replies_to_their_comments(self):
+        root = self.reply(None, author=self.other)
+        self.reply(self.reply(root))
+        kept = self.reply(None)
+        self.other.delete()
+        self.assertEqual(list(Comment.objects.all()), [kept])
+
+    def test_deleting_user_adjusts_post_counters(self):
+        root = create_comment(self.post, self.other, 'Корень')
+        create_comment(self.post, self.user, 'Ответ', parent=root)
+        create_comment(self.post, self.user, 'Остаётся')
+        toggle_reaction(self.post, self.other, 'like')
+        toggle_favorite(self.post, self.other)
+        toggle_reaction(self.post, self.user, 'dislike')
+        self.other.delete()
+        self.post.refresh_from_db()
+        counters = [self.post.comments_count, self.post.like_count, self.post.favorites_count,
+                    self.post.dislike_count]
+        self.assertEqual(counters, [1, 0, 0, 1])
+        self.assertEqual(AuthorStats.objects.get(user=self.user).likes_received, 0)
+        self.assertEqual(AuthorStats.objects.get(user=self.user).comments_count, 1)
+
+
+class CommentSectionCacheTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.post = Post.objects.create(
+            title='Пост', text='Текст', category=cls.category, author=cls.user, status='published',
+        )
+        Comment.objects.create(post=cls.post, author=cls.user, text='Первый')
+
+    def get_detail(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        # Запрос валидаторов ETag (JOIN с MAX по комментариям) не в счёт - он один и не зависит от ветки
+        comment_queries = [q for q in queries if 'FROM "blog_comments"' in q['sql']]
+        return response, comment_queries
+
+    def test_cache_hit_skips_comment_queries(self):
+        _, first = self.get_detail()
+        self.assertTrue(first)
+        response, second = self.get_detail()
+        self.assertEqual(second, [])
+        self.assertContains(response, 'Первый')
+
+    def test_fragment_is_shared_between_readers(self):
+        self.client.force_login(self.user)
+        self.get_detail()
+        self.client.logout()
+        response, queries = self.get_detail()
+        self.assertEqual(queries, [])
+        self.assertContains(response, 'comment-owner-actions d-none')
+
+    def test_comment_views_bump_version(self):
+        self.get_detail()
+        self.client.force_login(self.user)
+        created = self.client.post(reverse('blog:comment_create', args=[self.post.pk]), {'text': 'Второй'}).json()
+        response, _ = self.get_detail()
+        self.assertContains(response, 'Второй')
+
+        comment_id = created['comment']['id']
+        self.client.post(reverse('blog:comment_update', args=[comment_id]), {'text': 'Исправленный'})
+        response, _ = self.get_detail()
+        self.assertContains(response, 'Исправленный')
+
+        self.client.post(reverse('blog:comment_delete', args=[comment_id]))
+        response, _ = self.get_detail()
+        self.assertNotContains(response, 'Исправленный')
+
+
+class AnonymousPageCacheTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.tag = Tag.objects.create(name='тег')
+        cls.post, = cls.make_posts(1, cls.user, cls.category, [cls.tag])
+
+    def urls(self):
+        return [reverse('blog:main_page'), self.category.get_absolute_url(), self.tag.get_absolute_url()]
+
+    def test_cache_hit_skips_database(self):
+        for url in self.urls():
+            first = self.client.get(url)
+            self.assertIn('public', first['Cache-Control'])
+            self.assertIn('Cookie', first['Vary'])
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(second.content, first.content)
+
+    def test_authenticated_users_are_not_cached(self):
+        self.client.force_login(self.user)
+        response = self.client.get(reverse('blog:main_page'))
+        self.assertIn('private', response['Cache-Control'])
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('blog:main_page'))
+        self.assertTrue(queries)
+
+    def test_publish_action_invalidates_listings(self):
+        draft, = self.make_posts(1, self.user, self.category, [self.tag], status='draft', prefix='Черновик')
+        for url in self.urls():
+            self.assertNotContains(self.client.get(url), draft.title)
+        admin = User.objects.create_superuser('admin', password='pass12345')
+        self.client.force_login(admin)
+        self.client.post(reverse('admin:blog_post_changelist'), {
+            'action': 'publish_selected', '_selected_action': [draft.pk],
+        })
+        self.client.logout()
+        for url in self.urls():
+            self.assertContains(self.client.get(url), draft.title)
+
+    def test_publish_action_with_status_filter_invalidates_listings(self):
+        draft, = self.make_posts(1, self.user, self.category, [self.tag], status='draft', prefix='Черновик')
+        for url in self.urls():
+            self.client.get(url)
+        self.client.force_login(User.objects.create_superuser('admin', password='pass12345'))
+        # После update() отфильтрованный по статусу queryset действия пуст
+        self.client.post(reverse('admin:blog_post_changelist') + '?status__exact=draft', {
+            'action': 'publish_selected', '_selected_action': [draft.pk],
+        })
+        self.client.logout()
+        for url in self.urls():
+            self.assertContains(self.client.get(url), draft.title)
+
+    def test_taxonomy_changes_invalidate_listings(self):
+        for url in self.urls():
+            self.client.get(url)
+        self.tag.name = 'переименованный'
+        self.tag.save()
+        self.category.name = 'Обновлённая'
+        self.category.save()
+        for url in self.urls():
+            response = self.client.get(url)
+            self.assertContains(response, 'переименованный')
+            self.assertContains(response, 'Обновлённая')
+
+
+class TagAssignmentTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.post, = cls.make_posts(1, cls.user, cls.category)
+
+    def tag_names(self):
+        return sorted(self.post.tags.values_list('name', flat=True))
+
+    def test_queries_do_not_depend_on_tag_count(self):
+        def replace_tags(count):
+            set_post_tags(self.post, [f'старый{count}-{i}' for i in range(count)])
+            with CaptureQueriesContext(connection) as queries:
+                set_post_tags(self.post, [f'новый{count}-{i}' for i in range(count)])
+            return len(queries)
+
+        self.assertEqual(replace_tags(2), replace_tags(15))
+
+    def test_only_difference_is_applied(self):
+        set_post_tags(self.post, ['один', 'два'])
+        kept = self.post.tags.through.objects.get(post=self.post, tag__name='один').pk
+        set_post_tags(self.post, [' ОДИН ', 'три'])
+        self.assertEqual(self.tag_names(), ['один', 'три'])
+        self.assertTrue(self.post.tags.through.objects.filter(pk=kept).exists())
+        self.assertEqual(Tag.objects.filter(name='один').count(), 1)
+
+    def test_normalized_name_is_unique(self):
+        Tag.objects.create(name='python')
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Tag.objects.bulk_create([Tag(name='Python', slug='python-2')])
+
+    def test_update_view_rewrites_tags_once(self):
+        set_post_tags(self.post, ['старый', 'общий'])
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('blog:update_post', args=[self.post.pk]), {
+            'title': self.post.title, 'category': self.category.pk, 'text': 'Текст',
+            'tags_input': 'общий, Новый',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(self.tag_names(), ['новый', 'общий'])
+
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, BLOG_IMAGE_VARIANTS={'WIDTHS': (160, 480), 'SYNC': True})
+class ImageVariantTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def upload(self, name='photo.png', size=(1200, 800), color=(200, 50, 50, 255)):
+        buffer = BytesIO()
+        Image.new('RGBA', size, color).save(buffer, format='PNG')
+        return SimpleUploadedFile(name, buffer.getvalue(), content_type='image/png')
+
+    def create_post(self, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            return Post.objects.create(
+                title='С картинкой', text='Текст', category=self.category, author=self.user,
+                status='published', image=self.upload(**kwargs),
+            )
+
+    def render(self, post):
+        return Template('{% load post_images %}{% responsive_image post sizes="60px" class="x" %}').render(
+            Context({'post': post})
+        )
+
+    def test_variants_are_generated_after_commit(self):
+        post = self.create_post()
+        post.refresh_from_db()
+        variants = post.image_variants['variants']
+        self.assertEqual([(v['format'], v['width'], v['height']) for v in variants],
+                         [('webp', 160, 107), ('webp', 480, 320), ('jpeg', 160, 107), ('jpeg', 480, 320)])
+        for variant in variants:
+            self.assertTrue(default_storage.exists(variant['name']))
+
+    def test_small_image_is_not_upscaled(self):
+        post = self.create_post(size=(100, 50))
+        post.refresh_from_db()
+        self.assertEqual({v['width'] for v in post.image_variants['variants']}, {100})
+
+    def test_template_tag_emits_srcset(self):
+        post = self.create_post()
+        self.assertIn(f'src="{post.image.url}"', self.render(post))  # варианты ещё не загружены
+        post.refresh_from_db()
+        html = self.render(post)
+        self.assertIn('<source type="image/webp"', html)
+        self.assertIn('.webp 160w', html)
+        self.assertIn('.jpg 480w', html)
+        self.assertIn('sizes="60px"', html)
+        self.assertIn('class="x"', html)
+
+    def test_replaced_image_drops_old_variants(self):
+        post = self.create_post()
+        post.refresh_from_db()
+        old = [v['name'] for v in post.image_variants['variants']]
+        post.image = self.upload(name='other.png', color=(0, 0, 255, 255))
+        with self.captureOnCommitCallbacks(execute=True):
+            post.save()
+        post.refresh_from_db()
+        self.assertEqual(post.image_variants['source'], post.image.name)
+        self.assertFalse(any(default_storage.exists(name) for name in old))
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, BLOG_IMAGE_VARIANTS={'SYNC': True})
+class MediaStorageTests(BlogTestMixin, TestCase):
+    def save(self, content, name='photo.jpg'):
+        return default_storage.save(f'posts/{name}', SimpleUploadedFile(name, content))
+
+    def test_identical_uploads_are_stored_once(self):
+        first = self.save(b'same bytes', 'a.jpg')
+        second = self.save(b'same bytes', 'b.JPG')
+        self.assertEqual(first, second)
+        self.assertRegex(first, r'^posts/[0-9a-f]{2}/[0-9a-f]{64}\.jpg$')
+        self.assertNotEqual(self.save(b'other bytes'), first)
+
+    def test_hashed_file_is_immutable(self):
+        name = self.save(b'0123456789')
+        url = default_storage.url(name)
+        response = self.client.get(url)
+        self.assertEqual(b''.join(response.streaming_content), b'0123456789')
+        self.assertIn('immutable', response['Cache-Control'])
+        etag = response['ETag']
+        self.assertEqual(etag, '"%s"' % name.rsplit('/', 1)[1].split('.')[0])
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+    def test_range_requests(self):
+        url = default_storage.url(self.save(b'0123456789'))
+        response = self.client.get(url, HTTP_RANGE='bytes=2-4')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response['Content-Range'], 'bytes 2-4/10')
+        self.assertEqual(b''.join(response.streaming_content), b'234')
+        self.assertEqual(b''.join(self.client.get(url, HTTP_RANGE='bytes=-3').streaming_content), b'789')
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=20-').status_code, 416)
+        # If-Range с чужим ETag - отдаём файл целиком
+        self.assertEqual(self.client.get(url, HTTP_RANGE='bytes=2-4', HTTP_IF_RANGE='"old"').status_code, 200)
+
+    def test_path_traversal(self):
+        self.assertEqual(self.client.get('/media/../manage.py').status_code, 404)
+
+
+class ConditionalGetTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.reader = User.objects.create_user('reader', password='pass12345')
+        cls.post, = cls.make_posts(1, cls.user, cls.category)
+
+    def detail_url(self):
+        return reverse('blog:post_detail', args=[self.post.slug])
+
+    def test_unchanged_detail_returns_304_without_rendering(self):
+        response = self.client.get(self.detail_url())
+        etag = response['ETag']
+        self.assertTrue(response.has_header('Last-Modified'))
+        with self.assertNumQueries(1), self.assertTemplateNotUsed('blog/post_detail.html'):
+            response = self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_detail_etag_follows_comments_and_reactions(self):
+        self.client.force_login(self.reader)
+        etag = self.client.get(self.detail_url())['ETag']
+        self.client.post(reverse('blog:comment_create', args=[self.post.pk]), {'text': 'Новый'})
+        response = self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        self.client.post(reverse('blog:post_favorite', args=[self.post.pk]))
+        self.assertEqual(self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_etag_depends_on_user(self):
+        etag = self.client.get(self.detail_url())['ETag']
+        self.client.force_login(self.reader)
+        self.assertEqual(self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_etag_depends_on_csrf_secret(self):
+        # Вход меняет секрет CSRF: страница со старым токеном в форме не должна прийти из кэша
+        self.client.force_login(self.reader)
+        etag = self.client.get(self.detail_url())['ETag']
+        self.assertEqual(self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.cookies[settings.CSRF_COOKIE_NAME] = get_random_string(32)
+        self.assertEqual(self.client.get(self.detail_url(), HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_listing_304_and_invalidation(self):
+        url = reverse('blog:post_list')
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.make_posts(1, self.user, self.category)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_listing_etag_ignores_personal_flags(self):
+        # Избранное подставляет скрипт, HTML списка от него не зависит
+        self.client.force_login(self.reader)
+        url = reverse('blog:main_page')
+        etag = self.client.get(url)['ETag']
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post(reverse('blog:post_favorite', args=[self.post.pk]))
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.force_login(self.user)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class AsyncViewTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.reader = User.objects.create_user('reader', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.post = Post.objects.create(
+            title='Пост', text='Текст', category=cls.category, author=cls.user, status='published',
+        )
+
+    async def call(self, view, user, method='post', data=None, **kwargs):
+        request = getattr(AsyncRequestFactory(), method)('/', data or {})
+
+        async def auser():
+            return user or AnonymousUser()
+
+        request.auser = auser
+        response = await view.as_view()(request, **kwargs)
+        return response.status_code, json.loads(response.content)
+
+    async def test_anonymous_gets_401(self):
+        status, data = await self.call(async_views.AsyncPostFavoriteToggleView, None, post_id=self.post.pk)
+        self.assertEqual(status, 401)
+        self.assertEqual(data['status'], 'error')
+
+    async def test_reactions_and_favorites(self):
+        view = async_views.AsyncLikeDislikePostView
+        _, data = await self.call(view, self.reader, data={'action': 'like'}, post_id=self.post.pk)
+        self.assertEqual((data['action'], data['like_count']), ('liked', 1))
+        _, data = await self.call(view, self.reader, data={'action': 'dislike'}, post_id=self.post.pk)
+        self.assertEqual((data['like_count'], data['dislike_count']), (0, 1))
+        _, data = await self.call(async_views.AsyncPostFavoriteToggleView, self.reader, post_id=self.post.pk)
+        self.assertEqual((data['action'], data['favorites_count']), ('added', 1))
+
+    async def test_reaction_batch(self):
+        request = AsyncRequestFactory().post('/', {'operations': [
+            {'post_id': self.post.pk, 'kind': 'like', 'active': True},
+            {'post_id': self.post.pk, 'kind': 'favorite', 'active': True},
+        ]}, content_type='application/json')
+
+        async def auser():
+            return self.reader
+
+        request.auser = auser
+        response = await async_views.AsyncReactionBatchView.as_view()(request)
+        state = json.loads(response.content)['posts'][str(self.post.pk)]
+        self.assertEqual((state['liked'], state['like_count'], state['favorites_count']), (True, 1, 1))
+
+    async def test_comment_lifecycle(self):
+        create = async_views.AsyncCommentCreateView
+        _, root = await self.call(create, self.reader, data={'text': 'Корень'}, post_id=self.post.pk)
+        _, reply = await self.call(
+            create, self.user, data={'text': 'Ответ', 'parent_id': root['comment']['id']}, post_id=self.post.pk,
+        )
+        self.assertEqual(reply['comment']['level'], 1)
+
+        status, _ = await self.call(
+            async_views.AsyncCommentUpdateView, self.user, data={'text': 'Чужой'}, comment_id=root['comment']['id'],
+        )
+        self.assertEqual(status, 403)
+
+        _, data = await self.call(async_views.AsyncMoreCommentsView, None, method='get', post_slug=self.post.slug)
+        self.assertEqual(data['comments'][0]['replies'][0]['text'], 'Ответ')
+
+        await self.call(async_views.AsyncCommentDeleteView, self.reader, comment_id=root['comment']['id'])
+        await self.post.arefresh_from_db()
+        self.assertEqual(self.post.comments_count, 0)
+        self.assertFalse(await Comment.objects.filter(post=self.post).aexists())
+
+
+@override_settings(BLOG_EVENTS={'POLL_INTERVAL': 0.01, 'MAX_DURATION': 0.05, 'HEARTBEAT': 0.02})
+class PostEventsTests(BlogTestMixin, TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('author', password='pass12345')
+        cls.category = Category.objects.create(name='Новости')
+        cls.post = Post.objects.create(
+            title='Пост', text='Текст', category=cls.category, author=cls.user, status='published',
+        )
+
+    def setUp(self):
+        super().setUp()
+        events._backend = None
+
+    async def read_stream(self, last_event_id=None):
+        headers = {'Last-Event-ID': str(last_event_id)} if last_event_id is not None else {}
+        request = AsyncRequestFactory().get('/', headers=headers)
+        response = await async_views.PostEventsView.as_view()(request, post_slug=self.post.slug)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        return ''.join([chunk.decode() async for chunk in response.streaming_content])
+
+    def parse(self, body):
+        parsed = []
+        for block in body.split('\n\n'):
+            fields = dict(line.split(': ', 1) for line in block.splitlines() if ': ' in line and not line.startswith(':'))
+            if 'event' in fields:
+                parsed.append((fields['event'], json.loads(fields['data'])))
+        return parsed
+
+    def test_comment_and_counter_events(self):
+        self.client.force_login(self.user)
+        with self.captureOnCommitCallbacks(execute=True):
+            created = self.client.post(reverse('blog:comment_create', args=[self.post.pk]), {'text': 'Привет'}).json()
+        comment_id = created['comment']['id']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('blog:comment_update', args=[comment_id]), {'text': 'Исправлено'})
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('blog:comment_delete', args=[comment_id]))
+
+        parsed = self.parse(async_to_sync(self.read_stream)(0))
+        self.assertEqual([event for event, _ in parsed],
+                         ['comment_created', 'counters', 'comment_updated', 'comment_deleted', 'counters'])
+        self.assertEqual(parsed[0][1]['text'], 'Привет')
+        self.assertEqual(parsed[0][1]['author_id'], self.user.pk)
+        self.assertFalse(parsed[0][1]['is_author'])
+        self.assertEqual(parsed[1][1], {'comments_count': 1})
+        self.assertEqual(parsed[3][1], {'id': comment_id})
+
+    def test_new_connection_skips_history_and_sends_heartbeat(self):
+        events.get_backend().publish(self.post.pk, 'counters', {'like_count': 1})
+        body = async_to_sync(self.read_stream)()
+        self.assertEqual(self.parse(body), [])
+        self.assertIn('retry: 3000', body)
+        self.assertIn(': ping', body)
+
+    def test_in_process_wait_wakes_on_publish(self):
+        backend = events.InProcessBackend()
+
+        async def wait():
+            loop = asyncio.get_running_loop()
+            started = loop.time()
+            # Публикация из другого потока, как из синхронного воркера
+            loop.call_later(0.05, lambda: threading.Thread(
+                target=backend.publish, args=(self.post.pk, 'counters', {'like_count': 1})).start())
+            await backend.wait(self.post.pk, 0, timeout=5)
+            return loop.time() - started
+
+        self.assertLess(async_to_sync(wait)(), 1)
+        self.assertEqual(backend.waiters, {})
+
+    def test_detail_page_without_asgi_has_no_event_stream(self):
+        # В тестах, как под WSGI, BLOG_ASYNC_VIEWS выключен: маршрута и подключения нет
+        response = self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        self.assertNotContains(response, 'data-events-url')
+
+    def test_cache_backend_replays_after_last_event_id(self):
+        backend = events.CacheBackend()
+        for count in range(3):
+            backend.publish(self.post.pk, 'counters', {'like_count': count})
+        self.assertEqual([data for _, _, data in backend.events_since(self.post.pk, 1)],
+                         [{'like_count': 1}, {'like_count': 2}])
+
+
+class BlogBenchTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        cache.clear()
+
+    def run_bench(self, *args):
+        output = f'{self.tmpdir}/bench.json'
+        call_command('blogbench', '--in-place', '--scale', 'tiny', '--iterations', '3', '--output', output, *args,
+                     stderr=StringIO())
+        with open(output, encoding='utf-8') as file:
+            return json.load(file)
+
+    def test_report_covers_every_view_without_errors(self):
+        report = self.run_bench()
+        self.assertEqual(report['meta']['seed'], 42)
+        self.assertLessEqual(Comment.objects.count(), report['meta']['sizes']['comments'])
+        self.assertTrue(Comment.objects.filter(level__gte=2).exists())
+        for name in ('main_anonymous', 'search', 'category', 'tag', 'detail', 'more_comments',
+                     'like_toggle', 'favorite_toggle', 'login_failed'):
+            result = report['views'][name]
+            self.assertEqual(result['errors'], 0, name)
+            self.assertLessEqual(result['p50_ms'], result['p95_ms'])
+            if name != 'main_anonymous':  # Анонимная главная может целиком отдаваться из кэша страниц
+                self.assertGreater(result['queries_max'], 0, name)
+
+    def test_regression_against_baseline_fails(self):
+        baseline = f'{self.tmpdir}/baseline.json'
+        report = self.run_bench('--views', 'detail')
+        report['views']['detail'].update(p95_ms=0.001, queries_max=1)
+        with open(baseline, 'w', encoding='utf-8') as file:
+            json.dump(report, file)
+        Comment.objects.all().delete()
+        Post.objects.all().delete()
+        get_user_model().objects.all().delete()
+        Tag.objects.all().delete()
+        Category.objects.all().delete()
+        with self.assertRaises(CommandError):
+            self.run_bench('--views', 'detail', '--baseline', baseline, '--fail-on-regression')
+
+
+class InstrumentationTests(BlogTestMixin, TestCase):
+    instrumentation = {'SAMPLE_RATE': 1.0, 'SLOW_REQUEST_MS': 10_000, 'DUPLICATE_THRESHOLD': 3}
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user(username='author', password='password')
+        self.category = Category.objects.create(name='Категория')
+        self.post = self.make_posts(1, self.user, self.category)[0]
+
+    def repeat_queries(self, request):
+        for _ in range(4):
+            list(Post.objects.filter(pk__in=[self.post.pk, 0]))
+        return HttpResponse()
+
+    def test_server_timing_header_counts_queries(self):
+        response = self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        timing = response['Server-Timing']
+        self.assertRegex(timing, r'sql;dur=[\d.]+;desc="\d+ queries"')
+        self.assertIn('total;dur=', timing)
+
+    @override_settings(BLOG_INSTRUMENTATION={'SAMPLE_RATE': 0})
+    def test_unsampled_requests_are_not_measured(self):
+        response = self.client.get(reverse('blog:main_page'))
+        self.assertNotIn('Server-Timing', response)
+
+    def test_repeated_queries_are_logged(self):
+        middleware = RequestInstrumentationMiddleware(self.repeat_queries)
+        with self.assertLogs('blog.instrumentation', 'WARNING') as logs:
+            response = middleware(RequestFactory().get('/'))
+        record = json.loads(logs.records[0].getMessage())
+        self.assertEqual(record['queries'], 4)
+        self.assertEqual(record['duplicates'][0]['count'], 4)
+        self.assertIn('IN (...)', record['duplicates'][0]['sql'])
+        self.assertIn('dup;desc="4 repeated"', response['Server-Timing'])
+
+    def test_async_view_queries_are_counted(self):
+        async def view(request):
+            await sync_to_async(self.repeat_queries)(request)
+            return HttpResponse()
+
+        middleware = RequestInstrumentationMiddleware(view)
+        with self.assertLogs('blog.instrumentation', 'WARNING') as logs:
+            async_to_sync(middleware)(AsyncRequestFactory().get('/'))
+        self.assertEqual(json.loads(logs.records[0].getMessage())['queries'], 4)
+
+
+class MetricsTests(BlogTestMixin, TestCase):
+    def setUp(self):
+        super().setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        settings_override = override_settings(BLOG_METRICS={'DIR': self.tmpdir, 'FLUSH_INTERVAL': 3600})
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        registry = metrics.Registry()
+        registry.register_gauge('blog_view_counter_pending', lambda: 2)
+        registry_patch = patch.object(metrics, 'registry', registry)
+        registry_patch.start()
+        self.addCleanup(registry_patch.stop)
+
+        self.user = User.objects.create_user(username='author', password='password')
+        self.post = self.make_posts(1, self.user, Category.objects.create(name='Категория'))[0]
+
+    def write_snapshot(self, pid, values, gauges):
+        with open(f'{self.tmpdir}/{pid}.json', 'w') as file:
+            json.dump({'pid': pid, 'values': values, 'gauges': gauges}, file)
+
+    def test_requests_are_counted_per_url_name(self):
+        self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        self.client.get(reverse('blog:post_detail', args=[self.post.slug]))
+        self.client.get(reverse('blog:main_page'))
+        with self.settings(INTERNAL_IPS=['127.0.0.1']):
+            body = self.client.get(reverse('metrics')).content.decode()
+        self.assertIn('blog_http_requests_total{view="blog:post_detail",method="GET",status="200"} 2', body)
+        self.assertIn('blog_http_request_duration_seconds_count{view="blog:main_page"} 1', body)
+        self.assertIn('blog_http_request_duration_seconds_bucket{view="blog:main_page",le="+Inf"} 1', body)
+        self.assertIn('blog_db_queries_per_request_count{view="blog:post_detail"} 2', body)
+        self.assertIn('blog_cache_requests_total{cache="page",result="miss"} 1', body)
+        self.assertIn('blog_cache_requests_total{cache="comment_section",result="hit"} 1', body)
+        self.assertIn('blog_view_counter_pending 2', body)
+
+    def test_snapshots_of_other_processes_are_summed(self):
+        metrics.registry.inc('blog_http_errors_total', ['blog:post_like'])
+        # Живой процесс (родитель) и завершившийся: его гейдж устарел, счётчики остаются
+        self.write_snapshot(os.getppid(), {'blog_http_errors_total': {'["blog:post_like"]': 2}},
+                            {'blog_view_counter_pending': 5})
+        self.write_snapshot(2 ** 22 + 1, {'blog_http_errors_total': {'["blog:post_like"]': 4}},
+                            {'blog_view_counter_pending': 100})
+        body = metrics.render()
+        self.assertIn('blog_http_errors_total{view="blog:post_like"} 7', body)
+        self.assertIn('blog_view_counter_pending 7', body)
+
+    def test_without_token_only_internal_ips_and_debug(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        with self.settings(INTERNAL_IPS=['127.0.0.1']):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.5').status_code, 403)
+        with self.settings(DEBUG=True):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 200)
+
+    def test_token_is_required_when_configured(self):
+        with override_settings(BLOG_METRICS={'DIR': self.tmpdir, 'TOKEN': 'secret'}):
+            self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+            response = self.client.get(reverse('metrics'), headers={'Authorization': 'Bearer secret'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain; version=0.0.4'))
+
+
+class ImportBlogTests(TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.tmpdir)
+        cache.clear()
+
+    def write(self, name, content):
+        path = f'{self.tmpdir}/{name}'
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def ndjson(self, records):
+        return '\n'.join(json.dumps(record, ensure_ascii=False) for record in records) + '\n'
+
+    def import_blog(self, *args):
+        stdout, stderr = StringIO(), StringIO()
+        call_command('import_blog', *args, stdout=stdout, stderr=stderr)
+        return stdout.getvalue(), stderr.getvalue()
+
+    def test_posts_and_comment_trees_are_imported(self):
+        records = [
+            {'type': 'post', 'id': 'p1', 'title': 'Первый пост', 'text': 'Текст про django', 'category': 'Новости',
+             'tags': ['Python', 'django'], 'author': 'anna', 'created_at': '2019-05-01T10:00:00'},
+            {'type': 'post', 'id': 'p2', 'title': 'Второй пост', 'text': 'Текст', 'category': 'Новости',
+             'tags': 'python', 'author': 'boris', 'status': 'draft'},
+            {'type': 'comment', 'id': 'c0', 'post': 'p1', 'author': 'boris', 'text': 'Корень'},
+        ]
+        # Цепочка ответов глубже допустимого уровня
+        records += [
+            {'type': 'comment', 'id': f'c{number}', 'parent': f'c{number - 1}', 'author': 'anna', 'text': 'Ответ'}
+            for number in range(1, COMMENT_MAX_LEVEL + 3)
+        ]
+        records.append({'type': 'comment', 'id': 'bad', 'parent': 'missing', 'author': 'anna', 'text': 'Сирота'})
+        output, errors = self.import_blog(self.write('blog.ndjson', self.ndjson(records)), '--batch-size', '3')
+
+        self.assertIn('постов: 2', output)
+        self.assertIn('missing', errors)
+        first = Post.objects.get(title='Первый пост')
+        self.assertEqual(first.slug, 'pervyi-post')
+        self.assertEqual(first.created_at.year, 2019)
+        self.assertEqual(sorted(first.tags.values_list('name', flat=True)), ['django', 'python'])
+        self.assertEqual(Post.objects.get(title='Второй пост').status, 'draft')
+        self.assertEqual(Tag.objects.count(), 2)
+        self.assertEqual(first.comments_count, COMMENT_MAX_LEVEL + 3)
+        self.assertEqual(get_backend().search('django')[0].post_id, first.pk)
+        for comment in first.comments.select_related('parent'):
+            self.assertLessEqual(comment.level, COMMENT_MAX_LEVEL)
+            self.assertEqual(comment.path, comment.parent.subtree_prefix if comment.parent else '')
+        self.assertFalse(User.objects.get(username='anna').has_usable_password())
+
+    def test_existing_titles_are_skipped_and_csv_is_supported(self):
+        header = 'id,title,text,category,tags,author\n'
+        path = self.write('posts.csv', header + '1,Пост,Текст,Кино,"a, b",anna\n2,Другой,Текст,Кино,,anna\n')
+        self.import_blog(path, '--type', 'post')
+        output, _ = self.import_blog(path, '--type', 'post')
+        self.assertIn('пропущено существующих: 2', output)
+        self.assertEqual(Post.objects.count(), 2)
+        self.assertEqual(Category.objects.get().slug, 'kino')
+
+    def test_query_count_does_not_grow_with_batch(self):
+        def records(count, prefix):
+            return self.ndjson(
+                {'type': 'post', 'id': number, 'title': f'{prefix} {number}', 'text': 'Текст',
+                 'category': 'Кино', 'tags': ['общий'], 'author': 'anna'}
+                for number in range(count)
+            )
+
+        self.import_blog(self.write('warm.ndjson', records(1, 'Прогрев')))
+        with CaptureQueriesContext(connection) as small:
+            self.import_blog(self.write('small.ndjson', records(5, 'Малый')))
+        with CaptureQueriesContext(connection) as large:
+            self.import_blog(self.write('large.ndjson', records(50, 'Большой')))
+        # Индекс поиска пишется по посту, остальное - пачкой
+        per_post = 2
+        self.assertEqual(len(large) - 50 * per_post, len(small) - 5 * per_post)
+
+
+class QueryPlanTests(BlogTestMixin, TestCase):
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            return ' | '.join(row[-1] for row in cursor.fetchall())
+
+    def test_listings_and_root_comments_use_indexes(self):
+        user = User.objects.create_user(username='author', password='password')
+        category = Category.objects.create(name='Категория')
+        post = self.make_posts(1, user, category)[0]
+        published = Post.objects.published()
+        main = self.plan(published.order_by('-created_at', '-id')[:9])
+        self.assertIn('post_published_recent', main)
+        self.assertNotIn('TEMP B-TREE', main)
+        self.assertIn('post_category_recent', self.plan(published.filter(category=category).order_by('-created_at')))
+        tag = Tag.objects.create(name='Тег')
+        post.tags.add(tag)
+        tagged = self.plan(published.tagged(tag).order_by('-created_at', '-id'))
+        self.assertIn('post_published_recent', tagged)
+        self.assertNotIn('TEMP B-TREE', tagged)
+        favorites = self.plan(
+            Post.objects.filter(reactions__user=user, reactions__kind=Reaction.FAVORITE)
+            .published().order_by('-reactions__created_at', '-reactions__id')
+        )
+        self.assertIn('reaction_user_recent', favorites)
+        self.assertNotIn('TEMP B-TREE', favorites)
+        roots = self.plan(post.comments.roots().order_by('created_at', 'id'))
+        self.assertIn('comment_post_roots', roots)
+        self.assertNotIn('TEMP B-TREE', roots)
+
+    def test_explain_hot_paths_passes_and_detects_full_scans(self):
+        output = StringIO()
+        call_command('explain_hot_paths', '--in-place', stdout=output)
+        self.assertIn('используют индексы', output.getvalue())
+        issues = list(ExplainCommand().plan_issues('SELECT * FROM "blog_posts" WHERE "text" = %s', ['x']))
+        self.assertEqual(issues, ['полный просмотр таблицы blog_posts'])
@@ -1,22 +1,48 @@
+from django.conf import settings
 from django.urls import path
 from .import views 
 
+if settings.BLOG_ASYNC_VIEWS:
+    from .async_views import (
+        PostEventsView,
+        AsyncCommentCreateView as CommentCreateView,
+        AsyncCommentDeleteView as CommentDeleteView,
+        AsyncCommentUpdateView as CommentUpdateView,
+        AsyncLikeDislikePostView as LikeDislikePostView,
+        AsyncMoreCommentsView as MoreCommentsView,
+        AsyncPostFavoriteToggleView as PostFavoriteToggleView,
+        AsyncReactionBatchView as ReactionBatchView,
+    )
+else:
+    from .views import (
+        CommentCreateView, CommentDeleteView, CommentUpdateView, LikeDislikePostView, MoreCommentsView,
+        PostFavoriteToggleView, ReactionBatchView,
+    )
+
 app_name = 'blog'
 
 urlpatterns = [
     path('posts/', views.PostListView.as_view(), name="post_list"),
+    path('posts/feed/', views.MainPageFeedView.as_view(), name="main_feed"),
+    path('posts/state/', views.PostStateView.as_view(), name="post_state"),
     path('posts/add/', views.PostCreateView.as_view(), name="post_add"),
     path('posts/<int:pk>/edit/', views.PostUpdateView.as_view(), name="update_post"),
     path('posts/<int:pk>/delete/', views.PostDeleteView.as_view(), name="remove_post"),
     path('posts/category/<slug:category_slug>/', views.CategoryPostsView.as_view(), name="category_posts"),
     path('posts/<slug:post_slug>/', views.PostDetailView.as_view(), name="post_detail"),
     path('posts/tag/<slug:tag_slug>/', views.TagPostsView.as_view(), name="tag_posts"),
-    path('posts/<int:post_id>/like-dislike/', views.LikeDislikePostView.as_view(), name="post_like"),
-    path('posts/<int:post_id>/comment/', views.CommentCreateView.as_view(), name="comment_create"),
-    path('comments/<int:comment_id>/edit/', views.CommentUpdateView.as_view(), name="comment_update"),
-    path('comments/<int:comment_id>/delete/', views.CommentDeleteView.as_view(), name="comment_delete"),
-    path('posts/<int:post_id>/favorite/', views.PostFavoriteToggleView.as_view(), name="post_favorite"),
+    path('posts/<int:post_id>/like-dislike/', LikeDislikePostView.as_view(), name="post_like"),
+    path('posts/<int:post_id>/comment/', CommentCreateView.as_view(), name="comment_create"),
+    path('comments/<int:comment_id>/edit/', CommentUpdateView.as_view(), name="comment_update"),
+    path('comments/<int:comment_id>/delete/', CommentDeleteView.as_view(), name="comment_delete"),
+    path('posts/<int:post_id>/favorite/', PostFavoriteToggleView.as_view(), name="post_favorite"),
+    path('reactions/batch/', ReactionBatchView.as_view(), name="reaction_batch"),
     path('favorites/', views.FavoritePostsView.as_view(), name="favorite_posts"),
-    path('posts/<slug:post_slug>/more_comments/', views.MoreCommentsView.as_view(), name="more_comments"),
+    path('posts/<slug:post_slug>/more_comments/', MoreCommentsView.as_view(), name="more_comments"),
     path('', views.MainPageView.as_view(), name='main_page'),
-]
\ No newline at end of file
+]
+
+if settings.BLOG_ASYNC_VIEWS:
+    # Поток SSE держит соединение минутами: под WSGI он занимал бы поток воркера
+    # и ничего не отдавал до закрытия, поэтому маршрут есть только под ASGI
+    urlpatterns.append(path('posts/<slug:post_slug>/events/', PostEventsView.as_view(), name="post_events"))
\ No newline at end of file
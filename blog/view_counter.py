@@ -0,0 +1,134 @@
+"""
+Буферизованный счётчик просмотров постов.
+
+Просмотры копятся в памяти процесса и сбрасываются в blog_posts пачкой:
+по достижении порога FLUSH_THRESHOLD, не реже раза в FLUSH_INTERVAL секунд
+и при завершении процесса. Повторные просмотры одного читателя отсекаются
+через кэш Django (cache.add), поэтому при общем кэше (Redis, memcached)
+дедупликация работает между воркерами.
+"""
+import atexit
+import hashlib
+import logging
+import threading
+import time
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    'FLUSH_INTERVAL': 30,
+    'FLUSH_THRESHOLD': 500,
+    'DEDUP_TIMEOUT': 60 * 60 * 6,
+}
+
+
+def get_setting(name):
+    return getattr(settings, 'BLOG_VIEW_COUNTER', {}).get(name, DEFAULTS[name])
+
+
+def viewer_key(request):
+    """Идентификатор читателя: пользователь, сессия или хэш IP и User-Agent"""
+    if request.user.is_authenticated:
+        return f'u{request.user.pk}'
+    session_key = getattr(request, 'session', None) and request.session.session_key
+    if session_key:
+        return f's{session_key}'
+    raw = f"{request.META.get('REMOTE_ADDR', '')}|{request.META.get('HTTP_USER_AGENT', '')}"
+    return 'a' + hashlib.blake2b(raw.encode(), digest_size=8).hexdigest()
+
+
+class ViewCounter:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.counts = Counter()
+        self.viewers = set()
+        self.last_flush = time.monotonic()
+
+    def record(self, post, request):
+        """Учитывает просмотр; возвращает True, если он не повторный"""
+        if not cache.add(f'blog:post-view:{post.pk}:{viewer_key(request)}', 1, get_setting('DEDUP_TIMEOUT')):
+            return False
+        with self.lock:
+            self.counts[post.pk] += 1
+            if request.user.is_authenticated:
+                self.viewers.add((post.pk, request.user.pk))
+            pending = sum(self.counts.values())
+        if (pending >= get_setting('FLUSH_THRESHOLD')
+                or time.monotonic() - self.last_flush >= get_setting('FLUSH_INTERVAL')):
+            try:
+                self.flush()
+            except Exception:
+                # Просмотры остались в буфере; ошибка сброса не должна ломать страницу поста
+                logger.exception('Не удалось записать просмотры постов')
+        return True
+
+    def pending(self, post_id=None):
+        with self.lock:
+            return self.counts[post_id] if post_id is not None else sum(self.counts.values())
+
+    def flush(self):
+        """Записывает накопленные просмотры: по одному UPDATE на каждое значение прироста"""
+        if not self.flush_lock.acquire(blocking=False):
+            return 0  # Сброс уже идёт в другом потоке
+        try:
+            with self.lock:
+                counts, viewers = self.counts, self.viewers
+                self.counts, self.viewers = Counter(), set()
+                self.last_flush = time.monotonic()
+            if not counts:
+                return 0
+            from django.contrib.auth import get_user_model
+            from .models import AuthorStats, Post
+
+            try:
+                # Посты и пользователи могли быть удалены, пока просмотры лежали в буфере:
+                # их строки отбрасываем, иначе внешний ключ ронял бы каждый следующий сброс
+                live_posts = set(Post.objects.filter(pk__in=counts).values_list('pk', flat=True))
+                live_users = set(get_user_model().objects.filter(
+                    pk__in={user_id for _, user_id in viewers}).values_list('pk', flat=True))
+                counts = Counter({post_id: delta for post_id, delta in counts.items() if post_id in live_posts})
+                viewers = {(post_id, user_id) for post_id, user_id in viewers
+                           if post_id in live_posts and user_id in live_users}
+                by_delta = defaultdict(list)
+                for post_id, delta in counts.items():
+                    by_delta[delta].append(post_id)
+                with transaction.atomic():
+                    for delta, post_ids in by_delta.items():
+                        Post.objects.filter(pk__in=post_ids).update(views_count=F('views_count') + delta)
+                    AuthorStats.objects.add_post_deltas(
+                        {post_id: {'views_count': delta} for post_id, delta in counts.items()}
+                    )
+                    Post.viewed_users.through.objects.bulk_create(
+                        [Post.viewed_users.through(post_id=post_id, user_id=user_id) for post_id, user_id in viewers],
+                        ignore_conflicts=True,
+                    )
+            except Exception:
+                # Возвращаем данные в буфер, чтобы не потерять просмотры
+                with self.lock:
+                    self.counts.update(counts)
+                    self.viewers |= viewers
+                raise
+            return sum(counts.values())
+        finally:
+            self.flush_lock.release()
+
+
+view_counter = ViewCounter()
+registry.register_gauge('blog_view_counter_pending', view_counter.pending)
+
+
+@atexit.register
+def _flush_on_exit():
+    try:
+        view_counter.flush()
+    except Exception:
+        pass
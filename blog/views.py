@@ -1,32 +1,167 @@
+import hashlib
+import json
+import logging
+
 from django.views.generic import ListView, DetailView, CreateView, UpdateView, DeleteView, View
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
+from django.middleware.csrf import get_token
 from django.contrib.auth.mixins import LoginRequiredMixin
 from django.shortcuts import get_object_or_404, redirect
-from .models import Post, Category, Tag, Comment
+from .models import Post, Category, Tag, Comment, Reaction, VIEWED, COMMENT_MAX_LEVEL
 from .forms import PostForm
+from .interactions import (
+    apply_reactions, create_comment, delete_comment, parse_reaction_operations, reaction_state, toggle_favorite,
+    toggle_reaction,
+)
+from .cache import (
+    MAIN_LISTING, category_listing_name, comments_version_name, get_version, listing_etag, page_cache_key,
+    tag_listing_name,
+)
+from .comments import LATEST_ROOT_COMMENTS, comment_data, comment_section, load_comment_tree, serialize_comment_tree
+from .pagination import CursorPaginator, InvalidCursor
+from .search import get_backend, highlight
+from .metrics import cache_access
+from .view_counter import view_counter
 from django.urls import reverse, reverse_lazy
-from django.db.models import Q
+from django.db.models import Case, IntegerField, Max, When
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 from django.conf import settings
+from django.core.cache import cache
+from django.template.loader import render_to_string
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.functional import SimpleLazyObject
+from django.utils.http import http_date
+
+logger = logging.getLogger(__name__)
+
+
+class ConditionalGetMixin:
+    """
+    Условные GET-запросы: если валидаторы из get_validators() совпали с
+    If-None-Match / If-Modified-Since, отвечаем 304 без запросов к данным и шаблона
+    """
+    def get_validators(self):
+        """(etag, last_modified) - ETag в кавычках и timestamp; None - валидатора нет"""
+        return None, None
+
+    def get(self, request, *args, **kwargs):
+        etag, last_modified = self.get_validators()
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        if etag and not response.has_header('ETag'):
+            response.headers['ETag'] = etag
+        if last_modified and not response.has_header('Last-Modified'):
+            response.headers['Last-Modified'] = http_date(last_modified)
+        return response
+
+
+class AnonymousPageCacheMixin(ConditionalGetMixin):
+    """
+    Кэш целой страницы для анонимных GET-запросов. Ключ - версии областей
+    (get_page_cache_scopes) и путь с параметрами; версии повышаются сигналами
+    при изменении постов, категорий и тегов. Из тех же версий строится ETag.
+    Карточки не зависят от читателя, поэтому их HTML (cards_cache_key)
+    кэшируется один для всех, в том числе для вошедших пользователей.
+    """
+    def get_page_cache_scopes(self):
+        return [MAIN_LISTING]
+
+    def get_validators(self):
+        return listing_etag(self.request, self.get_page_cache_scopes()), None
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['cards_cache_key'] = page_cache_key(self.request, self.get_page_cache_scopes())
+        context['cards_cache_timeout'] = settings.BLOG_PAGE_CACHE_TIMEOUT
+        return context
+
+    def dispatch(self, request, *args, **kwargs):
+        if request.method not in ('GET', 'HEAD') or request.user.is_authenticated:
+            response = super().dispatch(request, *args, **kwargs)
+            if request.method in ('GET', 'HEAD'):
+                patch_cache_control(response, private=True)
+            return response
+        key = page_cache_key(request, self.get_page_cache_scopes())
+        response = cache.get(key)
+        cache_access('page', response is not None)
+        if response is not None:
+            # Закэшированный ответ хранит свой ETag - проверяем If-None-Match по нему
+            response = get_conditional_response(request, etag=response.get('ETag'), response=response)
+        else:
+            response = super().dispatch(request, *args, **kwargs)
+            if response.status_code == 200:
+                if hasattr(response, 'render'):
+                    response.render()
+                cache.set(key, response, settings.BLOG_PAGE_CACHE_TIMEOUT)
+        patch_cache_control(response, public=True, max_age=settings.BLOG_PAGE_CACHE_MAX_AGE)
+        patch_vary_headers(response, ['Cookie'])
+        return response
+
+
+class CursorPaginationMixin:
+    """Keyset-пагинация для ListView: включается параметром ?cursor=, без COUNT(*) и OFFSET"""
+    cursor_param = 'cursor'
+
+    def cursor_enabled(self):
+        """Курсор годится, только если выдача упорядочена по (created_at, id)"""
+        return True
+
+    def paginate_queryset(self, queryset, page_size):
+        cursor = self.request.GET.get(self.cursor_param) if self.cursor_enabled() else None
+        if cursor is None:
+            return super().paginate_queryset(queryset, page_size)
+        try:
+            page = CursorPaginator(queryset, page_size).page(cursor)
+        except InvalidCursor as e:
+            raise Http404(str(e))
+        return None, page, page.object_list, page.has_other_pages()
+
+    def get_cursor_url(self, cursor):
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        params[self.cursor_param] = cursor
+        return f'?{params.urlencode()}'
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        page = context.get('page_obj')
+        context['cursor_mode'] = self.cursor_enabled() and self.cursor_param in self.request.GET
+        if context['cursor_mode']:
+            context['next_cursor'] = page.next_cursor
+            context['next_page_url'] = self.get_cursor_url(page.next_cursor) if page.has_next() else None
+            context['previous_page_url'] = self.get_cursor_url(page.previous_cursor) if page.has_previous() else None
+        elif page is not None and page.has_next() and self.cursor_enabled():
+            # Курсор для продолжения ленты с последнего поста текущей страницы. Вычисляется
+            # при выводе после карточек: при их промахе кэша без лишнего запроса, при попадании - не нужен
+            context['next_cursor'] = SimpleLazyObject(
+                lambda: CursorPaginator.encode_cursor(page.object_list[len(page.object_list) - 1], 'next')
+            )
+        return context
 
 # Все посты (удалить после)
-class PostListView(ListView):
+class PostListView(AnonymousPageCacheMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name = 'blog/post_list.html'
     context_object_name = 'posts'
-    queryset = Post.objects.filter(status='published').order_by('-created_at')
     paginate_by = 16  # Количество постов на страницу
 
+    def get_queryset(self):
+        return Post.objects.published().cards().order_by('-created_at', '-id')
+
 # Посты по категории
-class CategoryPostsView(ListView):
+class CategoryPostsView(AnonymousPageCacheMixin, ListView):
     model = Post
     template_name = 'blog/category_posts.html'
     context_object_name = 'posts'
 
+    def get_page_cache_scopes(self):
+        return [category_listing_name(self.kwargs['category_slug'])]
+
     def get_queryset(self):
         self.category = get_object_or_404(Category, slug=self.kwargs['category_slug'])
-        return Post.objects.filter(category=self.category, status='published').order_by('-created_at')
+        return Post.objects.filter(category=self.category).published().cards().order_by('-created_at')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -34,14 +169,17 @@ class CategoryPostsView(ListView):
         return context
 
 # Посты по тегу
-class TagPostsView(ListView):
+class TagPostsView(AnonymousPageCacheMixin, ListView):
     model = Post
     template_name = 'blog/tag_posts.html'
     context_object_name = 'posts'
 
+    def get_page_cache_scopes(self):
+        return [tag_listing_name(self.kwargs['tag_slug'])]
+
     def get_queryset(self):
         self.tag = get_object_or_404(Tag, slug=self.kwargs['tag_slug'])
-        return Post.objects.filter(tags=self.tag, status='published').order_by('-created_at')
+        return Post.objects.tagged(self.tag).published().cards().order_by('-created_at', '-id')
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
@@ -49,50 +187,67 @@ class TagPostsView(ListView):
         return context
 
 # Пост по id
-class PostDetailView(DetailView):
+class PostDetailView(ConditionalGetMixin, DetailView):
     model = Post
     template_name = 'blog/post_detail.html'
     context_object_name = 'post'
     slug_field = 'slug'
     slug_url_kwarg = 'post_slug'
 
+    def get_validators(self):
+        """
+        Одним запросом: дата изменения поста, последнего комментария и счётчики реакций.
+        Версия комментариев ловит удаления, id пользователя - шапку и меню автора,
+        секрет CSRF - форму комментария: после входа он меняется, и старый токен даст 403.
+        Счётчик просмотров не учитывается, чтобы сброс буфера не сбрасывал ETag.
+        """
+        # GROUP BY только по выбранным полям и без ORDER BY от first(): slug уникален
+        self.state = next(iter(
+            Post.objects.filter(slug=self.kwargs[self.slug_url_kwarg])
+            .values('pk', 'updated_at', 'like_count', 'dislike_count', 'favorites_count', 'comments_count')
+            .annotate(last_comment_at=Max('comments__updated_at'))
+            .order_by()[:1]
+        ), None)
+        if self.state is None:
+            raise Http404('Пост не найден')
+        state = self.state
+        # get_token выдаёт секрет заранее, если куки ещё нет: он же уйдёт в ответ
+        get_token(self.request)
+        csrf_secret = self.request.META['CSRF_COOKIE']
+        last_modified = max(filter(None, [state['updated_at'], state['last_comment_at']]))
+        raw = '|'.join(map(str, [
+            state['pk'], state['updated_at'].isoformat(), state['last_comment_at'] and state['last_comment_at'].isoformat(),
+            state['like_count'], state['dislike_count'], state['favorites_count'], state['comments_count'],
+            get_version(comments_version_name(state['pk'])), self.request.user.pk,
+            hashlib.md5(csrf_secret.encode()).hexdigest(),
+        ]))
+        return '"%s"' % hashlib.md5(raw.encode()).hexdigest(), last_modified.timestamp()
+
+    def get(self, request, *args, **kwargs):
+        response = super().get(request, *args, **kwargs)
+        # Просмотр попадает в буфер и записывается в БД пачкой, без UPDATE на каждый запрос.
+        # Учитываем и ответы 304: страницу всё равно открыли
+        view_counter.record(Post(pk=self.state['pk']), request)
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
+    def get_queryset(self):
+        # Реакции читателя страница не содержит - кнопки заполняет post-state.js из PostStateView
+        return Post.objects.select_related('category', 'author').prefetch_related('tags')
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         post = self.object
         
-        # Получаем ВСЕ корневые комментарии отсортированные от старых к новым
-        all_root_comments = post.comments.filter(parent__isnull=True).order_by('created_at')
-        total_comments = post.comments.count()
-        
-        # Определяем, какие комментарии показывать
-        if all_root_comments.count() > 5:
-            # Показываем последние 5 комментариев (пропускаем старые)
-            start_index = all_root_comments.count() - 5
-            latest_comments = all_root_comments[start_index:]
-        else:
-            # Если комментариев 5 или меньше, показываем все
-            latest_comments = all_root_comments
-        
-        # Получаем комментарии с ответами
-        comments_with_replies = self.get_comments_with_replies(latest_comments)
-        
-        context['comments'] = comments_with_replies
-        context['total_comments'] = total_comments
-        context['has_older_comments'] = all_root_comments.count() > 5
-        context['loaded_comments_count'] = latest_comments.count()
-        context['older_comments_count'] = all_root_comments.count() - latest_comments.count()
+        # Блок комментариев берётся из кэша, запросы к комментариям - только при промахе
+        section = comment_section(post)
+        context['comment_section'] = section['html']
+        context['total_comments'] = post.comments_count
+        context['loaded_comments_count'] = section['loaded_comments_count']
+        context['older_comments_count'] = section['older_comments_count']
+        # Живые обновления (SSE) есть только под ASGI, см. blog/urls.py
+        context['live_events'] = settings.BLOG_ASYNC_VIEWS
         return context
-    
-    def get_comments_with_replies(self, comments):
-        """Рекурсивно получаем комментарии с ответами для шаблона"""
-        result = []
-        for comment in comments:
-            replies = self.get_comments_with_replies(comment.replies.all().order_by('created_at'))
-            result.append({
-                'comment': comment,
-                'replies': replies
-            })
-        return result
 
 # Создание поста
 class PostCreateView(LoginRequiredMixin, CreateView):
@@ -106,16 +261,8 @@ class PostCreateView(LoginRequiredMixin, CreateView):
     }
 
     def form_valid(self, form):
-        post = form.save(commit=False)
-        post.author = self.request.user
-        post.save()
-        tag_names = form.cleaned_data.get('tags_input', [])
-        for tag_name in tag_names:
-            tag, created = Tag.objects.get_or_create(
-                name=tag_name.lower(),
-                defaults={'name': tag_name.lower()}
-            )
-            post.tags.add(tag)
+        form.instance.author = self.request.user
+        post = form.save()
         return redirect('blog:post_detail', post_slug=post.slug)
 
 # Редактирование поста
@@ -129,16 +276,7 @@ class PostUpdateView(LoginRequiredMixin, UpdateView):
     }
 
     def form_valid(self, form):
-        post = form.save(commit=False)
-        post.save()
-        post.tags.clear()
-        tag_names = form.cleaned_data.get('tags_input', [])
-        for tag_name in tag_names:
-            tag, created = Tag.objects.get_or_create(
-                name=tag_name.lower(),
-                defaults={'name': tag_name.lower()}
-            )
-            post.tags.add(tag)
+        post = form.save()
         return redirect('blog:post_detail', post_slug=post.slug)
 
     def get_context_data(self, **kwargs):
@@ -158,72 +296,142 @@ class PostDeleteView(LoginRequiredMixin, DeleteView):
         return reverse('blog:main_page')
 
 # Главная страница
-class MainPageView(ListView):
+class MainPageView(AnonymousPageCacheMixin, CursorPaginationMixin, ListView):
     model = Post
     template_name = 'blog/main_page.html'
     context_object_name = 'posts'
     paginate_by = 9
 
+    search_limit = 200  # Максимум результатов поиска, отсортированных по релевантности
+
+    def is_search(self):
+        return bool(self.request.GET.get('q', '').strip())
+
+    def cursor_enabled(self):
+        # Результаты поиска упорядочены по релевантности, а курсор - по дате: их
+        # (не больше search_limit) листаем номерами страниц, без ленты
+        return not self.is_search()
+
     def get_queryset(self):
-        queryset = Post.objects.filter(status='published').order_by('-created_at')
+        queryset = Post.objects.published().cards().order_by('-created_at', '-id')
         query = self.request.GET.get('q')
         search_category = self.request.GET.get('search_category')
         search_tag = self.request.GET.get('search_tag')
+        self.search_hits = {}
         if query and query.strip():
             # Нормализуем запрос: удаляем лишние пробелы
             query = query.strip()
-            # Базовые условия поиска
-            search_conditions = Q()
-            # Если чекбоксы не отмечены, ищем только по заголовку и тексту
-            if not (search_category or search_tag):
-                search_conditions = Q(title__icontains=query) | Q(text__icontains=query)
-            else:
-                # Если отмечены чекбоксы, добавляем поиск по категориям и/или тегам
-                if search_category:
-                    search_conditions |= Q(category__name__icontains=query)
-                if search_tag:
-                    search_conditions |= Q(tags__name__icontains=query)
-            queryset = queryset.filter(search_conditions)
+            # Если чекбоксы не отмечены, ищем только по заголовку и тексту,
+            # иначе - по категориям и/или тегам
+            fields = []
+            if search_category:
+                fields.append('category')
             if search_tag:
-                queryset = queryset.distinct()
+                fields.append('tags')
+            hits = get_backend().search(query, fields=fields or ['text'], limit=self.search_limit)
+            if not hits:
+                return queryset.none()
+            self.search_hits = {hit.post_id: hit for hit in hits}
+            relevance = Case(
+                *[When(pk=hit.post_id, then=position) for position, hit in enumerate(hits)],
+                output_field=IntegerField(),
+            )
+            queryset = queryset.filter(pk__in=self.search_hits).order_by(relevance)
         return queryset
 
+    def attach_snippets(self, posts):
+        """Подставляет подсвеченные фрагменты найденного текста в карточки"""
+        if not self.search_hits:
+            return  # Без поиска не вычисляем queryset: карточки могут взяться из кэша
+        for post in posts:
+            hit = self.search_hits.get(post.pk)
+            if hit and hit.snippet:
+                post.search_snippet = highlight(hit.snippet)
+
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
+        self.attach_snippets(context['posts'])
         context['query'] = self.request.GET.get('q', '')
         context['search_category'] = self.request.GET.get('search_category', False)
         context['search_tag'] = self.request.GET.get('search_tag', False)
+        # Ссылки на страницы сохраняют параметры поиска
+        params = self.request.GET.copy()
+        params.pop('page', None)
+        params.pop(self.cursor_param, None)
+        context['page_url_prefix'] = f'?{params.urlencode()}&' if params else '?'
         return context
 
+# JSON-лента главной страницы для бесконечной прокрутки
+class MainPageFeedView(MainPageView):
+    def get(self, request, *args, **kwargs):
+        if not self.cursor_enabled():
+            return JsonResponse({'status': 'error', 'message': 'Результаты поиска листаются по страницам'},
+                                status=400)
+        try:
+            page = CursorPaginator(self.get_queryset(), self.paginate_by).page(request.GET.get('cursor'))
+        except InvalidCursor as e:
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+        self.attach_snippets(page)
+        html = ''.join(
+            render_to_string('blog/includes/main_page_card_include.html', {'post': post}, request=request)
+            for post in page
+        )
+        return JsonResponse({
+            'status': 'success',
+            'html': html,
+            'count': len(page),
+            'has_next': page.has_next(),
+            'next_cursor': page.next_cursor,
+        })
+
+# Личные отметки пользователя и текущие счётчики для общих для всех (кэшируемых) страниц
+class PostStateView(View):
+    max_ids = 100  # Больше карточек на одной странице не бывает
+
+    def get(self, request):
+        try:
+            post_ids = {int(post_id) for post_id in request.GET.get('ids', '').split(',') if post_id}
+        except ValueError:
+            return JsonResponse({'status': 'error', 'message': 'Некорректный список id'}, status=400)
+        if len(post_ids) > self.max_ids:
+            return JsonResponse({'status': 'error', 'message': f'Не больше {self.max_ids} постов за запрос'}, status=400)
+        user = request.user
+        states = Reaction.objects.user_states(user, post_ids) if user.is_authenticated and post_ids else {}
+        # Счётчики меняются чаще, чем сбрасывается кэш карточек, поэтому приходят отсюда
+        counters = {
+            values.pop('pk'): values
+            for values in Post.objects.filter(pk__in=post_ids).values('pk', *Post.COUNTER_FIELDS)
+        } if post_ids else {}
+        response = JsonResponse({
+            'status': 'success',
+            'user_id': user.pk,
+            'posts': {
+                post_id: {
+                    'liked': Reaction.LIKE in state,
+                    'disliked': Reaction.DISLIKE in state,
+                    'favorited': Reaction.FAVORITE in state,
+                    'viewed': VIEWED in state,
+                    **counters.get(post_id, {}),
+                }
+                for post_id, state in ((post_id, states.get(post_id, ())) for post_id in sorted(post_ids))
+            },
+        })
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
+
 class LikeDislikePostView(LoginRequiredMixin, View):
     def post(self, request, post_id):
         post = get_object_or_404(Post, id=post_id)
         user = request.user
         action = request.POST.get('action')
-        if action == 'like':
-            if user in post.liked_users.all():
-                post.liked_users.remove(user)  # Удаляем лайк
-                action_taken = 'unliked'
-            else:
-                post.liked_users.add(user)  # Добавляем лайк
-                post.disliked_users.remove(user)  # Удаляем дизлайк, если был
-                action_taken = 'liked'
-        elif action == 'dislike':
-            if user in post.disliked_users.all():
-                post.disliked_users.remove(user)  # Удаляем дизлайк
-                action_taken = 'undisliked'
-            else:
-                post.disliked_users.add(user)  # Добавляем дизлайк
-                post.liked_users.remove(user)  # Удаляем лайк, если был
-                action_taken = 'disliked'
-        else:
+        if action not in ('like', 'dislike'):
             return JsonResponse({'status': 'error', 'message': 'Invalid action'}, status=400)
-        post.save()
+        action_taken = toggle_reaction(post, user, action)
         return JsonResponse({
             'status': 'success',
             'action': action_taken,
-            'like_count': post.liked_users.count(),
-            'dislike_count': post.disliked_users.count(),
+            'like_count': post.like_count,
+            'dislike_count': post.dislike_count,
         })
 
 # Создание комментария (обновленный)
@@ -242,7 +450,7 @@ class CommentCreateView(LoginRequiredMixin, View):
             try:
                 parent_comment = Comment.objects.get(id=parent_id, post=post)
                 # Проверяем уровень вложенности перед созданием
-                if parent_comment.level >= 6:  # 6 потому что новый комментарий будет level + 1
+                if parent_comment.level >= COMMENT_MAX_LEVEL:  # новый комментарий будет level + 1
                     return JsonResponse({
                         'status': 'error', 
                         'message': 'Достигнут максимальный уровень вложенности комментариев (7)'
@@ -251,28 +459,15 @@ class CommentCreateView(LoginRequiredMixin, View):
                 return JsonResponse({'status': 'error', 'message': 'Родительский комментарий не найден'}, status=400)
         
         try:
-            comment = Comment.objects.create(
-                post=post,
-                author=request.user,
-                text=text,
-                parent=parent_comment
-            )
-            
-            # Получаем ответы для нового комментария
-            replies_data = self.get_replies_data(comment.replies.all(), request.user)
+            comment = create_comment(post, request.user, text, parent_comment)
             
+            # У нового комментария ещё нет ответов
             return JsonResponse({
                 'status': 'success',
                 'comment': {
-                    'id': comment.id,
-                    'text': comment.text,
-                    'author': comment.author.username,
-                    'created_at': comment.created_at.strftime('%d.%m.%Y %H:%M'),
-                    'is_edited': comment.is_edited,
-                    'is_author': True,
-                    'level': comment.level,
+                    **comment_data(comment, request.user),
                     'parent_id': parent_comment.id if parent_comment else None,
-                    'replies': replies_data
+                    'replies': [],
                 }
             })
         except ValueError as e:
@@ -280,22 +475,6 @@ class CommentCreateView(LoginRequiredMixin, View):
                 'status': 'error', 
                 'message': str(e)
             }, status=400)
-    
-    def get_replies_data(self, replies, user):
-        """Рекурсивно получаем данные ответов"""
-        result = []
-        for reply in replies.order_by('created_at'):
-            result.append({
-                'id': reply.id,
-                'text': reply.text,
-                'author': reply.author.username,
-                'created_at': reply.created_at.strftime('%d.%m.%Y %H:%M'),
-                'is_edited': reply.is_edited,
-                'is_author': user.is_authenticated and reply.author == user,
-                'level': reply.level,
-                'replies': self.get_replies_data(reply.replies.all(), user)
-            })
-        return result
 
 # Загрузка дополнительных комментариев (обновленный)
 class MoreCommentsView(View):
@@ -306,16 +485,16 @@ class MoreCommentsView(View):
             limit = 5
             
             # Получаем корневые комментарии отсортированные от старых к новым
-            all_root_comments = post.comments.filter(parent__isnull=True).order_by('created_at')
+            all_root_comments = post.comments.roots().select_related('author').order_by('created_at', 'id')
             
             # Загружаем старые комментарии (те, что идут до уже загруженных)
             # offset - это количество уже показанных комментариев (последние 5)
             # Значит старые комментарии начинаются с 0 до (all_count - 5)
             comments = all_root_comments[offset:offset + limit]
             
-            comments_data = self.get_comments_with_replies(comments, request.user)
+            comments_data = serialize_comment_tree(load_comment_tree(post, comments), request.user)
             
-            total_older_comments = all_root_comments.count() - 5  # Всего старых комментариев
+            total_older_comments = all_root_comments.count() - LATEST_ROOT_COMMENTS  # Всего старых комментариев
             has_more = (offset + limit) < total_older_comments
             
             return JsonResponse({
@@ -331,30 +510,11 @@ class MoreCommentsView(View):
                 'message': f'Пост с slug={post_slug} не найден'
             }, status=404)
         except Exception as e:
-            print(f"Error in MoreCommentsView: {str(e)}")
+            logger.exception('Ошибка при загрузке комментариев поста %s', post_slug)
             return JsonResponse({
                 'status': 'error',
                 'message': f'Ошибка при загрузке комментариев: {str(e)}'
             }, status=500)
-    
-    def get_comments_with_replies(self, comments, user):
-        """Рекурсивно получаем комментарии с ответами"""
-        result = []
-        for comment in comments:
-            author_username = comment.author.username if comment.author else "Deleted User"
-            comment_data = {
-                'id': comment.id,
-                'text': comment.text,
-                'author': author_username,
-                'created_at': comment.created_at.strftime('%d.%m.%Y %H:%M'),
-                'is_edited': comment.is_edited,
-                'is_author': user.is_authenticated and comment.author == user,
-                'can_quote': user.is_authenticated,
-                'level': comment.level,
-                'replies': self.get_comments_with_replies(comment.replies.all().order_by('created_at'), user)
-            }
-            result.append(comment_data)
-        return result
 
 # Редактирование комментария
 class CommentUpdateView(LoginRequiredMixin, View):
@@ -388,7 +548,8 @@ class CommentDeleteView(LoginRequiredMixin, View):
         comment = get_object_or_404(Comment, id=comment_id)
         if comment.author != request.user:
             return JsonResponse({'status': 'error', 'message': 'Вы не можете удалить этот комментарий'}, status=403)
-        comment.delete()
+        # Вместе с комментарием удаляются и ответы на него
+        delete_comment(comment)
         return JsonResponse({'status': 'success', 'comment_id': comment_id})
 
 # Переключение избранного для поста
@@ -398,17 +559,26 @@ class PostFavoriteToggleView(LoginRequiredMixin, View):
             return JsonResponse({'status': 'error', 'message': 'Требуется авторизация'}, status=401)
         post = get_object_or_404(Post, id=post_id)
         user = request.user
-        if user in post.favorites_users.all():
-            post.favorites_users.remove(user)
-            action_taken = 'removed'
-        else:
-            post.favorites_users.add(user)
-            action_taken = 'added'
-        post.save()
+        action_taken = toggle_favorite(post, user)
         return JsonResponse({
             'status': 'success',
             'action': action_taken,
-            'favorites_count': post.favorites_users.count(),
+            'favorites_count': post.favorites_count,
+        })
+
+# Пакет реакций: скрипты копят нажатия и присылают их одним запросом
+class ReactionBatchView(LoginRequiredMixin, View):
+    max_operations = 100
+
+    def post(self, request):
+        try:
+            operations = parse_reaction_operations(json.loads(request.body), self.max_operations)
+            results = apply_reactions(request.user, operations)
+        except ValueError as e:  # В том числе JSONDecodeError
+            return JsonResponse({'status': 'error', 'message': str(e)}, status=400)
+        return JsonResponse({
+            'status': 'success',
+            'posts': {post_id: reaction_state(kinds, counters) for post_id, (kinds, counters) in results.items()},
         })
 
 # Страница избранных постов пользователя
@@ -419,5 +589,10 @@ class FavoritePostsView(LoginRequiredMixin, ListView):
     paginate_by = 9  # Как на главной, для consistency
 
     def get_queryset(self):
-        return self.request.user.favorite_posts.filter(status='published').order_by('-created_at')
+        user = self.request.user
+        return (
+            # Сначала недавно добавленные: порядок отдаёт индекс reaction_user_recent
+            Post.objects.filter(reactions__user=user, reactions__kind=Reaction.FAVORITE)
+            .published().cards(user).order_by('-reactions__created_at', '-reactions__id')
+        )
 
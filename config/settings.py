@@ -10,6 +10,7 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -44,6 +45,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'blog.instrumentation.RequestInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -125,6 +127,16 @@ STATICFILES_DIRS = [BASE_DIR / 'static/']
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media/'
 
+# Загрузки хранятся под хэшем содержимого: без дублей, с вечным кэшем (blog/storage.py)
+STORAGES = {
+    'default': {
+        'BACKEND': 'blog.storage.ContentAddressedStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -135,4 +147,96 @@ LOGIN_REDIRECT_URL = 'users:profile'
 
 AUTHENTICATION_BACKENDS = [
     'users.auth_backend.EmailOrUsernameBackend',
-]
\ No newline at end of file
+]
+
+# Blog
+# Бэкенд полнотекстового поиска: None - выбрать автоматически (FTS5 на SQLite)
+BLOG_SEARCH_BACKEND = None
+
+# Буфер просмотров постов: сброс в БД по порогу или интервалу (секунды)
+BLOG_VIEW_COUNTER = {
+    'FLUSH_INTERVAL': 30,
+    'FLUSH_THRESHOLD': 500,
+    'DEDUP_TIMEOUT': 60 * 60 * 6,
+}
+
+# Кэш Django. На нём держатся версионные ключи (blog/cache.py), кэш страниц и
+# карточек, дедупликация просмотров и CacheBackend событий: при нескольких
+# процессах он должен быть общим, иначе сброс версии виден только одному воркеру.
+# BLOG_REDIS_URL включает Redis (нужен пакет redis), без него - LocMemCache одного процесса
+if os.environ.get('BLOG_REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['BLOG_REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+# Время жизни закэшированного блока комментариев поста (секунды)
+BLOG_COMMENTS_CACHE_TIMEOUT = 60 * 60
+
+# Кэш страниц списков для анонимных посетителей: время в кэше сервера
+# и max-age в Cache-Control для браузеров и прокси (секунды)
+BLOG_PAGE_CACHE_TIMEOUT = 60 * 10
+BLOG_PAGE_CACHE_MAX_AGE = 60
+
+# Уменьшенные копии изображений постов: ширины (px), форматы и пул фоновых потоков
+BLOG_IMAGE_VARIANTS = {
+    'WIDTHS': (160, 480, 960),
+    'FORMATS': ('webp', 'jpeg'),
+    'QUALITY': 80,
+    'WORKERS': 2,
+    'SYNC': False,
+}
+
+# Асинхронные JSON-эндпоинты (blog/async_views.py); config/asgi.py включает их по умолчанию
+BLOG_ASYNC_VIEWS = os.environ.get('BLOG_ASYNC_VIEWS') == '1'
+
+# Server-Sent Events страницы поста: бэкенд истории событий и параметры потока.
+# Поток работает только при BLOG_ASYNC_VIEWS (ASGI); под WSGI страница обходится без него
+# (для нескольких воркеров - 'blog.events.CacheBackend' с общим кэшем)
+BLOG_EVENTS = {
+    'BACKEND': 'blog.events.InProcessBackend',
+    'POLL_INTERVAL': 0.5,
+    'HEARTBEAT': 15,
+    'MAX_DURATION': 300,
+    'HISTORY': 100,
+}
+
+# Замеры SQL и времени ответа (blog/instrumentation.py): доля замеряемых запросов
+# (для отладки всех запросов - BLOG_INSTRUMENTATION_SAMPLE_RATE=1), пороги записи
+# в лог и заголовок Server-Timing
+BLOG_INSTRUMENTATION = {
+    'SAMPLE_RATE': float(os.environ.get('BLOG_INSTRUMENTATION_SAMPLE_RATE', '0.1')),
+    'SLOW_REQUEST_MS': 500,
+    'QUERY_COUNT_THRESHOLD': 50,
+    'DUPLICATE_THRESHOLD': 3,
+    'SERVER_TIMING': True,
+}
+
+# Метрики для Prometheus на /metrics (blog/metrics.py): каталог снимков процессов
+# (общий для всех воркеров, очищается при перезапуске) и токен. Без токена /metrics
+# отвечает только при DEBUG и адресам из INTERNAL_IPS
+BLOG_METRICS = {
+    'ENABLED': True,
+    'DIR': os.environ.get('BLOG_METRICS_DIR'),
+    'FLUSH_INTERVAL': 5,
+    'TOKEN': os.environ.get('BLOG_METRICS_TOKEN'),
+}
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {'class': 'logging.StreamHandler'},
+    },
+    'loggers': {
+        'blog': {'handlers': ['console'], 'level': 'INFO', 'propagate': False},
+    },
+}
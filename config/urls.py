@@ -15,15 +15,20 @@ Including another URLconf
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from . import settings
-from django.conf.urls.static import static
+from blog.media import MediaFileView
+from blog.metrics import MetricsView
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('users/', include('users.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     path('', include('blog.urls'))
 ]
 
-urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+# Загруженные файлы: immutable-кэш для имён-хэшей, ETag, Range
+urlpatterns += [
+    re_path(r'^%s(?P<path>.*)$' % settings.MEDIA_URL.lstrip('/'), MediaFileView.as_view(), name='media'),
+]
\ No newline at end of file
@@ -18,6 +18,16 @@ document.addEventListener('DOMContentLoaded', function() {
         return;
     }
 
+    // Текст комментариев приходит и от других читателей (SSE) - вставляем его только экранированным
+    function escapeHtml(value) {
+        return String(value)
+            .replace(/&/g, '&amp;')
+            .replace(/</g, '&lt;')
+            .replace(/>/g, '&gt;')
+            .replace(/"/g, '&quot;')
+            .replace(/'/g, '&#39;');
+    }
+
     // === Функция для создания HTML комментария ===
     function createCommentHTML(commentData, isReply = false) {
     let max_steps = 5;
@@ -28,7 +38,7 @@ document.addEventListener('DOMContentLoaded', function() {
     let indent = phase === 0 ? cycle_level * step : (cycle_length - cycle_level) * step;
 
     return `
-        <div class="comment mb-3" data-comment-id="${commentData.id}" data-text="${commentData.text.replace(/"/g, '&quot;')}" data-level="${commentData.level}" data-phase="${phase}">
+        <div class="comment mb-3" data-comment-id="${commentData.id}" data-text="${escapeHtml(commentData.text)}" data-level="${commentData.level}" data-phase="${phase}">
             <div class="d-flex">
                 <div class="comment-indent" style="width: ${indent}px;"></div>
                 
@@ -38,7 +48,7 @@ document.addEventListener('DOMContentLoaded', function() {
                     <div class="comment-card">
                         <div class="comment-header d-flex justify-content-between align-items-start mb-2">
                             <div class="d-flex align-items-center gap-2">
-                                <strong class="comment-author text-primary">${commentData.author}</strong>
+                                <strong class="comment-author text-primary">${escapeHtml(commentData.author)}</strong>
                                 <small class="text-muted">
                                     ${commentData.created_at}
                                     ${commentData.is_edited ? '<span class="text-warning" title="Отредактирован">✎</span>' : ''}
@@ -72,13 +82,13 @@ document.addEventListener('DOMContentLoaded', function() {
                         </div>
                         
                         <div class="comment-text mb-3">
-                            ${commentData.text.replace(/\n/g, '<br>')}
+                            ${escapeHtml(commentData.text).replace(/\n/g, '<br>')}
                         </div>
                         
                         <div class="comment-actions">
                             <button class="btn btn-sm btn-outline-primary reply-comment" 
                                     data-comment-id="${commentData.id}" 
-                                    data-author="${commentData.author}">
+                                    data-author="${escapeHtml(commentData.author)}">
                                 <i class="bi bi-reply me-1"></i>Ответить
                             </button>
                         </div>
@@ -95,6 +105,44 @@ document.addEventListener('DOMContentLoaded', function() {
     `;
 }
 
+    // === Вставка комментария в дерево (ответ - к родителю, корневой - в конец списка) ===
+    function insertComment(commentData) {
+        const existing = document.querySelector(`.comment[data-comment-id="${commentData.id}"]`);
+        if (existing) {
+            return existing;  // Уже добавлен: ответом на форму или событием SSE
+        }
+        const commentHtml = createCommentHTML(commentData);
+        if (commentData.parent_id) {
+            const parentComment = document.querySelector(`.comment[data-comment-id="${commentData.parent_id}"]`);
+            if (!parentComment) {
+                return null;  // Ветка ещё не загружена на страницу
+            }
+            const parentContent = parentComment.querySelector('.comment-content');
+            let repliesContainer = parentContent.querySelector('.replies');
+            if (!repliesContainer) {
+                repliesContainer = document.createElement('div');
+                repliesContainer.className = 'replies mt-3';
+                parentContent.appendChild(repliesContainer);
+            }
+            repliesContainer.insertAdjacentHTML('beforeend', commentHtml);
+        } else if (commentList) {
+            commentList.insertAdjacentHTML('beforeend', commentHtml);
+            
+            // Если комментариев стало больше 5, скрываем самый старый
+            const allComments = commentList.querySelectorAll('.comment');
+            if (allComments.length > 5) {
+                allComments[0].style.display = 'none';
+                updateOlderCommentsCount(1);
+            }
+        } else if (commentForm) {
+            const newCommentList = document.createElement('div');
+            newCommentList.id = 'comment-list';
+            newCommentList.innerHTML = commentHtml;
+            commentForm.parentElement.insertBefore(newCommentList, commentForm);
+        }
+        return document.querySelector(`.comment[data-comment-id="${commentData.id}"]`);
+    }
+
     // === Управление ветками комментариев ===
     function setupBranchManagement() {
         document.addEventListener('click', function(e) {
@@ -151,47 +199,10 @@ document.addEventListener('DOMContentLoaded', function() {
             })
             .then(data => {
                 if (data.status === 'success') {
-                    const commentHtml = createCommentHTML(data.comment);
-                    
-                    if (data.comment.parent_id) {
-                        // Находим родительский комментарий и добавляем ответ
-                        const parentComment = document.querySelector(`.comment[data-comment-id="${data.comment.parent_id}"]`);
-                        if (parentComment) {
-                            const parentContent = parentComment.querySelector('.comment-content');
-                            let repliesContainer = parentContent.querySelector('.replies');
-                            if (!repliesContainer) {
-                                repliesContainer = document.createElement('div');
-                                repliesContainer.className = 'replies mt-3';
-                                parentContent.appendChild(repliesContainer);
-                            }
-                            repliesContainer.insertAdjacentHTML('beforeend', commentHtml);
-                        }
-                    } else {
-                        // Новый корневой комментарий добавляем в конец списка
-                        if (commentList) {
-                            commentList.insertAdjacentHTML('beforeend', commentHtml);
-                            
-                            // Если комментариев стало больше 5, скрываем самый старый
-                            const allComments = commentList.querySelectorAll('.comment');
-                            if (allComments.length > 5) {
-                                // Скрываем самый первый комментарий (самый старый)
-                                allComments[0].style.display = 'none';
-                                
-                                // Обновляем счетчик оставшихся комментариев
-                                updateOlderCommentsCount(1);
-                            }
-                        } else {
-                            const newCommentList = document.createElement('div');
-                            newCommentList.id = 'comment-list';
-                            newCommentList.innerHTML = commentHtml;
-                            commentForm.parentElement.insertBefore(newCommentList, commentForm);
-                        }
-                        
+                    const newComment = insertComment(data.comment);
+                    if (newComment && !data.comment.parent_id) {
                         // Прокручиваем к новому комментарию
-                        const newComment = document.querySelector(`.comment[data-comment-id="${data.comment.id}"]`);
-                        if (newComment) {
-                            newComment.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
-                        }
+                        newComment.scrollIntoView({ behavior: 'smooth', block: 'nearest' });
                     }
                     
                     commentForm.reset();
@@ -224,6 +235,26 @@ document.addEventListener('DOMContentLoaded', function() {
         }
     }
 
+    // === Пользовательские элементы поверх кэшированного фрагмента комментариев ===
+    function applyUserOverlay(root) {
+        const section = document.querySelector('.comments-section');
+        const userId = section ? section.dataset.userId : '';
+        if (!userId) {
+            return;
+        }
+        root.querySelectorAll('.reply-comment.auth-only').forEach(button => {
+            button.classList.remove('d-none');
+        });
+        root.querySelectorAll(`.comment[data-author-id="${userId}"]`).forEach(comment => {
+            const actions = comment.querySelector('.comment-owner-actions');
+            if (actions) {
+                actions.classList.remove('d-none');
+            }
+        });
+    }
+
+    applyUserOverlay(document);
+
     // === Загрузка предыдущих комментариев ===
     let olderCommentsOffset = 0;
 
@@ -489,5 +520,56 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         }
     });
+
+    // === Живые обновления: комментарии и счётчики через Server-Sent Events ===
+    const eventsSection = document.querySelector('.comments-section');
+    const eventsUrl = eventsSection ? eventsSection.dataset.eventsUrl : null;
+    if (eventsUrl && window.EventSource) {
+        const currentUserId = eventsSection.dataset.userId;
+        const source = new EventSource(eventsUrl);
+
+        source.addEventListener('comment_created', function(e) {
+            const commentData = JSON.parse(e.data);
+            commentData.is_author = String(commentData.author_id) === currentUserId;
+            commentData.can_quote = Boolean(currentUserId);
+            insertComment(commentData);
+        });
+
+        source.addEventListener('comment_updated', function(e) {
+            const commentData = JSON.parse(e.data);
+            const commentDiv = document.querySelector(`.comment[data-comment-id="${commentData.id}"]`);
+            if (!commentDiv || commentDiv.querySelector('.edit-comment-form')) {
+                return;  // Не загружен или сейчас редактируется
+            }
+            commentDiv.setAttribute('data-text', commentData.text);
+            const textDiv = commentDiv.querySelector('.comment-text');
+            if (textDiv) {
+                textDiv.innerHTML = escapeHtml(commentData.text).replace(/\n/g, '<br>');
+            }
+        });
+
+        source.addEventListener('comment_deleted', function(e) {
+            const commentData = JSON.parse(e.data);
+            const commentDiv = document.querySelector(`.comment[data-comment-id="${commentData.id}"]`);
+            if (commentDiv) {
+                commentDiv.remove();
+            }
+        });
+
+        source.addEventListener('counters', function(e) {
+            const counters = JSON.parse(e.data);
+            const selectors = {
+                like_count: '.like-count',
+                dislike_count: '.dislike-count',
+                favorites_count: '.favorites-count',
+                comments_count: '.comments-count',
+            };
+            Object.entries(counters).forEach(([field, value]) => {
+                document.querySelectorAll(selectors[field] || '').forEach(element => {
+                    element.textContent = value;
+                });
+            });
+        });
+    }
 });
 
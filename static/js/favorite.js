@@ -1,68 +1,61 @@
 document.addEventListener('DOMContentLoaded', function() {
-    const favoriteButtons = document.querySelectorAll('.favorite-toggle');
-    console.log('Found favorite buttons:', favoriteButtons.length);
-    favoriteButtons.forEach(button => {
-        button.addEventListener('click', function() {
-            const postId = this.dataset.postId;
-            console.log('Post ID:', postId);
-            if (!postId) {
-                alert('Ошибка: ID поста не найден');
-                return;
-            }
-            const url = `/posts/${postId}/favorite/`; // Убрали /blog/
-            console.log('Requesting URL:', url);
-            fetch(url, {
-                method: 'POST',
-                headers: {
-                    'Content-Type': 'application/json',
-                    'X-CSRFToken': getCookie('csrftoken')
-                },
-                body: JSON.stringify({})
-            })
-            .then(response => {
-                console.log('Response status:', response.status);
-                if (!response.ok) {
-                    return response.text().then(text => {
-                        throw new Error(`HTTP error! status: ${response.status}, response: ${text}`);
-                    });
-                }
-                return response.json();
+    function setFavorite(button, favorited) {
+        button.dataset.active = favorited ? '1' : '0';
+        const icon = button.querySelector('i');
+        icon.classList.toggle('text-muted', !favorited);
+        icon.classList.toggle('bi-star', !favorited);
+        icon.classList.toggle('text-warning', favorited);
+        icon.classList.toggle('bi-star-fill', favorited);
+        const label = button.querySelector('.favorite-label');
+        if (label) {
+            label.textContent = favorited ? 'В избранном' : 'В избранное';
+        }
+    }
+
+    // Страницы общие для всех читателей: кнопки показываются и заполняются по PostState
+    function hydrate(root) {
+        if (!PostState.userId) {
+            return;
+        }
+        const buttons = [...root.querySelectorAll('.favorite-toggle:not([data-hydrated])')];
+        buttons.forEach(button => { button.dataset.hydrated = '1'; });
+        PostState.load(buttons.map(button => button.dataset.postId))
+            .then(posts => {
+                buttons.forEach(button => {
+                    setFavorite(button, Boolean(posts[button.dataset.postId]?.favorited));
+                    button.classList.remove('d-none');
+                });
             })
-            .then(data => {
-                console.log('Response data:', data);
-                if (data.status === 'success') {
-                    const icon = this.querySelector('i');
-                    if (data.action === 'added') {
-                        icon.classList.remove('text-muted', 'bi-star');
-                        icon.classList.add('text-warning', 'bi-star-fill');
-                    } else {
-                        icon.classList.remove('text-warning', 'bi-star-fill');
-                        icon.classList.add('text-muted', 'bi-star');
-                    }
-                } else {
-                    console.error('Server error:', data.message);
-                    alert('Ошибка: ' + data.message);
+            .catch(error => console.error('Ошибка загрузки избранного:', error));
+    }
+
+    hydrate(document);
+    document.addEventListener('posts:added', event => hydrate(event.detail.root));
+
+    // Делегирование: кнопки в подгруженных лентой карточках тоже работают
+    document.addEventListener('click', function(event) {
+        const button = event.target.closest('.favorite-toggle');
+        if (!button) {
+            return;
+        }
+        const postId = button.dataset.postId;
+        if (!postId) {
+            alert('Ошибка: ID поста не найден');
+            return;
+        }
+        // Звезда меняется сразу, запрос уходит пакетом вместе с другими нажатиями
+        const wasFavorited = button.dataset.active === '1';
+        setFavorite(button, !wasFavorited);
+        PostState.submit(postId, 'favorite', !wasFavorited)
+            .then(state => {
+                if (!PostState.hasPending(postId)) {
+                    setFavorite(button, state.favorited);
                 }
             })
             .catch(error => {
                 console.error('Fetch error:', error);
+                setFavorite(button, wasFavorited);
                 alert('Ошибка при добавлении в избранное: ' + error.message);
             });
-        });
     });
-
-    function getCookie(name) {
-        let cookieValue = null;
-        if (document.cookie && document.cookie !== '') {
-            const cookies = document.cookie.split(';');
-            for (let i = 0; i < cookies.length; i++) {
-                const cookie = cookies[i].trim();
-                if (cookie.substring(0, name.length + 1) === (name + '=')) {
-                    cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
-                    break;
-                }
-            }
-        }
-        return cookieValue;
-    }
-});
\ No newline at end of file
+});
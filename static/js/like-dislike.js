@@ -1,86 +1,67 @@
-function getCookie(name) {
-    let cookieValue = null;
-    if (document.cookie && document.cookie !== '') {
-        const cookies = document.cookie.split(';');
-        for (let i = 0; i < cookies.length; i++) {
-            const cookie = cookies[i].trim();
-            if (cookie.substring(0, name.length + 1) === (name + '=')) {
-                cookieValue = decodeURIComponent(cookie.substring(name.length + 1));
-                break;
-            }
-        }
-    }
-    return cookieValue;
-}
-
 document.addEventListener('DOMContentLoaded', function() {
     const likeButtons = document.querySelectorAll('.like-btn');
     const dislikeButtons = document.querySelectorAll('.dislike-btn');
-    const csrftoken = getCookie('csrftoken');
-    console.log('CSRF Token:', csrftoken);
 
-    function sendRequest(button, url, action) {
-        fetch(url, {
-            method: 'POST',
-            headers: {
-                'Content-Type': 'application/x-www-form-urlencoded',
-                'X-CSRFToken': csrftoken,
-            },
-            body: `action=${action}`
-        })
-        .then(response => {
-            if (!response.ok) {
-                throw new Error(`HTTP error! Status: ${response.status}`);
-            }
-            return response.json();
-        })
-        .then(data => {
-            if (data.status === 'success') {
-                // Находим обе кнопки в текущем card-footer
-                const cardFooter = button.closest('.card-footer');
-                const likeButton = cardFooter.querySelector('.like-btn');
-                const dislikeButton = cardFooter.querySelector('.dislike-btn');
-                const likeCount = likeButton.querySelector('.like-count');
-                const dislikeCount = dislikeButton.querySelector('.dislike-count');
-                
-                // Обновляем оба счетчика
-                if (likeCount) likeCount.textContent = data.like_count;
-                if (dislikeCount) dislikeCount.textContent = data.dislike_count;
+    // Отмечает выбранную реакцию: лайк и дизлайк взаимоисключающие
+    function setVote(cardFooter, liked, disliked) {
+        const likeButton = cardFooter.querySelector('.like-btn');
+        const dislikeButton = cardFooter.querySelector('.dislike-btn');
+        likeButton.classList.toggle('active', liked);
+        likeButton.querySelector('i').className = `bi bi-hand-thumbs-up${liked ? '-fill' : ''} me-1`;
+        dislikeButton.classList.toggle('active', disliked);
+        dislikeButton.querySelector('i').className = `bi bi-hand-thumbs-down${disliked ? '-fill' : ''} me-1`;
+    }
 
-                // Обновляем data-action для обеих кнопок
-                if (data.action === 'liked') {
-                    likeButton.setAttribute('data-action', 'unlike');
-                    dislikeButton.setAttribute('data-action', 'dislike');
-                } else if (data.action === 'unliked') {
-                    likeButton.setAttribute('data-action', 'like');
-                    dislikeButton.setAttribute('data-action', 'dislike');
-                } else if (data.action === 'disliked') {
-                    dislikeButton.setAttribute('data-action', 'undislike');
-                    likeButton.setAttribute('data-action', 'like');
-                } else if (data.action === 'undisliked') {
-                    dislikeButton.setAttribute('data-action', 'dislike');
-                    likeButton.setAttribute('data-action', 'like');
+    // Страница общая для всех читателей: голос пользователя приходит из PostState
+    if (window.PostState && PostState.userId && likeButtons.length) {
+        PostState.load([...likeButtons].map(button => button.dataset.postId))
+            .then(posts => {
+                likeButtons.forEach(likeButton => {
+                    const state = posts[likeButton.dataset.postId] || {};
+                    const cardFooter = likeButton.closest('.card-footer');
+                    setVote(cardFooter, Boolean(state.liked), Boolean(state.disliked));
+                    cardFooter.querySelectorAll('.like-btn, .dislike-btn').forEach(button => { button.disabled = false; });
+                });
+            })
+            .catch(error => console.error('Ошибка загрузки реакций:', error));
+    }
+
+    // Кнопка отмечается сразу, а запрос уходит пакетом через PostState
+    function vote(button, kind) {
+        const cardFooter = button.closest('.card-footer');
+        const likeButton = cardFooter.querySelector('.like-btn');
+        const dislikeButton = cardFooter.querySelector('.dislike-btn');
+        const active = !button.classList.contains('active');
+        if (kind === 'like') {
+            setVote(cardFooter, active, dislikeButton.classList.contains('active') && !active);
+        } else {
+            setVote(cardFooter, likeButton.classList.contains('active') && !active, active);
+        }
+        const postId = button.dataset.postId;
+        PostState.submit(postId, kind, active)
+            .then(state => {
+                // Обновляем оба счетчика
+                const likeCount = cardFooter.querySelector('.like-count');
+                const dislikeCount = cardFooter.querySelector('.dislike-count');
+                if (likeCount) likeCount.textContent = state.like_count;
+                if (dislikeCount) dislikeCount.textContent = state.dislike_count;
+                // Пока есть неотправленные нажатия, кнопки уже показывают более новое состояние
+                if (!PostState.hasPending(postId)) {
+                    setVote(cardFooter, state.liked, state.disliked);
                 }
-            } 
-        })
-        
+            })
+            .catch(error => console.error('Ошибка отправки реакции:', error));
     }
 
     likeButtons.forEach(button => {
         button.addEventListener('click', function() {
-            const url = this.getAttribute('data-url');
-            const action = this.getAttribute('data-action');
-            console.log('Sending request to:', url, 'with action:', action);
-            sendRequest(this, url, action);
+            vote(this, this.getAttribute('data-action'));
         });
     });
 
     dislikeButtons.forEach(button => {
         button.addEventListener('click', function() {
-            const url = this.getAttribute('data-url');
-            const action = this.getAttribute('data-action');
-            console.log('Sending request to:', url, 'with action:', action);
-            sendRequest(this, url, action);
+            vote(this, this.getAttribute('data-action'));
         });
     });
-});
\ No newline at end of file
+});
@@ -13,4 +13,56 @@ function toggleTags(postId) {
         const count = toggleButton.dataset.count;
         toggleButton.textContent = `+${count} ещё`;
     }
-}
\ No newline at end of file
+}
+
+// Бесконечная прокрутка главной страницы по курсору
+document.addEventListener('DOMContentLoaded', function() {
+    const sentinel = document.getElementById('feed-sentinel');
+    const grid = document.getElementById('post-grid');
+    if (!sentinel || !grid || !('IntersectionObserver' in window)) {
+        return;
+    }
+
+    // Пагинация больше не нужна - следующие посты подгружаются сами
+    document.querySelectorAll('nav[aria-label="Page navigation"]').forEach(nav => {
+        nav.closest('.row').style.display = 'none';
+    });
+
+    let loading = false;
+    const observer = new IntersectionObserver(entries => {
+        if (!entries[0].isIntersecting || loading) {
+            return;
+        }
+        const cursor = sentinel.dataset.nextCursor;
+        if (!cursor) {
+            observer.disconnect();
+            return;
+        }
+        loading = true;
+        const params = new URLSearchParams(window.location.search);
+        params.delete('page');
+        params.set('cursor', cursor);
+        fetch(`${sentinel.dataset.feedUrl}?${params.toString()}`)
+            .then(response => response.json())
+            .then(data => {
+                if (data.status !== 'success') {
+                    throw new Error(data.message);
+                }
+                grid.insertAdjacentHTML('beforeend', data.html);
+                // Личные отметки новых карточек заполняют post-state.js и favorite.js
+                document.dispatchEvent(new CustomEvent('posts:added', { detail: { root: grid } }));
+                sentinel.dataset.nextCursor = data.next_cursor || '';
+                if (!data.has_next) {
+                    observer.disconnect();
+                }
+            })
+            .catch(error => {
+                console.error('Ошибка загрузки ленты:', error);
+                observer.disconnect();
+            })
+            .finally(() => {
+                loading = false;
+            });
+    }, { rootMargin: '400px' });
+    observer.observe(sentinel);
+});
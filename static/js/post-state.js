@@ -0,0 +1,114 @@
+// Личные отметки читателя (лайк, дизлайк, избранное, просмотрено) и текущие счётчики
+// для страниц, HTML которых одинаков для всех и кэшируется. Состояние всех постов страницы
+// приходит одним запросом к PostStateView; одинаковые запросы скриптов не повторяются.
+// Изменения реакций отправляются пакетами в ReactionBatchView.
+window.PostState = (function() {
+    const userId = document.body.dataset.userId;
+    const url = document.body.dataset.postStateUrl;
+    const requests = new Map();
+
+    function load(postIds) {
+        const ids = [...new Set(postIds)].sort((a, b) => a - b).join(',');
+        if (!ids) {
+            return Promise.resolve({});
+        }
+        if (!requests.has(ids)) {
+            requests.set(ids, fetch(`${url}?ids=${ids}`, { credentials: 'same-origin' })
+                .then(response => response.json())
+                .then(data => {
+                    if (data.status !== 'success') {
+                        throw new Error(data.message);
+                    }
+                    return data.posts;
+                }));
+        }
+        return requests.get(ids);
+    }
+
+    // Счётчики карточек (и для гостей) и бейджи "Мой пост" и "Просмотрено"
+    function hydrateCards(root) {
+        const cards = [...root.querySelectorAll('.post-card:not([data-hydrated])')];
+        if (!cards.length) {
+            return;
+        }
+        cards.forEach(card => { card.dataset.hydrated = '1'; });
+        load(cards.map(card => card.dataset.postId))
+            .then(posts => {
+                cards.forEach(card => {
+                    const state = posts[card.dataset.postId] || {};
+                    const views = card.querySelector('.post-views-count');
+                    if (views && state.views_count !== undefined) {
+                        views.textContent = state.views_count;
+                    }
+                    if (!userId) {
+                        return;
+                    }
+                    const own = card.dataset.authorId === userId;
+                    card.querySelector('.post-own-badge')?.classList.toggle('d-none', !own);
+                    card.querySelector('.post-viewed-badge')?.classList.toggle('d-none', own || !state.viewed);
+                });
+            })
+            .catch(error => console.error('Ошибка загрузки состояния постов:', error));
+    }
+
+    function csrfToken() {
+        const cookie = document.cookie.split(';').map(part => part.trim()).find(part => part.startsWith('csrftoken='));
+        return cookie ? decodeURIComponent(cookie.substring('csrftoken='.length)) : '';
+    }
+
+    // Нажатия на реакции копятся BATCH_DELAY мс после последнего и уходят одним запросом.
+    // Для пары пост-вид остаётся только последнее нажатие: сервер сворачивает пакет так же
+    const batchUrl = document.body.dataset.reactionBatchUrl;
+    const BATCH_DELAY = 400;
+    let pending = new Map();
+    let timer = null;
+
+    function submit(postId, kind, active) {
+        return new Promise((resolve, reject) => {
+            const key = `${postId}:${kind}`;
+            const callbacks = pending.has(key) ? pending.get(key).callbacks : [];
+            pending.delete(key);  // Последнее нажатие встаёт в конец очереди
+            callbacks.push({ resolve, reject });
+            pending.set(key, { operation: { post_id: Number(postId), kind, active }, callbacks });
+            clearTimeout(timer);
+            timer = setTimeout(flush, BATCH_DELAY);
+        });
+    }
+
+    function hasPending(postId) {
+        return [...pending.values()].some(item => item.operation.post_id === Number(postId));
+    }
+
+    function flush(keepalive = false) {
+        clearTimeout(timer);
+        if (!pending.size) {
+            return;
+        }
+        const batch = [...pending.values()];
+        pending = new Map();
+        fetch(batchUrl, {
+            method: 'POST',
+            credentials: 'same-origin',
+            keepalive: keepalive,
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': csrfToken() },
+            body: JSON.stringify({ operations: batch.map(item => item.operation) }),
+        })
+            .then(response => response.json())
+            .then(data => {
+                if (data.status !== 'success') {
+                    throw new Error(data.message);
+                }
+                batch.forEach(item => item.callbacks.forEach(({ resolve }) => resolve(data.posts[item.operation.post_id])));
+            })
+            .catch(error => batch.forEach(item => item.callbacks.forEach(({ reject }) => reject(error))));
+    }
+
+    // Не теряем накопленные нажатия при уходе со страницы
+    window.addEventListener('pagehide', () => flush(true));
+
+    document.addEventListener('DOMContentLoaded', () => hydrateCards(document));
+    // Карточки, подгруженные лентой
+    document.addEventListener('posts:added', event => hydrateCards(event.detail.root));
+
+    return { userId, load, submit, hasPending };
+})();
@@ -1,33 +1,36 @@
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
-from django.db.models import Q
+from django.db.models import Q, Value
+from django.db.models.functions import Lower
+from django.db.models.lookups import Exact
 
 User = get_user_model()
 
 class EmailOrUsernameBackend(ModelBackend):
+    def get_login_candidates(self, login):
+        """
+        Пользователи с таким логином или email без учёта регистра. Условия записаны
+        как LOWER(поле) = LOWER(значение), чтобы использовать функциональные индексы
+        auth_user_username_lower и auth_user_email_lower (users/migrations/0001),
+        а не просматривать всю таблицу, как UPPER/LIKE от iexact.
+        """
+        value = Lower(Value(login))
+        return User.objects.filter(Q(Exact(Lower('username'), value)) | Q(Exact(Lower('email'), value)))
+
     def authenticate(self, request, username=None, password=None, **kwargs):
         # Добавляем проверку на пустое значение
         if username is None or password is None:
             return None
-            
-        try:
-            # Добавляем регистронезависимый поиск и нормализацию
-            user = User.objects.get(
-                Q(username__iexact=username) | Q(email__iexact=username)
-            )
-        except User.DoesNotExist:
-            # Логируем попытку входа для отладки (опционально)
+
+        # Один запрос по индексам; при дубликатах email берётся самый ранний пользователь
+        user = self.get_login_candidates(username).order_by('pk').first()
+        if user is None:
+            # Хешируем пароль и для несуществующего пользователя, чтобы время ответа не выдавало логины
             User().set_password(password)
             return None
-        except User.MultipleObjectsReturned:
-            # Обработка случая, если найдено несколько пользователей
-            # (может случиться при дубликатах email)
-            user = User.objects.filter(
-                Q(username__iexact=username) | Q(email__iexact=username)
-            ).first()
-            
+
         # Проверяем пароль и возможность аутентификации
-        if user and user.check_password(password) and self.user_can_authenticate(user):
+        if user.check_password(password) and self.user_can_authenticate(user):
             return user
-            
-        return None
\ No newline at end of file
+
+        return None
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.2 on 2026-10-18 15:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models.functions import Lower
+
+# Модель пользователя принадлежит django.contrib.auth, поэтому индексы для
+# EmailOrUsernameBackend создаются через schema_editor, а не через Meta.indexes
+LOGIN_INDEXES = [
+    models.Index(Lower('username'), name='auth_user_username_lower'),
+    models.Index(Lower('email'), name='auth_user_email_lower'),
+]
+
+
+def user_model(apps):
+    return apps.get_model(*settings.AUTH_USER_MODEL.split('.'))
+
+
+def add_login_indexes(apps, schema_editor):
+    for index in LOGIN_INDEXES:
+        schema_editor.add_index(user_model(apps), index)
+
+
+def remove_login_indexes(apps, schema_editor):
+    for index in LOGIN_INDEXES:
+        schema_editor.remove_index(user_model(apps), index)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RunPython(add_login_indexes, remove_login_indexes),
+    ]
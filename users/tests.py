@@ -1,3 +1,34 @@
+from django.contrib.auth import authenticate, get_user_model
+from django.db import connection
 from django.test import TestCase
 
-# Create your tests here.
+from .auth_backend import EmailOrUsernameBackend
+
+User = get_user_model()
+
+
+class EmailOrUsernameBackendTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user('Reader', email='Reader@Example.com', password='pass12345')
+
+    def test_login_by_username_or_email_in_any_case(self):
+        for login in ('reader', 'READER', 'reader@example.com', 'READER@EXAMPLE.COM'):
+            self.assertEqual(authenticate(username=login, password='pass12345'), self.user, login)
+        self.assertIsNone(authenticate(username='reader', password='wrong'))
+        self.assertIsNone(authenticate(username='nobody', password='pass12345'))
+
+    def test_duplicate_email_resolves_in_one_query(self):
+        User.objects.create_user('other', email='reader@example.com', password='pass12345')
+        with self.assertNumQueries(1):
+            user = EmailOrUsernameBackend().authenticate(None, username='Reader@example.com', password='pass12345')
+        self.assertEqual(user, self.user)
+
+    def test_lookup_uses_lower_indexes(self):
+        sql, params = EmailOrUsernameBackend().get_login_candidates('reader').query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' | '.join(row[-1] for row in cursor.fetchall())
+        self.assertIn('auth_user_username_lower', plan)
+        self.assertIn('auth_user_email_lower', plan)
+        self.assertNotIn('SCAN auth_user', plan)
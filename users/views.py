@@ -5,7 +5,7 @@ from django.contrib.auth.forms import UserCreationForm
 from django.conf import settings
 from django.views.generic import CreateView, DetailView, View
 from django.contrib.auth.views import LoginView
-from blog.models import Post
+from blog.models import AuthorStats, Post
 from django.core.paginator import Paginator
 
 User = get_user_model()
@@ -58,8 +58,12 @@ class UserProfileView(DetailView):
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        # Получаем посты пользователя
-        posts = Post.objects.filter(author=self.object).order_by('-created_at')
+        # Получаем посты пользователя: черновики видит только сам автор, фильтр в запросе,
+        # чтобы страницы пагинации были полными (индекс post_author_recent)
+        posts = Post.objects.filter(author=self.object)
+        if self.object != self.request.user:
+            posts = posts.published()
+        posts = posts.cards().order_by('-created_at', '-id')
         # Настраиваем пагинацию
         paginator = Paginator(posts, 6)  # 6 постов на страницу
         page_number = self.request.GET.get('page')
@@ -68,4 +72,6 @@ class UserProfileView(DetailView):
         context['posts'] = page_obj
         context['page_obj'] = page_obj
         context['is_paginated'] = page_obj.has_other_pages()
+        # Шапка профиля - из готовой строки статистики, без агрегатов по всем постам
+        context['stats'] = AuthorStats.objects.for_user(self.object)
         return context
\ No newline at end of file